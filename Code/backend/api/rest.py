@@ -1 +1,246 @@
-#Rest endpoints
\ No newline at end of file
+#Rest endpoints
+# backend/api/rest.py
+#
+# Batch transcription of uploaded recordings:
+#   POST   /jobs                  multipart "file" (+ ?model=&language=&word_timestamps=) -> 202 {"job_id", ...}
+#   GET    /jobs/{job_id}         status and progress
+#   GET    /jobs/{job_id}/segments?offset=&limit=   segments with absolute timestamps (the finished prefix while running)
+#   DELETE /jobs/{job_id}         cancel / forget
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import APIRouter, File, HTTPException, Query, Request, UploadFile
+
+from core.audio_processor import EnergyVAD, decode_file, split_on_silence
+from core.inference_executor import InferenceQueueFull
+from utils.logger import get_logger
+from utils.timer import timed
+
+log = get_logger("rest")
+
+SAMPLE_RATE = 16000
+# chunks of <= 30 s fit one Whisper window, so a BatchScheduler can batch them
+CHUNK_TARGET_SECONDS = float(os.getenv("REST_CHUNK_TARGET_SECONDS", "25"))
+CHUNK_MAX_SECONDS = float(os.getenv("REST_CHUNK_MAX_SECONDS", "30"))
+# chunks of one job in flight at once (0 = executor workers x batch size)
+MAX_PARALLEL_CHUNKS = int(os.getenv("REST_MAX_PARALLEL_CHUNKS", "0"))
+MAX_UPLOAD_MB = float(os.getenv("REST_MAX_UPLOAD_MB", "500"))
+JOB_TTL_SECONDS = float(os.getenv("REST_JOB_TTL_SECONDS", "3600"))  # finished jobs are forgotten after this
+# uploads are scaled to this RMS level before transcription; empty keeps their level
+NORMALIZE_DBFS = float(os.getenv("REST_NORMALIZE_DBFS")) if os.getenv("REST_NORMALIZE_DBFS") else None
+
+router = APIRouter(prefix="/jobs", tags=["batch transcription"])
+
+JOBS: Dict[str, "TranscriptionJob"] = {}
+
+
+class TranscriptionJob:
+    def __init__(self, job_id: str, filename: str, model: str, options: Dict[str, Any]):
+        self.job_id = job_id
+        self.filename = filename
+        self.model = model
+        self.options = options
+        self.status = "queued"  # queued -> decoding -> transcribing -> done | failed | cancelled
+        self.error: Optional[str] = None
+        self.duration: Optional[float] = None
+        self.chunks: List[tuple] = []
+        self.chunk_segments: List[Optional[List[dict]]] = []
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def chunks_done(self) -> int:
+        return sum(1 for s in self.chunk_segments if s is not None)
+
+    def done_prefix(self) -> List[dict]:
+        """Segments of the leading run of finished chunks, in order."""
+        segments = []
+        for chunk in self.chunk_segments:
+            if chunk is None:
+                break
+            segments += chunk
+        return segments
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else None
+        total = len(self.chunks)
+        return {
+            "job_id": self.job_id,
+            "filename": self.filename,
+            "model": self.model,
+            "status": self.status,
+            "error": self.error,
+            "duration": self.duration,
+            "chunks_total": total,
+            "chunks_done": self.chunks_done,
+            "progress": round(self.chunks_done / total, 4) if total else (1.0 if self.status == "done" else 0.0),
+            "elapsed": round(elapsed, 3) if elapsed is not None else None,
+            # processing time per second of audio; well below 1 when chunks run in parallel
+            "rtf": round(elapsed / self.duration, 4) if elapsed and self.duration else None,
+        }
+
+
+def _upload_suffix(filename: Optional[str]) -> str:
+    """The upload's extension (".wav", ".m4a", ...) if it looks like one, else ""."""
+    suffix = os.path.splitext(os.path.basename(filename or ""))[1].lower()
+    return suffix if re.fullmatch(r"\.[a-z0-9]{1,8}", suffix) else ""
+
+
+def _expire_jobs():
+    cutoff = time.time() - JOB_TTL_SECONDS
+    for job_id in [j for j, job in JOBS.items() if job.finished and job.finished < cutoff]:
+        del JOBS[job_id]
+
+
+def _offset_segments(segments: List[dict], offset: float) -> List[dict]:
+    out = []
+    for seg in segments:
+        seg = dict(seg, start=round(seg["start"] + offset, 3), end=round(seg["end"] + offset, 3))
+        if seg.get("words"):
+            seg["words"] = [dict(w, start=round(w["start"] + offset, 3), end=round(w["end"] + offset, 3))
+                            for w in seg["words"]]
+        out.append(seg)
+    return out
+
+
+async def _run_job(job: TranscriptionJob, path: str, executor):
+    job.started = time.time()
+    try:
+        job.status = "decoding"
+        with timed("rest_decode", job.job_id):
+            # WAV uploads are decoded with NumPy, everything else with ffmpeg
+            samples = await asyncio.to_thread(decode_file, path, SAMPLE_RATE, True, NORMALIZE_DBFS)
+        job.duration = round(len(samples) / SAMPLE_RATE, 3)
+        job.chunks = split_on_silence(samples, SAMPLE_RATE, CHUNK_TARGET_SECONDS, CHUNK_MAX_SECONDS)
+        job.chunk_segments = [None] * len(job.chunks)
+        job.status = "transcribing"
+
+        parallel = MAX_PARALLEL_CHUNKS or executor.workers * getattr(executor, "max_batch_size", 1)
+        slots = asyncio.Semaphore(max(1, parallel))
+
+        async def transcribe_chunk(i: int, start: int, end: int):
+            audio = samples[start:end]
+            if not EnergyVAD(SAMPLE_RATE).process(audio).any():
+                # nothing but silence: no model pass
+                job.chunk_segments[i] = []
+                return
+            async with slots:
+                # every chunk is its own "session" in the executor, so none replaces another
+                while True:
+                    try:
+                        segments, _ = await executor.submit(f"job:{job.job_id}:{i}", np.ascontiguousarray(audio),
+                                                            **job.options)
+                        break
+                    except InferenceQueueFull:
+                        # live sessions fill the queue: back off instead of failing the job
+                        await asyncio.sleep(0.5)
+            job.chunk_segments[i] = _offset_segments(segments, start / SAMPLE_RATE)
+
+        with timed("rest_transcribe", job.job_id):
+            await asyncio.gather(*[transcribe_chunk(i, s, e) for i, (s, e) in enumerate(job.chunks)])
+        job.status = "done"
+    except asyncio.CancelledError:
+        job.status = "cancelled"
+        raise
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+        log.warning("Job %s failed: %s", job.job_id, e)
+    finally:
+        job.finished = time.time()
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+        summary = job.summary()
+        log.info("Job %s %s: %.1fs audio, %d chunks, rtf=%s", job.job_id, job.status, job.duration or 0.0,
+                 len(job.chunks), summary["rtf"])
+
+
+@router.post("", status_code=202)
+async def submit_job(request: Request, file: UploadFile = File(...), model: Optional[str] = Query(None),
+                     language: Optional[str] = Query("en"), word_timestamps: bool = Query(False),
+                     beam_size: Optional[int] = Query(None)):
+    """Upload a recording; it is transcribed in the background. Poll GET /jobs/{job_id}."""
+    _expire_jobs()
+    state = request.app.state
+    model_size = model or state.default_model
+    if model_size not in state.allowed_models:
+        raise HTTPException(400, f"unknown model tier {model_size!r}, allowed: {', '.join(state.allowed_models)}")
+    try:
+        executor = await state.get_executor(model_size)
+    except Exception as e:
+        raise HTTPException(503, f"model load error: {e}")
+    if not executor.ready:
+        raise HTTPException(503, "model not loaded")
+
+    # stream the upload to disk, recordings can be large; the client's filename is only
+    # reported back, on disk it is "upload" plus its extension (a format hint for ffmpeg)
+    tmp_dir = tempfile.mkdtemp(prefix="stt-job-")
+    path = os.path.join(tmp_dir, "upload" + _upload_suffix(file.filename))
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while True:
+                block = await file.read(1 << 20)
+                if not block:
+                    break
+                size += len(block)
+                if size > MAX_UPLOAD_MB * 2**20:
+                    raise HTTPException(413, f"file larger than {MAX_UPLOAD_MB:g} MB")
+                await asyncio.to_thread(out.write, block)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # uploads are decoded like live finals, under the same load-dependent policy
+    options = state.get_policy(model_size).options("final", executor.queue_depth)
+    if beam_size:
+        options.update(beam_size=beam_size, best_of=beam_size)
+    options.update(language=language or None, vad_filter=False, word_timestamps=word_timestamps,
+                   condition_on_previous_text=True)
+    job = TranscriptionJob(uuid.uuid4().hex, file.filename or "upload", model_size, options)
+    JOBS[job.job_id] = job
+    job.task = asyncio.create_task(_run_job(job, path, executor))
+    log.info("Job %s queued: %s (%.1f MB, model %s)", job.job_id, job.filename, size / 2**20, model_size)
+    return job.summary()
+
+
+def _get_job(job_id: str) -> TranscriptionJob:
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(404, "unknown job")
+    return job
+
+
+@router.get("/{job_id}")
+async def job_status(job_id: str):
+    job = _get_job(job_id)
+    summary = job.summary()
+    if job.status == "done":
+        summary["text"] = "".join(seg["text"] for seg in job.done_prefix()).strip()
+    return summary
+
+
+@router.get("/{job_id}/segments")
+async def job_segments(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(1000, ge=1, le=10000)):
+    """Segments with timestamps in seconds from the start of the recording; while running, the finished prefix."""
+    job = _get_job(job_id)
+    segments = job.done_prefix()
+    return {"job_id": job_id, "status": job.status, "complete": job.status == "done",
+            "total": len(segments), "offset": offset, "segments": segments[offset:offset + limit]}
+
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str):
+    job = _get_job(job_id)
+    if job.task is not None and not job.task.done():
+        job.task.cancel()
+    JOBS.pop(job_id, None)
+    return {"job_id": job_id, "status": "cancelled" if job.status not in ("done", "failed") else job.status}
@@ -0,0 +1,345 @@
+#Offline benchmark: stream audio files through the WebSocket pipeline and measure speed/latency/accuracy
+# backend/benchmark.py
+#
+#   cd Code/backend
+#   python benchmark.py                                  # core/68s.wav + core/68s_test.wav, realtime and max speed
+#   python benchmark.py --model small.en --compute-type int8_float32 --beam-size 1 --chunk-seconds 0.5 \
+#       --output results/small-int8-b1.json
+#   python benchmark.py --preprocess --runs 5                 # WAV decoding: NumPy vs the ffmpeg subprocess
+#
+# Every file goes through the real server code (ffmpeg streaming decode -> ring buffer ->
+# VAD -> executor -> LocalAgreement transcript) via the /ws/transcribe endpoint, in-process.
+# A reference transcript for WER is read from --reference or from <audio file>.txt.
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FILES = [os.path.join(HERE, "core", "68s.wav"), os.path.join(HERE, "core", "68s_test.wav")]
+
+
+def _normalize(text: str) -> List[str]:
+    return re.sub(r"[^\w'\s]", " ", text.lower()).split()
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """(substitutions + deletions + insertions) / reference words, on lowercased words without punctuation."""
+    ref, hyp = _normalize(reference), _normalize(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    row = np.arange(len(hyp) + 1)
+    for i, r in enumerate(ref, 1):
+        prev, row = row, np.empty_like(row)
+        row[0] = i
+        for j, h in enumerate(hyp, 1):
+            row[j] = min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + (r != h))
+    return float(row[-1]) / len(ref)
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "max": None, "mean": None}
+    arr = np.asarray(values) * 1000.0
+    return {"p50": round(float(np.percentile(arr, 50)), 1), "p90": round(float(np.percentile(arr, 90)), 1),
+            "p99": round(float(np.percentile(arr, 99)), 1), "max": round(float(arr.max()), 1),
+            "mean": round(float(arr.mean()), 1)}
+
+def _peak_rss_mib() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return round(max(self_rss, children) / 2**20, 1)
+
+def _cpu_seconds() -> float:
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return sum(u.ru_utime + u.ru_stime for u in usage)
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def load_stream(path: str, container: str) -> Dict[str, Any]:
+    """
+    Bytes to send (the WAV as is, re-encoded to WebM/Opus like MediaRecorder, or the raw
+    PCM16 samples for protocol 2) and the audio duration.
+    """
+    with wave.open(path, "rb") as w:
+        duration = w.getnframes() / w.getframerate()
+    if container == "pcm":
+        with tempfile.NamedTemporaryFile(suffix=".raw") as out:
+            subprocess.run(["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", path, "-ac", "1", "-ar", "16000",
+                            "-f", "s16le", out.name], check=True)
+            data = open(out.name, "rb").read()
+    elif container == "wav":
+        with open(path, "rb") as f:
+            data = f.read()
+    else:
+        with tempfile.NamedTemporaryFile(suffix=".webm") as out:
+            subprocess.run(["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", path, "-ac", "1",
+                            "-c:a", "libopus", "-b:a", "32k", out.name], check=True)
+            data = open(out.name, "rb").read()
+    return {"data": data, "duration": duration}
+
+
+def wait_until_ready(client, poll_seconds: float = 0.2) -> bool:
+    """The model loads in the background after startup: poll /readyz until it is done; False if it failed."""
+    while True:
+        probe = client.get("/readyz")
+        if probe.status_code == 200:
+            return True
+        if probe.json().get("status") in ("failed", "stopped"):
+            return False
+        time.sleep(poll_seconds)
+
+
+def run_file(client, path: str, stream: Dict[str, Any], chunk_seconds: float, realtime: bool,
+             reference: Optional[str], session_id: str, protocol: int = 1) -> Dict[str, Any]:
+    data, duration = stream["data"], stream["duration"]
+    # chunks cover equal stretches of audio (byte offsets scaled by duration)
+    n_chunks = max(1, int(np.ceil(duration / chunk_seconds)))
+    bounds = [int(round(i * len(data) / n_chunks)) for i in range(n_chunks + 1)]
+    if protocol == 2:
+        # whole PCM16 samples per frame, each with its sequence number and sample position
+        bounds = [b - b % 2 for b in bounds]
+        frames = [struct.pack("<II", i, bounds[i] // 2) + data[bounds[i]:bounds[i + 1]] for i in range(n_chunks)]
+    else:
+        frames = [data[bounds[i]:bounds[i + 1]] for i in range(n_chunks)]
+    chunk_audio_end = [min(duration, (i + 1) * chunk_seconds) for i in range(n_chunks)]
+
+    messages = []  # (receive time, message)
+    send_times: List[float] = []
+    done = threading.Event()
+
+    with client.websocket_connect(f"/ws/transcribe?session_id={session_id}&protocol={protocol}") as ws:
+        def receive():
+            while True:
+                try:
+                    msg = json.loads(ws.receive_text())
+                except Exception:
+                    break
+                messages.append((time.perf_counter(), msg))
+                if msg.get("type") == "final" and msg.get("reason", "flush") == "flush":
+                    break
+            done.set()
+
+        receiver = threading.Thread(target=receive, daemon=True)
+        receiver.start()
+        cpu_start = _cpu_seconds()
+        started = time.perf_counter()
+        for i in range(n_chunks):
+            if realtime:
+                # a chunk can only be sent once its audio has been "spoken"
+                delay = started + chunk_audio_end[i] - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            send_times.append(time.perf_counter())
+            ws.send_bytes(frames[i])
+        flushed_at = time.perf_counter()
+        ws.send_text(json.dumps({"command": "flush"}))
+        done.wait(timeout=max(120.0, duration * 10))
+        finished = time.perf_counter()
+        try:
+            ws.send_text(json.dumps({"command": "end"}))
+        except Exception:
+            pass
+    # after the session closed, so the ffmpeg decoder has exited and its CPU time is counted
+    cpu_used = _cpu_seconds() - cpu_start
+
+    partials = [(t, m) for t, m in messages if m.get("type") == "partial"]
+    finals = [(t, m) for t, m in messages if m.get("type") == "final"]
+    errors = [m.get("error") for _, m in messages if m.get("type") == "error"]
+    # latency of a partial: from sending the chunk that completed its audio to receiving it
+    update_latencies = []
+    for t, m in partials:
+        end = m.get("end")
+        if end is None:
+            continue
+        i = next((k for k, e in enumerate(chunk_audio_end) if e >= end - 1e-3), n_chunks - 1)
+        update_latencies.append(max(0.0, t - send_times[i]))
+    flush_final = next((m for t, m in reversed(finals) if m.get("reason", "flush") == "flush"), None)
+    if protocol == 2:
+        # the transcript is every committed delta put together
+        hypothesis = "".join(m.get("commit", "") for _, m in messages).strip() if flush_final else ""
+    else:
+        hypothesis = (flush_final or {}).get("full_text", "")
+
+    result = {
+        "file": os.path.relpath(path, HERE),
+        "speed": "realtime" if realtime else "max",
+        "audio_seconds": round(duration, 3),
+        "chunks": n_chunks,
+        "uplink_bytes": sum(len(f) for f in frames),
+        "downlink_bytes": sum(len(json.dumps(m)) for _, m in messages),
+        "wall_seconds": round(finished - started, 3),
+        # wall clock per audio second; in realtime mode this is >= 1 by construction
+        "rtf": round((finished - started) / duration, 4),
+        # CPU time (this process + ffmpeg) per audio second: comparable across both modes
+        "cpu_rtf": round(cpu_used / duration, 4),
+        "first_partial_ms": round((partials[0][0] - started) * 1000.0, 1) if partials else None,
+        "partial_latency_ms": _percentiles(update_latencies),
+        "partials": len(partials),
+        "endpoint_finals": sum(1 for _, m in finals if m.get("reason") == "endpoint"),
+        "final_latency_ms": round((finals[-1][0] - flushed_at) * 1000.0, 1) if flush_final else None,
+        "peak_rss_mib": _peak_rss_mib(),
+        "wer": round(word_error_rate(reference, hypothesis), 4) if reference is not None else None,
+        "errors": errors[:5],
+        "transcript": hypothesis,
+    }
+    return result
+
+
+# sample layouts the preprocessing benchmark converts every input to
+PREPROCESS_LAYOUTS = [
+    ("s16-16k-mono", ["-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le"]),
+    ("s16-44k-stereo", ["-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le"]),
+    ("s24-48k-mono", ["-ac", "1", "-ar", "48000", "-c:a", "pcm_s24le"]),
+    ("f32-22k-mono", ["-ac", "1", "-ar", "22050", "-c:a", "pcm_f32le"]),
+    ("s16-8k-mono", ["-ac", "1", "-ar", "8000", "-c:a", "pcm_s16le"]),
+]
+
+def run_preprocess(files: List[str], runs: int) -> List[Dict[str, Any]]:
+    """Time load_wav() against decode_with_ffmpeg() on each file in each PREPROCESS_LAYOUTS layout."""
+    sys.path.insert(0, HERE)
+    from core.audio_processor import decode_with_ffmpeg, load_wav
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="stt-preprocess-") as tmp:
+        for path in files:
+            for layout, ffmpeg_args in PREPROCESS_LAYOUTS:
+                converted = os.path.join(tmp, f"{layout}.wav")
+                subprocess.run(["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", path, *ffmpeg_args, converted],
+                               check=True)
+                timings = {"numpy": [], "ffmpeg": []}
+                for _ in range(max(1, runs)):
+                    started = time.perf_counter()
+                    ours = load_wav(converted, dc_removal=False)
+                    timings["numpy"].append(time.perf_counter() - started)
+                    started = time.perf_counter()
+                    reference = decode_with_ffmpeg(converted)
+                    timings["ffmpeg"].append(time.perf_counter() - started)
+                n = min(len(ours), len(reference))
+                numpy_ms = float(np.median(timings["numpy"])) * 1000.0
+                ffmpeg_ms = float(np.median(timings["ffmpeg"])) * 1000.0
+                result = {
+                    "file": os.path.basename(path), "layout": layout, "seconds": round(n / 16000, 2),
+                    "numpy_ms": round(numpy_ms, 1), "ffmpeg_ms": round(ffmpeg_ms, 1),
+                    "speedup": round(ffmpeg_ms / numpy_ms, 2) if numpy_ms else None,
+                    "length_diff": len(ours) - len(reference),
+                    # small but not zero when resampled (different filters); ffmpeg also scales
+                    # stereo differently when it made the file, so the stereo layout is off by ~30%
+                    "rms_diff": float(np.sqrt(np.mean(np.square(ours[:n] - reference[:n])))) if n else None,
+                }
+                results.append(result)
+                print(f"{result['file']:<22} {layout:<16} numpy={result['numpy_ms']}ms ffmpeg={result['ffmpeg_ms']}ms "
+                      f"speedup={result['speedup']}x rms_diff={result['rms_diff']:.5f}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the streaming transcription pipeline.")
+    parser.add_argument("files", nargs="*", default=DEFAULT_FILES, help="16 kHz mono WAV files")
+    parser.add_argument("--model", default=os.getenv("MODEL_SIZE", "tiny.en"))
+    parser.add_argument("--compute-type", default=os.getenv("WHISPER_COMPUTE", "int8"))
+    parser.add_argument("--device", default=os.getenv("WHISPER_DEVICE", "cpu"))
+    parser.add_argument("--beam-size", type=int, default=int(os.getenv("BEAM_SIZE", "5")))
+    parser.add_argument("--chunk-seconds", type=float, default=1.0, help="audio per WebSocket frame (MediaRecorder timeslice)")
+    parser.add_argument("--speed", choices=["realtime", "max", "both"], default="both")
+    parser.add_argument("--container", choices=["wav", "webm", "pcm"], default="webm",
+                        help="send the WAV bytes as is, re-encoded to WebM/Opus like the browser, "
+                             "or as protocol 2 PCM16 frames (no server-side ffmpeg)")
+    parser.add_argument("--reference", help="reference transcript (single file runs), default <file>.txt")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--output", help="write the results as JSON here")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra server settings, e.g. --env INFERENCE_WORKERS=2 --env VAD_ENABLED=0")
+    parser.add_argument("--preprocess", action="store_true",
+                        help="only benchmark WAV decoding (NumPy vs ffmpeg subprocess), no model")
+    args = parser.parse_args(argv)
+
+    if args.preprocess:
+        report = {"commit": _git_commit(), "timestamp": int(time.time()),
+                  "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+                  "preprocess": run_preprocess(args.files, args.runs)}
+        if args.output:
+            os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"wrote {args.output}")
+        return report
+
+    # the server reads its settings at import time
+    os.environ.update(MODEL_SIZE=args.model, WHISPER_COMPUTE=args.compute_type, WHISPER_DEVICE=args.device,
+                      BEAM_SIZE=str(args.beam_size))
+    for item in args.env:
+        key, _, value = item.partition("=")
+        os.environ[key] = value
+    sys.path.insert(0, HERE)
+    from fastapi.testclient import TestClient
+    import main as server
+
+    speeds = [True, False] if args.speed == "both" else [args.speed == "realtime"]
+    results = []
+    with TestClient(server.app) as client:
+        # transcripts go nowhere: Redis is not part of what we measure
+        client.app.state.redis = None
+        if not wait_until_ready(client):
+            raise SystemExit("model failed to load, see the log above")
+        for path in args.files:
+            reference = None
+            ref_path = args.reference if args.reference and len(args.files) == 1 else os.path.splitext(path)[0] + ".txt"
+            if os.path.exists(ref_path):
+                with open(ref_path) as f:
+                    reference = f.read()
+            stream = load_stream(path, args.container)
+            for realtime in speeds:
+                for run in range(args.runs):
+                    result = run_file(client, path, stream, args.chunk_seconds, realtime, reference,
+                                      session_id=f"bench-{len(results)}",
+                                      protocol=2 if args.container == "pcm" else 1)
+                    result["run"] = run
+                    results.append(result)
+                    lat = result["partial_latency_ms"]
+                    print(f"{result['file']:<22} {result['speed']:<8} rtf={result['rtf']:.3f} cpu_rtf={result['cpu_rtf']:.3f} "
+                          f"first_partial={result['first_partial_ms']}ms partial_p50={lat['p50']}ms p90={lat['p90']}ms "
+                          f"final={result['final_latency_ms']}ms wer={result['wer']} rss={result['peak_rss_mib']}MiB")
+        inference = client.app.state.executor.stats()
+
+    report = {
+        "config": {
+            "model": args.model, "compute_type": args.compute_type, "device": args.device,
+            "beam_size": args.beam_size, "chunk_seconds": args.chunk_seconds, "container": args.container,
+            "inference_mode": server.INFERENCE_MODE, "inference_workers": server.INFERENCE_WORKERS,
+            "batch_size": server.INFERENCE_BATCH_SIZE, "vad": server.VAD_ENABLED, "env": args.env,
+        },
+        "commit": _git_commit(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "timestamp": int(time.time()),
+        "inference": inference,
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#Admission control: how many live sessions a model tier can keep up with
+# backend/core/admission.py
+#
+# Every session streams about one second of audio per second, and decoding it costs the tier
+# `rtf` seconds of inference per audio second (partials re-decode the uncommitted tail, so
+# this is well above the model's raw real-time factor). With `workers` jobs running in
+# parallel the tier keeps up with about workers * target_utilization / rtf sessions; past
+# that every session slows down at once, so new sessions wait for a slot or are turned away.
+# An overloaded tier decodes less than it is asked to (windows of a session are coalesced),
+# which makes its rtf look better than it is, so while the workers are busier than the
+# target no new session is taken whatever the estimate says.
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from core.inference_executor import InferenceExecutor
+from utils.logger import get_logger
+from utils.timer import REGISTRY
+
+log = get_logger("admission")
+
+ADMISSIONS = REGISTRY.counter("stt_admissions_total", "WebSocket sessions by admission outcome",
+                              labels=("model", "result"))
+
+
+class AdmissionRejected(Exception):
+    """The tier is at capacity; `retry_after` is a hint in whole seconds for when to try again."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class CapacityManager:
+    """
+    Admission control for one model tier.
+
+    The tier's real-time factor is measured over the last `rtf_window_seconds` from the
+    executor's busy time and `audio_seconds()` (audio received for the tier), sampled at
+    most every `sample_seconds` however often it is read, once at least `min_audio_seconds`
+    of audio were seen; until then only `max_sessions` (0: no
+    limit) and the executor's queue bound admission. A session is admitted while fewer
+    than `capacity` are active, the workers are not busier than `target_utilization` and
+    no more than `max_queue_depth` sessions are already waiting for a worker. Otherwise
+    admit() waits in line up to `queue_seconds` for a slot (at most `max_queued` sessions
+    wait) and then raises AdmissionRejected, whose retry-after hint comes from how long
+    sessions have been staying.
+    """
+
+    def __init__(self, model: str, get_executor: Callable[[], Optional[InferenceExecutor]],
+                 audio_seconds: Callable[[], float], target_utilization: float = 0.8, max_sessions: int = 0,
+                 max_queue_depth: int = 8, queue_seconds: float = 10.0, max_queued: int = 32,
+                 rtf_window_seconds: float = 60.0, min_audio_seconds: float = 30.0, retry_after: float = 5.0,
+                 poll_seconds: float = 0.5, sample_seconds: float = 1.0):
+        self.model = model
+        self.get_executor = get_executor
+        self.audio_seconds = audio_seconds
+        self.target_utilization = float(target_utilization)
+        self.max_sessions = int(max_sessions)
+        self.max_queue_depth = int(max_queue_depth)
+        self.queue_seconds = float(queue_seconds)
+        self.max_queued = int(max_queued)
+        self.rtf_window = float(rtf_window_seconds)
+        self.min_audio = float(min_audio_seconds)
+        self.retry_after = float(retry_after)
+        self.poll = poll_seconds
+        self.sample_interval = float(sample_seconds)
+        self.active = 0
+        self._waiting: Deque[object] = deque()
+        self._wakeup = asyncio.Event()
+        # (monotonic time, executor busy seconds, audio seconds), oldest first, sample_seconds apart
+        self._samples: Deque[Tuple[float, float, float]] = deque()
+        self._executor: Optional[InferenceExecutor] = None
+        self._session_seconds: Optional[float] = None  # smoothed time sessions stay connected
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0}
+
+    def measure(self) -> Tuple[Optional[float], Optional[float]]:
+        """
+        (rtf, utilization) over the recent window: inference seconds per audio second (None
+        until enough audio was seen) and the share of the workers' time spent decoding.
+        """
+        executor = self.get_executor()
+        if executor is None:
+            return None, None
+        if executor is not self._executor:
+            # a new executor (tier reloaded) counts its busy time from zero
+            self._executor = executor
+            self._samples.clear()
+        now, busy_now, audio_now = time.monotonic(), executor.busy_seconds, self.audio_seconds()
+        # reads come from admissions, gauges and stats polls; keeping one sample per interval
+        # stops the busier of them from weighting the window (and the deque from growing)
+        if not self._samples or now - self._samples[-1][0] >= self.sample_interval:
+            self._samples.append((now, busy_now, audio_now))
+        while len(self._samples) > 2 and self._samples[1][0] < now - self.rtf_window:
+            self._samples.popleft()
+        then, busy_then, audio_then = self._samples[0]
+        utilization = (busy_now - busy_then) / ((now - then) * executor.workers) if now > then else None
+        if audio_now - audio_then < self.min_audio:
+            return None, utilization
+        return (busy_now - busy_then) / (audio_now - audio_then), utilization
+
+    @property
+    def capacity(self) -> Optional[int]:
+        """Sessions the tier keeps up with in real time, None while unknown (no limit but max_sessions)."""
+        executor = self.get_executor()
+        rtf, utilization = self.measure()
+        if executor is None or rtf is None:
+            return self.max_sessions or None
+        capacity = max(1, int(executor.workers * self.target_utilization / max(rtf, 1e-6)))
+        if utilization is not None and utilization > self.target_utilization:
+            # saturated: the estimate is too optimistic, keep to the sessions there are
+            capacity = max(1, min(capacity, self.active))
+        return min(capacity, self.max_sessions) if self.max_sessions else capacity
+
+    def _has_room(self) -> bool:
+        if self.active == 0:
+            # whatever the estimate says, one session is always served
+            return True
+        executor = self.get_executor()
+        if executor is not None and executor.queue_depth > self.max_queue_depth:
+            return False
+        capacity = self.capacity
+        return capacity is None or self.active < capacity
+
+    async def admit(self, on_queued: Optional[Callable[[int, float], Awaitable[None]]] = None) -> float:
+        """
+        Take a session slot, waiting in line if the tier is full; returns the seconds waited.
+        `on_queued(position, max_wait)` is awaited once if the session has to wait.
+        Raises AdmissionRejected if no slot frees up in time or the line is full.
+        """
+        if not self._waiting and self._has_room():
+            self._admitted()
+            return 0.0
+        if self.queue_seconds <= 0 or len(self._waiting) >= self.max_queued:
+            self._reject()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        ticket = object()
+        self._waiting.append(ticket)
+        self._stats["queued"] += 1
+        ADMISSIONS.inc(model=self.model, result="queued")
+        try:
+            if on_queued is not None:
+                await on_queued(len(self._waiting), self.queue_seconds)
+            while True:
+                if self._waiting[0] is ticket and self._has_room():
+                    self._waiting.popleft()
+                    self._admitted()
+                    return loop.time() - started
+                remaining = started + self.queue_seconds - loop.time()
+                if remaining <= 0:
+                    self._reject()
+                self._wakeup.clear()
+                try:
+                    # the estimate moves with the load, so look again now and then
+                    await asyncio.wait_for(self._wakeup.wait(), min(self.poll, remaining))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+            # the next in line may fit now
+            self._wakeup.set()
+
+    def release(self, connected_seconds: float):
+        """A session admitted with admit() ended after `connected_seconds`."""
+        self.active = max(0, self.active - 1)
+        if self._session_seconds is None:
+            self._session_seconds = connected_seconds
+        else:
+            self._session_seconds += 0.2 * (connected_seconds - self._session_seconds)
+        self._wakeup.set()
+
+    def retry_after_hint(self) -> int:
+        """Seconds until a slot is likely free for one more session: one turnover per session already waiting."""
+        if self._session_seconds is None:
+            return int(math.ceil(self.retry_after))
+        capacity = max(1, self.capacity or self.active or 1)
+        hint = self._session_seconds / capacity * (len(self._waiting) + 1)
+        return int(min(60, max(1, math.ceil(hint))))
+
+    def _admitted(self):
+        self.active += 1
+        self._stats["admitted"] += 1
+        ADMISSIONS.inc(model=self.model, result="admitted")
+
+    def _reject(self):
+        self._stats["rejected"] += 1
+        ADMISSIONS.inc(model=self.model, result="rejected")
+        retry_after = self.retry_after_hint()
+        log.info("Tier %s at capacity (%d active, %d waiting), retry after %ds", self.model, self.active,
+                 len(self._waiting), retry_after)
+        raise AdmissionRejected(f"model tier {self.model} is at capacity", retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        rtf, utilization = self.measure()
+        return dict(self._stats, active=self.active, waiting=len(self._waiting), capacity=self.capacity,
+                    rtf=round(rtf, 3) if rtf is not None else None,
+                    utilization=round(utilization, 3) if utilization is not None else None,
+                    session_seconds=round(self._session_seconds, 1) if self._session_seconds is not None else None)
@@ -1,9 +1,23 @@
 #Spliting chunks, audio processing, convert audio types
 # backend/cores/audio_processor.py
+import asyncio
+import functools
+import math
+import struct
 import subprocess
 import tempfile
 import os
 from pathlib import Path
+from typing import NamedTuple, Optional, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.chunk_utils import frame_signal
+
+# Every MediaRecorder/WebM stream starts with an EBML header. Seeing it again on a
+# live decoder means the client started a new recording on the same socket.
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
 
 def webm_bytes_to_wav_file(webm_bytes: bytes, out_wav_path: str, sample_rate: int = 16000):
     with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as in_f:
@@ -27,22 +41,747 @@ def webm_bytes_to_wav_file(webm_bytes: bytes, out_wav_path: str, sample_rate: in
         except Exception:
             pass
 
-def combine_wavs(wav_paths, out_path):
-    # build file list for ffmpeg
-    with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".txt") as list_file:
-        for p in wav_paths:
-            list_file.write(f"file '{p}'\n")
-        list_file_path = list_file.name
 
-    try:
+def decode_file(path: str, sample_rate: int = 16000, dc_removal: bool = True,
+                target_dbfs: Optional[float] = None) -> np.ndarray:
+    """
+    Decode an audio/video file to mono float32 PCM at `sample_rate` (blocking). WAV files
+    are read with NumPy (load_wav); anything else, and WAV encodings load_wav does not
+    handle, goes through ffmpeg. Both paths end with the same DC removal / normalization.
+    """
+    with open(path, "rb") as f:
+        head = f.read(12)
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        try:
+            return load_wav(path, sample_rate, dc_removal=dc_removal, target_dbfs=target_dbfs)
+        except ValueError:
+            pass
+    samples = decode_with_ffmpeg(path, sample_rate).copy()
+    return condition(samples, dc_removal, target_dbfs)
+
+
+def decode_with_ffmpeg(path: str, sample_rate: int = 16000) -> np.ndarray:
+    """Decode any audio/video file ffmpeg understands to mono float32 PCM (blocking, read-only array)."""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", path,
+        "-vn", "-ac", "1", "-ar", str(sample_rate),
+        "-f", "f32le", "pipe:1",
+    ]
+    proc = subprocess.run(cmd, capture_output=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode the file: {proc.stderr.decode('utf-8', errors='replace').strip()}")
+    return np.frombuffer(proc.stdout, dtype=np.float32)
+
+
+# -- NumPy decoding of WAV / raw PCM, no ffmpeg process --------------------------------------
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class WavInfo(NamedTuple):
+    format_tag: int
+    channels: int
+    sample_rate: int
+    bits: int
+    data_offset: int
+    data_size: int
+
+
+def parse_wav_header(data) -> WavInfo:
+    """
+    Find the fmt and data chunks of a RIFF/WAVE file held in `data` (bytes-like). Raises
+    ValueError for anything that is not uncompressed PCM or IEEE float.
+    """
+    mv = memoryview(data)
+    if len(mv) < 12 or bytes(mv[:4]) != b"RIFF" or bytes(mv[8:12]) != b"WAVE":
+        raise ValueError("not a RIFF/WAVE file")
+    pos, fmt = 12, None
+    while pos + 8 <= len(mv):
+        chunk_id = bytes(mv[pos:pos + 4])
+        (size,) = struct.unpack_from("<I", mv, pos + 4)
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            tag, channels, rate, _, _, bits = struct.unpack_from("<HHIIHH", mv, body)
+            if tag == WAVE_FORMAT_EXTENSIBLE and size >= 40:
+                # the sub-format GUID starts with the actual format tag
+                (tag,) = struct.unpack_from("<H", mv, body + 24)
+            fmt = (tag, channels, rate, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            tag, channels, rate, bits = fmt
+            if tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+                raise ValueError(f"unsupported WAV format 0x{tag:04x}")
+            if (tag == WAVE_FORMAT_PCM and bits not in (8, 16, 24, 32)) or \
+                    (tag == WAVE_FORMAT_IEEE_FLOAT and bits not in (32, 64)):
+                raise ValueError(f"unsupported WAV sample size {bits} bits")
+            if channels < 1 or rate < 1:
+                raise ValueError("invalid WAV fmt chunk")
+            # streamed WAVs often carry a placeholder size
+            size = min(size, len(mv) - body)
+            return WavInfo(tag, channels, rate, bits, body, size)
+        pos = body + size + (size & 1)
+    raise ValueError("WAV file without a data chunk")
+
+
+def pcm_to_float32(raw, bits: int = 16, is_float: bool = False, channels: int = 1) -> np.ndarray:
+    """
+    Interleaved little-endian samples to mono float32 in [-1, 1). Conversion, downmix and
+    scaling happen in one pass over strided views of the raw buffer; mono float32 input
+    that lives in a writable buffer is used in place without copying.
+    """
+    width = bits // 8
+    raw = memoryview(raw).cast("B")
+    raw = raw[:len(raw) - len(raw) % (width * channels)]
+    if is_float:
+        samples = np.frombuffer(raw, dtype="<f4" if bits == 32 else "<f8")
+        if channels == 1 and samples.dtype == np.float32 and samples.flags.writeable:
+            return samples
+        return downmix(samples, channels)
+    if bits == 24:
+        # read 4 bytes every 3: the sample is in the low three, shifting up and back down
+        # drops the neighbour's byte and sign-extends
+        padded = bytes(raw) + b"\0"
+        ints = np.ndarray(len(raw) // 3, dtype="<i4", buffer=padded, strides=(3,))
+        ints = ints << 8
+        ints >>= 8
+    else:
+        ints = np.frombuffer(raw, dtype={8: np.uint8, 16: "<i2", 32: "<i4"}[bits])
+    mono = downmix(ints, channels)
+    if bits == 8:
+        # 8-bit WAV is unsigned
+        mono -= 128.0
+    mono *= 1.0 / float(1 << (bits - 1))
+    return mono
+
+
+def pcm16_to_float32(raw) -> np.ndarray:
+    return pcm_to_float32(raw, 16)
+
+
+def downmix(samples: np.ndarray, channels: int) -> np.ndarray:
+    """
+    Average interleaved channels into a new mono float32 array (a trailing partial frame is
+    dropped); accumulating strided channel views is much faster than a mean over axis 1.
+    """
+    mono = samples[0::channels][:len(samples) // channels].astype(np.float32)
+    for channel in range(1, channels):
+        mono += samples[channel::channels][:len(mono)]
+    if channels > 1:
+        mono *= 1.0 / channels
+    return mono
+
+
+@functools.lru_cache(maxsize=16)
+def _polyphase_filter(up: int, down: int, zero_crossings: int = 10, beta: float = 5.0):
+    """
+    Kaiser-windowed sinc low-pass for resampling by up/down (cutoff at the lower Nyquist,
+    gain `up`), split into `up` phases of `taps` coefficients, reversed for correlation.
+    """
+    rate = max(up, down)
+    half = zero_crossings * rate
+    n = np.arange(-half, half + 1, dtype=np.float64)
+    h = np.sinc(n / rate) * np.kaiser(2 * half + 1, beta) * (up / rate)
+    taps = -(-len(h) // up)
+    padded = np.zeros(taps * up)
+    padded[:len(h)] = h
+    phases = np.ascontiguousarray(padded.reshape(taps, up).T[:, ::-1], dtype=np.float32)
+    return phases, taps, half
+
+
+def resample_poly(samples: np.ndarray, up: int, down: int) -> np.ndarray:
+    """
+    Polyphase FIR resampling by the rational factor up/down, like scipy.signal.resample_poly.
+
+    Outputs n and n + up use the same filter phase and input positions `down` samples
+    apart, so each of the `up` phases is one matrix-vector product over a strided view of
+    the input: no upsampled intermediate, no gathered copies. With few phases (long
+    strided row sets) einsum is much faster than matmul; with many, matmul is.
+    """
+    g = math.gcd(up, down)
+    up, down = up // g, down // g
+    if up == down:
+        return samples
+    phases, taps, half = _polyphase_filter(up, down)
+    n_out = -(-len(samples) * up // down)
+    padded = np.zeros(len(samples) + 2 * taps + down, dtype=np.float32)
+    padded[taps:taps + len(samples)] = samples
+    windows = sliding_window_view(padded, taps)
+    out = np.empty(n_out, dtype=np.float32)
+    for first in range(min(up, n_out)):
+        m = first * down + half  # position in the (virtual) upsampled signal
+        phase = m % up
+        # newest input sample of the first output is (m - phase) // up; its window of
+        # `taps` samples ends there, shifted by the `taps` samples of front padding
+        start = (m - phase) // up + 1
+        count = len(range(first, n_out, up))
+        rows = windows[start:start + (count - 1) * down + 1:down]
+        out[first::up] = np.einsum("ij,j->i", rows, phases[phase]) if up <= 4 else rows @ phases[phase]
+    return out
+
+
+def resample(samples: np.ndarray, orig_rate: int, target_rate: int = 16000) -> np.ndarray:
+    if orig_rate == target_rate:
+        return samples
+    return resample_poly(samples, target_rate, orig_rate)
+
+
+def remove_dc(samples: np.ndarray) -> np.ndarray:
+    """Subtract the mean, in place."""
+    if len(samples):
+        samples -= np.float32(samples.mean(dtype=np.float64))
+    return samples
+
+
+def normalize_loudness(samples: np.ndarray, target_dbfs: float = -20.0, max_gain_db: float = 30.0,
+                       peak: float = 0.99) -> np.ndarray:
+    """
+    Scale to an RMS level of `target_dbfs`, in place. The gain is capped so silence is not
+    blown up (`max_gain_db`) and the loudest sample stays below `peak`.
+    """
+    if not len(samples):
+        return samples
+    rms = float(np.sqrt(np.mean(np.square(samples, dtype=np.float64))))
+    loudest = float(np.abs(samples).max())
+    if rms <= 0.0 or loudest <= 0.0:
+        return samples
+    gain = min(10.0 ** ((target_dbfs - 20.0 * math.log10(rms)) / 20.0), 10.0 ** (max_gain_db / 20.0), peak / loudest)
+    samples *= np.float32(gain)
+    return samples
+
+
+def condition(samples: np.ndarray, dc_removal: bool = True, target_dbfs: Optional[float] = None) -> np.ndarray:
+    """The last preprocessing steps, in place: DC removal and optional loudness normalization."""
+    if dc_removal:
+        remove_dc(samples)
+    if target_dbfs is not None:
+        normalize_loudness(samples, target_dbfs)
+    return samples
+
+
+def preprocess_pcm(raw, bits: int = 16, channels: int = 1, sample_rate: int = 16000, target_rate: int = 16000,
+                   is_float: bool = False, dc_removal: bool = True, target_dbfs: Optional[float] = None) -> np.ndarray:
+    """Interleaved PCM bytes of any common layout to mono float32 at `target_rate`."""
+    samples = pcm_to_float32(raw, bits, is_float, channels)
+    samples = resample(samples, sample_rate, target_rate)
+    if not samples.flags.writeable:
+        samples = samples.copy()
+    return condition(samples, dc_removal, target_dbfs)
+
+
+def load_wav(source: Union[str, bytes, bytearray], sample_rate: int = 16000, dc_removal: bool = True,
+             target_dbfs: Optional[float] = None) -> np.ndarray:
+    """
+    Read a PCM/float WAV file (path or bytes) into mono float32 at `sample_rate` without
+    ffmpeg. Raises ValueError for WAV encodings it does not handle.
+    """
+    if isinstance(source, str):
+        # a writable buffer lets float32 files be used in place
+        data = bytearray(os.path.getsize(source))
+        with open(source, "rb") as f:
+            f.readinto(data)
+    else:
+        data = source
+    info = parse_wav_header(data)
+    raw = memoryview(data)[info.data_offset:info.data_offset + info.data_size]
+    return preprocess_pcm(raw, info.bits, info.channels, info.sample_rate, sample_rate,
+                          is_float=info.format_tag == WAVE_FORMAT_IEEE_FLOAT, dc_removal=dc_removal,
+                          target_dbfs=target_dbfs)
+
+
+def split_on_silence(samples: np.ndarray, sample_rate: int = 16000, target_seconds: float = 25.0,
+                     max_seconds: float = 30.0, frame_ms: float = 30.0):
+    """
+    Cut a long recording into chunks of at most `max_seconds`, each cut placed at the
+    quietest point (energy smoothed over ~300 ms) between 60% of `target_seconds` and
+    `max_seconds` into the chunk, so cuts land in pauses rather than inside words.
+    Returns (start_sample, end_sample) pairs covering the whole input.
+    """
+    frame = int(sample_rate * frame_ms / 1000)
+    n_frames = len(samples) // frame
+    max_frames = int(max_seconds * 1000 / frame_ms)
+    if n_frames <= max_frames:
+        return [(0, len(samples))]
+    frames = frame_signal(samples, frame, frame)
+    energy = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    k = max(1, int(round(300 / frame_ms)))
+    smooth = np.convolve(energy, np.ones(k) / k, mode="same")
+    min_frames = max(1, int(0.6 * target_seconds * 1000 / frame_ms))
+    cuts = [0]
+    while n_frames - cuts[-1] > max_frames:
+        lo, hi = cuts[-1] + min_frames, cuts[-1] + max_frames
+        cuts.append(lo + int(np.argmin(smooth[lo:hi])))
+    bounds = [c * frame for c in cuts] + [len(samples)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+class StreamingDecoder:
+    """
+    Long-lived ffmpeg process for one session.
+
+    Container bytes (WebM/Opus from MediaRecorder, or anything ffmpeg can probe) are
+    written to ffmpeg's stdin as they arrive and mono float32 PCM at `sample_rate` is
+    read back from stdout. Only the first timeslice chunk of a MediaRecorder stream
+    carries the WebM header, so the chunks must go through one process in order
+    rather than being decoded one by one.
+    """
+
+    def __init__(self, sample_rate: int = 16000, input_format: Optional[str] = None):
+        self.sample_rate = sample_rate
+        self.input_format = input_format
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._stderr_reader: Optional[asyncio.Task] = None
+        self._pcm = bytearray()
+        self._data_ready = asyncio.Event()
+        self._stderr_tail = b""
+        self.bytes_fed = 0
+
+    def _command(self):
         cmd = [
-            "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-            "-f", "concat", "-safe", "0", "-i", list_file_path,
-            "-c", "copy", out_path
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            # keep probing/buffering minimal so PCM comes out as soon as a frame is in
+            "-fflags", "nobuffer", "-probesize", "32", "-analyzeduration", "0",
         ]
-        subprocess.run(cmd, check=True)
-    finally:
+        if self.input_format:
+            cmd += ["-f", self.input_format]
+        cmd += [
+            "-i", "pipe:0",
+            "-vn", "-ac", "1", "-ar", str(self.sample_rate),
+            "-f", "f32le", "-flush_packets", "1",
+            "pipe:1",
+        ]
+        return cmd
+
+    @property
+    def running(self) -> bool:
+        return self._proc is not None and self._proc.returncode is None
+
+    @property
+    def error(self) -> str:
+        return self._stderr_tail.decode("utf-8", errors="replace").strip()
+
+    async def start(self):
+        if self.running:
+            return
+        self._proc = await asyncio.create_subprocess_exec(
+            *self._command(),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        self.bytes_fed = 0
+        self._reader = asyncio.create_task(self._read_stdout(self._proc))
+        self._stderr_reader = asyncio.create_task(self._read_stderr(self._proc))
+
+    async def _read_stdout(self, proc):
+        while True:
+            chunk = await proc.stdout.read(65536)
+            if not chunk:
+                break
+            self._pcm += chunk
+            self._data_ready.set()
+        self._data_ready.set()
+
+    async def _read_stderr(self, proc):
+        while True:
+            chunk = await proc.stderr.read(4096)
+            if not chunk:
+                break
+            # keep only the tail, it is only used for error messages
+            self._stderr_tail = (self._stderr_tail + chunk)[-2048:]
+
+    async def feed(self, data: bytes):
+        """Write container bytes to the decoder, (re)starting ffmpeg as needed."""
+        if self.bytes_fed and data[:4] == EBML_MAGIC:
+            # new stream on the same session: finish the old one and keep its tail
+            await self._stop()
+        if not self.running:
+            await self.start()
+        try:
+            self._proc.stdin.write(data)
+            await self._proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise RuntimeError(f"ffmpeg decoder exited: {self.error or e}") from e
+        self.bytes_fed += len(data)
+
+    async def read(self, timeout: float = 0.0, settle: float = 0.02) -> np.ndarray:
+        """
+        Return all PCM decoded so far as a float32 array (possibly empty).
+        With `timeout` > 0, wait up to that long for ffmpeg to produce output; ffmpeg
+        writes a chunk's PCM in a few bursts, so keep collecting until stdout has been
+        quiet for `settle` seconds.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        wait = timeout if len(self._pcm) < 4 else settle
+        while self.running and wait > 0:
+            self._data_ready.clear()
+            try:
+                await asyncio.wait_for(self._data_ready.wait(), min(wait, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                break
+            wait = settle
+            if loop.time() >= deadline:
+                break
+        n = len(self._pcm) - (len(self._pcm) % 4)
+        if n == 0:
+            return np.zeros(0, dtype=np.float32)
+        samples = np.frombuffer(bytes(self._pcm[:n]), dtype=np.float32)
+        del self._pcm[:n]
+        return samples
+
+    async def _stop(self, timeout: float = 2.0):
+        proc = self._proc
+        if proc is None:
+            return
         try:
-            os.remove(list_file_path)
+            if proc.stdin and not proc.stdin.is_closing():
+                proc.stdin.close()
+            # let ffmpeg flush the last frames, then make sure it is gone
+            await asyncio.wait_for(proc.wait(), timeout)
+        except (asyncio.TimeoutError, ProcessLookupError):
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+            await proc.wait()
         except Exception:
             pass
+        for task in (self._reader, self._stderr_reader):
+            if task is not None:
+                try:
+                    await asyncio.wait_for(task, timeout)
+                except Exception:
+                    task.cancel()
+        self._proc = None
+        self._reader = None
+        self._stderr_reader = None
+
+    async def close(self, timeout: float = 2.0) -> np.ndarray:
+        """Close stdin, wait for ffmpeg to exit and return any remaining PCM."""
+        await self._stop(timeout)
+        return await self.read()
+
+
+# protocol v2 audio frame: little-endian uint32 sequence number, uint32 stream position of
+# the first sample (in samples at the session rate), then the payload
+FRAME_HEADER = struct.Struct("<II")
+FRAME_CODECS = ("pcm16", "opus")
+
+
+class FrameDecoder:
+    """
+    Turns protocol v2 frames into float32 PCM without a container or an ffmpeg process.
+
+    "pcm16" frames carry mono 16-bit samples at `sample_rate`; "opus" frames carry one raw
+    Opus packet each (needs the optional `opuslib` package). Frames are expected in order;
+    duplicates are dropped, overlapping audio is trimmed and lost frames become silence
+    (up to `max_gap_seconds`), so the samples returned line up with the client's clock.
+    After a longer gap `jump` is the stream position the returned samples start at (None
+    otherwise): the caller has to seek its buffers there before appending them.
+    """
+
+    def __init__(self, codec: str = "pcm16", sample_rate: int = 16000, max_gap_seconds: float = 2.0):
+        if codec not in FRAME_CODECS:
+            raise ValueError(f"unknown codec {codec!r}, expected one of {', '.join(FRAME_CODECS)}")
+        self.codec = codec
+        self.sample_rate = sample_rate
+        self.max_gap = int(max_gap_seconds * sample_rate)
+        self.last_seq = -1
+        self.position = 0  # stream position of the next sample we expect
+        self.jump: Optional[int] = None
+        self.stats = {"frames": 0, "bytes": 0, "duplicates": 0, "lost_samples": 0, "skipped_samples": 0}
+        self._opus = None
+        if codec == "opus":
+            try:
+                import opuslib
+            except ImportError as e:
+                raise RuntimeError("the opus codec needs the opuslib package (pip install opuslib)") from e
+            self._opus = opuslib.Decoder(sample_rate, 1)
+
+    def _payload_samples(self, payload: bytes) -> np.ndarray:
+        if self._opus is not None:
+            # 120 ms is the longest Opus packet
+            payload = self._opus.decode(payload, int(self.sample_rate * 0.12))
+        if len(payload) % 2:
+            raise ValueError("pcm16 payload has an odd number of bytes")
+        return pcm16_to_float32(payload)
+
+    def decode(self, frame: bytes) -> np.ndarray:
+        if len(frame) < FRAME_HEADER.size:
+            raise ValueError(f"frame shorter than its {FRAME_HEADER.size} byte header")
+        seq, position = FRAME_HEADER.unpack_from(frame)
+        self.jump = None
+        self.stats["frames"] += 1
+        self.stats["bytes"] += len(frame)
+        if seq <= self.last_seq:
+            self.stats["duplicates"] += 1
+            return np.zeros(0, dtype=np.float32)
+        self.last_seq = seq
+        samples = self._payload_samples(frame[FRAME_HEADER.size:])
+        gap = position - self.position
+        if gap < 0:
+            # overlaps audio we already have
+            samples = samples[-gap:]
+        elif 0 < gap <= self.max_gap:
+            self.stats["lost_samples"] += gap
+            samples = np.concatenate([np.zeros(gap, dtype=np.float32), samples])
+        elif gap > self.max_gap:
+            self.stats["skipped_samples"] += gap
+            self.position = self.jump = position
+        self.position += len(samples)
+        return samples
+
+
+class EnergyVAD:
+    """
+    Model-free voice activity detector for 16 kHz float32 PCM.
+
+    Audio is cut into `frame_ms` frames and every frame is classified in one vectorized
+    pass: speech if its energy is `threshold_db` above the tracked noise floor (and above
+    `min_energy_db`) and its spectrum is not flat like broadband noise. A hangover keeps
+    short gaps between words counted as speech. State carries across calls, so chunks of
+    any size can be fed as they arrive.
+
+    Endpointing: once speech has been seen, a pause of at least `endpoint_ms` (also one
+    inside a single chunk) sets `endpoint_sample`, the stream position (in samples since
+    the first call) where that pause starts. `speech_pending` tells whether there is
+    speech after the last endpoint, and `trailing_silence` how long the stream has been
+    quiet since.
+    """
+
+    def __init__(self, sample_rate: int = 16000, frame_ms: float = 30.0, threshold_db: float = 9.0,
+                 min_energy_db: float = -55.0, max_flatness: float = 0.35, hangover_ms: float = 240.0,
+                 endpoint_ms: float = 800.0):
+        self.sample_rate = sample_rate
+        self.frame_len = int(sample_rate * frame_ms / 1000)
+        self.endpoint_frames = max(1, int(np.ceil(endpoint_ms / frame_ms)))
+        self.threshold_db = threshold_db
+        self.min_energy_db = min_energy_db
+        self.max_flatness = max_flatness
+        self.hangover_frames = int(round(hangover_ms / frame_ms))
+        self.noise_floor_db = -70.0
+        self.trailing_silence = 0.0
+        self.speech_pending = False
+        self.endpoint_sample: Optional[int] = None
+        self._frames_seen = 0
+        self._silent_frames = 0  # silent frames since the last speech frame
+        self._remainder = np.zeros(0, dtype=np.float32)
+        self._hang = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Classify the complete frames in `samples` (plus leftovers from the previous call); returns one bool per frame."""
+        self.endpoint_sample = None
+        samples = np.concatenate([self._remainder, np.asarray(samples, dtype=np.float32)])
+        n_frames = samples.size // self.frame_len
+        self._remainder = samples[n_frames * self.frame_len:]
+        if n_frames == 0:
+            return np.zeros(0, dtype=bool)
+        frames = samples[:n_frames * self.frame_len].reshape(n_frames, self.frame_len)
+
+        energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+        power = np.abs(np.fft.rfft(frames * np.hanning(self.frame_len), axis=1)) ** 2 + 1e-12
+        # spectral flatness: ~1 for white noise, well below 1 for voiced speech
+        flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+
+        threshold = max(self.noise_floor_db + self.threshold_db, self.min_energy_db)
+        raw = (energy_db > threshold) & (flatness < self.max_flatness)
+
+        # hangover: a speech frame keeps the next hangover_frames marked as speech
+        speech = raw.copy()
+        if self.hangover_frames:
+            idx = np.flatnonzero(raw)
+            last = np.full(n_frames, -10 ** 9)
+            if idx.size:
+                last[idx] = idx
+                last = np.maximum.accumulate(last)
+            speech |= (np.arange(n_frames) - last) <= self.hangover_frames
+            if self._hang:
+                speech[:self._hang] = True
+            tail_gap = n_frames - 1 - last[-1]
+            self._hang = max(0, self.hangover_frames - tail_gap) if idx.size else max(0, self._hang - n_frames)
+
+        # noise floor: fast attack downwards, slow release upwards, from the quiet frames
+        quiet = np.percentile(energy_db, 10)
+        if quiet < self.noise_floor_db:
+            self.noise_floor_db = float(quiet)
+        else:
+            self.noise_floor_db += 0.05 * float(quiet - self.noise_floor_db)
+
+        # pauses: runs of silent frames between speech frames (the first run continues the
+        # silence left over from the previous chunk)
+        first = self._frames_seen
+        idx = np.flatnonzero(speech)
+        if idx.size:
+            gap_starts = np.concatenate([[first - self._silent_frames], first + idx[:-1] + 1])
+            gap_lens = np.concatenate([[idx[0] + self._silent_frames], np.diff(idx) - 1])
+            had_speech = np.ones(idx.size, dtype=bool)
+            had_speech[0] = self.speech_pending
+            long_gaps = np.flatnonzero((gap_lens >= self.endpoint_frames) & had_speech)
+            if long_gaps.size:
+                self.endpoint_sample = int(gap_starts[long_gaps[-1]]) * self.frame_len
+            self._silent_frames = n_frames - 1 - int(idx[-1])
+            if self._silent_frames >= self.endpoint_frames:
+                self.endpoint_sample = (first + int(idx[-1]) + 1) * self.frame_len
+                self.speech_pending = False
+            else:
+                self.speech_pending = True
+        else:
+            if self.speech_pending and self._silent_frames + n_frames >= self.endpoint_frames:
+                self.endpoint_sample = (first - self._silent_frames) * self.frame_len
+                self.speech_pending = False
+            self._silent_frames += n_frames
+        self._frames_seen += n_frames
+        self.trailing_silence = self._silent_frames * self.frame_len / self.sample_rate
+        return speech
+
+    def state(self) -> dict:
+        """Detector state as plain values, to continue the stream in another process (see restore)."""
+        return {"frames_seen": int(self._frames_seen), "silent_frames": int(self._silent_frames), "hang": int(self._hang),
+                "noise_floor_db": float(self.noise_floor_db), "speech_pending": bool(self.speech_pending),
+                "remainder": self._remainder.tolist()}
+
+    def restore(self, state: dict):
+        self._frames_seen = int(state["frames_seen"])
+        self._silent_frames = int(state["silent_frames"])
+        self._hang = int(state["hang"])
+        self.noise_floor_db = float(state["noise_floor_db"])
+        self.speech_pending = bool(state["speech_pending"])
+        self._remainder = np.asarray(state["remainder"], dtype=np.float32)
+        self.trailing_silence = self._silent_frames * self.frame_len / self.sample_rate
+        self.endpoint_sample = None
+
+    def reset_utterance(self):
+        """Call after an utterance was finalized some other way (e.g. an explicit flush)."""
+        self.speech_pending = False
+
+    def seek(self, sample: int):
+        """Continue at absolute position `sample` after audio that never arrived; it counts as silence, the utterance is over."""
+        frames_seen = int(sample) // self.frame_len
+        self._silent_frames += max(0, frames_seen - self._frames_seen)
+        self._frames_seen = frames_seen
+        self._remainder = np.zeros(int(sample) % self.frame_len, dtype=np.float32)
+        self._hang = 0
+        self.speech_pending = False
+        self.endpoint_sample = None
+        self.trailing_silence = self._silent_frames * self.frame_len / self.sample_rate
+
+
+HOP_LENGTH = 160  # Whisper's 10 ms feature hop at 16 kHz
+
+
+class LogMelCache:
+    """
+    Per-session Whisper log-mel frames, computed incrementally as PCM arrives.
+
+    Frame k is centred on stream sample k * hop_length, like the frames of a window that
+    starts on a hop boundary. append() runs one vectorized STFT over just the frames the
+    new samples complete (each needs n_fft // 2 samples of lookahead), so the cost per
+    chunk is O(new audio) however long the decoded windows are. Frames are stored as
+    log10 mel energies, before Whisper's dynamic-range clamp, which depends on the
+    loudest frame of the window; window() applies it and recomputes the couple of frames
+    at each edge that see FeatureExtractor's padding, so its result matches
+    model.feature_extractor(audio) for the same window.
+
+    Holds `capacity_seconds` of frames (stored twice, like PCMRingBuffer, so any run of
+    them is one slice). Stream positions are absolute samples, as in the session buffer.
+    """
+
+    def __init__(self, capacity_seconds: float, n_mels: int = 80, sample_rate: int = 16000, n_fft: int = 400,
+                 hop_length: int = HOP_LENGTH):
+        from faster_whisper.feature_extractor import FeatureExtractor
+
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+        self.mel_filters = FeatureExtractor.get_mel_filters(sample_rate, n_fft, n_mels=n_mels).astype(np.float32)
+        self._window = np.hanning(n_fft + 1)[:-1].astype(np.float32)
+        self.capacity = max(1, int(round(capacity_seconds * sample_rate / hop_length)) + 1)
+        self._frames = np.zeros((2 * self.capacity, n_mels), dtype=np.float32)
+        self.start_frame = self.end_frame = 0
+        self.seek(0)
+
+    def seek(self, sample: int):
+        """Drop all frames and continue with the stream at absolute position `sample`."""
+        half = self.n_fft // 2
+        self.end_frame = -(-(int(sample) + half) // self.hop_length)  # first frame with all its input ahead
+        self.start_frame = self.end_frame
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._tail_start = int(sample)  # absolute position of _tail[0]
+
+    def append(self, samples: np.ndarray):
+        """Feed the samples the session buffer just got; computes every frame they complete."""
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        if samples.size == 0:
+            return
+        tail = np.concatenate([self._tail, samples])
+        half, hop = self.n_fft // 2, self.hop_length
+        end_sample = self._tail_start + tail.size
+        last = (end_sample - half) // hop  # last frame with its input complete
+        if last >= self.end_frame:
+            offset = self.end_frame * hop - half - self._tail_start
+            count = last - self.end_frame + 1
+            frames = sliding_window_view(tail[offset:], self.n_fft)[::hop][:count]
+            self._store(self._log_mel(frames))
+        # keep what the next frame needs
+        keep = self.end_frame * hop - half - self._tail_start
+        self._tail = tail[keep:].copy()
+        self._tail_start += keep
+
+    def window(self, start_sample: int, audio: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Whisper features (n_mels, frames) for `audio`, the window starting at stream sample
+        `start_sample`, or None if the cache cannot provide them (unaligned start, frames
+        already overwritten, window too short); the model then computes them itself.
+        """
+        half, hop = self.n_fft // 2, self.hop_length
+        n = len(audio)
+        if start_sample % hop:
+            return None
+        first = -(-half // hop)  # frames before this one see the left padding
+        last = (n - half) // hop  # frames after this one see the right padding
+        base = start_sample // hop
+        if last < first or base + first < self.start_frame or base + last >= self.end_frame:
+            return None
+        audio = np.asarray(audio, dtype=np.float32)
+        # FeatureExtractor pads `hop` zeros at the end, then reflects n_fft // 2 samples on both sides
+        head = np.pad(audio[:(first - 1) * hop + half + 1], (half, 0), mode="reflect")
+        padded = np.concatenate([audio, np.zeros(hop, dtype=np.float32)])
+        tail = np.pad(padded[(last + 1) * hop - half:], (0, half), mode="reflect")
+        n_frames = n // hop + 1
+        i = (base + first) % self.capacity
+        log_spec = np.concatenate([
+            self._log_mel(sliding_window_view(head, self.n_fft)[::hop][:first]),
+            self._frames[i:i + last - first + 1],
+            self._log_mel(sliding_window_view(tail, self.n_fft)[::hop][:n_frames - last - 1]),
+        ]).T
+        log_spec = np.maximum(log_spec, log_spec.max() - 8.0)
+        return np.ascontiguousarray((log_spec + 4.0) / 4.0)
+
+    def _log_mel(self, frames: np.ndarray) -> np.ndarray:
+        """(n, n_fft) sample frames -> (n, n_mels) log10 mel energies, same arithmetic as FeatureExtractor."""
+        spectrum = np.fft.rfft(frames * self._window, axis=-1).astype(np.complex64)
+        mel = (np.abs(spectrum) ** 2) @ self.mel_filters.T
+        return np.log10(np.clip(mel, 1e-10, None))
+
+    def _store(self, rows: np.ndarray):
+        n = len(rows)
+        if n > self.capacity:
+            # only the newest `capacity` frames can be kept
+            self.end_frame += n - self.capacity
+            rows = rows[n - self.capacity:]
+            n = self.capacity
+        cap = self.capacity
+        i = self.end_frame % cap
+        k = min(n, cap - i)
+        self._frames[i:i + k] = rows[:k]
+        self._frames[i + cap:i + cap + k] = rows[:k]
+        if k < n:
+            self._frames[0:n - k] = rows[k:]
+            self._frames[cap:cap + n - k] = rows[k:]
+        self.end_frame += n
+        self.start_frame = max(self.start_frame, self.end_frame - cap)
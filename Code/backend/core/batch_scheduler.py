@@ -0,0 +1,165 @@
+#Cross-session batching on top of the inference executor
+# backend/core/batch_scheduler.py
+import asyncio
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from core import inference_executor
+from core.inference_executor import INFERENCE_SECONDS, InferenceExecutor, _Job, warmup_audio
+from core.stt_engine import batch_key, transcribe_batch
+from utils.timer import observe_stage
+
+MAX_BATCH_SECONDS = 30.0  # one Whisper encoder window
+
+
+def _worker_transcribe_batch(audios, options_list, features_list=None):
+    return transcribe_batch(inference_executor._worker_model, audios, options_list, features_list)
+
+
+class BatchScheduler(InferenceExecutor):
+    """
+    InferenceExecutor that merges pending windows from different sessions into one
+    batched encoder/decoder pass.
+
+    When a worker slot frees up, the scheduler takes the oldest pending window and then
+    waits up to `max_wait_ms` for more windows with compatible decoding options, until
+    `max_batch_size` is reached. A batch of one goes through the regular transcribe()
+    path, so a quiet server behaves exactly like the plain executor. Each job's future
+    gets its own segments back, so results are routed to the right session as before.
+    """
+
+    def __init__(self, *args, max_batch_size: int = 8, max_wait_ms: float = 20.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._batch_sizes = Counter()
+        self._batch_wait_total = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        batches = sum(self._batch_sizes.values())
+        jobs = sum(size * count for size, count in self._batch_sizes.items())
+        stats.update(
+            max_batch_size=self.max_batch_size,
+            max_wait_ms=self.max_wait * 1000.0,
+            batches=batches,
+            batched_jobs=jobs,
+            mean_batch_size=(jobs / batches) if batches else 0.0,
+            # how full batches are on average, relative to max_batch_size
+            batch_fill=(jobs / (batches * self.max_batch_size)) if batches else 0.0,
+            mean_batch_wait_ms=(self._batch_wait_total / batches * 1000.0) if batches else 0.0,
+            batch_size_histogram=dict(sorted(self._batch_sizes.items())),
+        )
+        return stats
+
+    @staticmethod
+    def _batchable(job: _Job) -> bool:
+        return len(job.audio) <= MAX_BATCH_SECONDS * 16000 and batch_key(job.options) is not None
+
+    async def _dispatch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            first = self._next_job()
+            while first is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                first = self._next_job()
+            # mark sessions running as soon as they are taken, so a window submitted while
+            # we collect cannot land in the same batch as its predecessor
+            self._running.add(first.session_id)
+            batch = [first]
+            started = loop.time()
+            if self._batchable(first):
+                key = batch_key(first.options)
+                accept = lambda job: self._batchable(job) and batch_key(job.options) == key
+                deadline = started + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    job = self._next_job(accept)
+                    if job is not None:
+                        self._running.add(job.session_id)
+                        batch.append(job)
+                        continue
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+            # awaiters may have gone away while we were collecting
+            for job in batch:
+                if job.future.done():
+                    self._running.discard(job.session_id)
+            batch = [job for job in batch if not job.future.done()]
+            if not batch:
+                self._slots.release()
+                self._wakeup.set()
+                continue
+            self._batch_sizes[len(batch)] += 1
+            self._batch_wait_total += loop.time() - started
+            self._slots_used += 1
+            asyncio.create_task(self._run_batch(batch))
+
+    def _call_batch(self, audios: List, options_list: List[dict], features_list: Optional[List] = None):
+        return transcribe_batch(self.model, audios, options_list, features_list)
+
+    async def _execute_batch(self, audios: List, options_list: List[dict], features_list: Optional[List] = None):
+        loop = asyncio.get_running_loop()
+        if self.mode == "thread":
+            return await loop.run_in_executor(self._pool, self._call_batch, audios, options_list, features_list)
+        return await loop.run_in_executor(self._pool, _worker_transcribe_batch, audios, options_list, features_list)
+
+    async def warm_up(self, seconds: float = 2.0, **options) -> float:
+        """Also runs one full batch, so the batched encoder path is warm too."""
+        await super().warm_up(seconds, **options)
+        started = time.perf_counter()
+        audios = [warmup_audio(seconds, seed=i) for i in range(self.max_batch_size)]
+        await self._execute_batch(audios, [options] * len(audios))
+        self.warmup_seconds += time.perf_counter() - started
+        return self.warmup_seconds
+
+    async def _run_batch(self, batch: List[_Job]):
+        if len(batch) == 1:
+            # _run() releases the slot and clears the running flag itself
+            await self._run(batch[0])
+            return
+        started = time.perf_counter()
+        for job in batch:
+            observe_stage("inference_queue", started - job.enqueued_at, job.session_id)
+        try:
+            # windows seen before are answered from the cache and leave the batch
+            done = set()
+            for job in batch:
+                if await self._from_cache(job):
+                    done.add(job)
+            for job in done:
+                self._running.discard(job.session_id)
+            batch = [job for job in batch if job not in done]
+            if not batch:
+                return
+            audios = [job.audio for job in batch]
+            options_list = [job.options for job in batch]
+            results = await self._execute_batch(audios, options_list, [job.features for job in batch])
+            elapsed = time.perf_counter() - started
+            INFERENCE_SECONDS.inc(elapsed)
+            self.busy_seconds += elapsed
+            for job, result in zip(batch, results):
+                observe_stage("inference", elapsed, job.session_id)
+                self._stats["completed"] += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+                await self._remember(job, result)
+        except Exception as e:
+            self._stats["failed"] += len(batch)
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(e)
+        finally:
+            for job in batch:
+                self._running.discard(job.session_id)
+            self._slots_used -= 1
+            self._slots.release()
+            self._wakeup.set()
@@ -0,0 +1,140 @@
+#Load-adaptive decoding parameters
+# backend/core/decoding_policy.py
+#
+# Partials are re-decoded every few hundred milliseconds and are replaced by the next one, so
+# they decode greedily; finals are what the user keeps and get beam search with temperature
+# fallback. When the tier falls behind (the inference queue grows or partials take longer
+# than the latency target) the policy steps down to cheaper levels, and steps back up once
+# the load is gone.
+import time
+from typing import Any, Dict, List, Optional
+
+from utils.logger import get_logger
+from utils.timer import REGISTRY
+
+log = get_logger("decoding_policy")
+
+# faster-whisper's default fallback schedule
+FALLBACK_TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+
+DECODING_LEVEL = REGISTRY.gauge("stt_decoding_level", "Current decoding level per model tier (0 = best quality)",
+                                labels=("model",))
+DECODING_LEVEL_CHANGES = REGISTRY.counter("stt_decoding_level_changes_total", "Decoding level changes by direction",
+                                          labels=("model", "direction", "reason"))
+DECODING_REQUESTS = REGISTRY.counter("stt_decoding_requests_total", "Windows decoded per level and kind",
+                                     labels=("model", "kind", "level", "beam_size"))
+PARTIAL_LATENCY_EWMA = REGISTRY.gauge("stt_partial_latency_ewma_seconds",
+                                      "Smoothed partial latency the decoding policy reacts to", labels=("model",))
+
+
+class DecodingLevel:
+    """Decoding options for partials and finals, and the share of the partial window to keep."""
+
+    def __init__(self, name: str, partial: Dict[str, Any], final: Dict[str, Any], window_scale: float = 1.0):
+        self.name = name
+        self.partial = partial
+        self.final = final
+        self.window_scale = window_scale
+
+    def describe(self) -> Dict[str, Any]:
+        return {"name": self.name, "partial": self.partial, "final": self.final, "window_scale": self.window_scale}
+
+
+def default_levels(beam_size: int = 5) -> List[DecodingLevel]:
+    """Best quality first; every level is cheaper than the one before."""
+    greedy = {"beam_size": 1, "best_of": 1, "temperature": 0.0}
+    return [
+        DecodingLevel("full", greedy, {"beam_size": beam_size, "best_of": beam_size, "temperature": FALLBACK_TEMPERATURES}),
+        DecodingLevel("reduced", greedy, {"beam_size": max(1, min(beam_size, 2)), "best_of": 2,
+                                          "temperature": (0.0, 0.4, 0.8)}),
+        DecodingLevel("greedy", greedy, {"beam_size": 1, "best_of": 1, "temperature": 0.0}, window_scale=0.75),
+        DecodingLevel("minimal", greedy, {"beam_size": 1, "best_of": 1, "temperature": 0.0}, window_scale=0.5),
+    ]
+
+
+class DecodingPolicy:
+    """
+    Chooses decoding options per request for one model tier.
+
+    options() is called before every submit with the tier's queue depth; observe_partial()
+    gets the latency the client saw for each partial. The policy steps down one level when
+    the smoothed partial latency exceeds `target_latency` or more than `max_queue_depth`
+    sessions are waiting, and back up when both are well below (`recover_ratio`), at most
+    once per `dwell_seconds` so it does not oscillate. With adaptive=False it stays at level 0.
+    """
+
+    def __init__(self, model: str, levels: Optional[List[DecodingLevel]] = None, target_latency: float = 1.0,
+                 max_queue_depth: int = 4, adaptive: bool = True, dwell_seconds: float = 3.0,
+                 recover_ratio: float = 0.5, smoothing: float = 0.2):
+        self.model = model
+        self.levels = levels or default_levels()
+        self.target_latency = float(target_latency)
+        self.max_queue_depth = int(max_queue_depth)
+        self.adaptive = adaptive
+        self.dwell = float(dwell_seconds)
+        self.recover_ratio = float(recover_ratio)
+        self.smoothing = float(smoothing)
+        self.level = 0
+        self.latency: Optional[float] = None
+        self._observed_at = 0.0
+        self._changed_at = time.monotonic()
+        self._changes = {"down": 0, "up": 0}
+        DECODING_LEVEL.set(0, model=model)
+
+    @property
+    def current(self) -> DecodingLevel:
+        return self.levels[self.level]
+
+    def observe_partial(self, seconds: float):
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += self.smoothing * (seconds - self.latency)
+        self._observed_at = time.monotonic()
+        PARTIAL_LATENCY_EWMA.set(self.latency, model=self.model)
+
+    def update(self, queue_depth: int = 0):
+        if not self.adaptive:
+            return
+        now = time.monotonic()
+        if self.latency is not None and now - self._observed_at > self.dwell:
+            # no partials for a while: the latency we saw says nothing about the load now
+            self.latency = None
+        if now - self._changed_at < self.dwell:
+            return
+        latency = self.latency or 0.0
+        if latency > self.target_latency or queue_depth > self.max_queue_depth:
+            if self.level < len(self.levels) - 1:
+                reason = "latency" if latency > self.target_latency else "queue"
+                self._set_level(self.level + 1, "down", reason, latency, queue_depth, now)
+        elif (latency < self.target_latency * self.recover_ratio
+              and queue_depth <= self.max_queue_depth * self.recover_ratio):
+            if self.level > 0:
+                self._set_level(self.level - 1, "up", "recovered", latency, queue_depth, now)
+
+    def _set_level(self, level: int, direction: str, reason: str, latency: float, queue_depth: int, now: float):
+        self.level = level
+        self._changed_at = now
+        self._changes[direction] += 1
+        DECODING_LEVEL.set(level, model=self.model)
+        DECODING_LEVEL_CHANGES.inc(model=self.model, direction=direction, reason=reason)
+        log.info("Decoding policy %s: level %d (%s), reason %s, partial latency %.3fs, queue %d",
+                 self.model, level, self.current.name, reason, latency, queue_depth)
+
+    def options(self, kind: str, queue_depth: int = 0) -> Dict[str, Any]:
+        """Decoding options for a "partial" or "final" window at the current load."""
+        self.update(queue_depth)
+        options = dict(self.current.partial if kind == "partial" else self.current.final)
+        DECODING_REQUESTS.inc(model=self.model, kind=kind, level=str(self.level), beam_size=str(options["beam_size"]))
+        return options
+
+    def window_seconds(self, max_seconds: float) -> float:
+        """How much uncommitted audio partials may re-decode at the current level."""
+        return max_seconds * self.current.window_scale
+
+    def stats(self) -> Dict[str, Any]:
+        return {"level": self.level, "name": self.current.name, "adaptive": self.adaptive,
+                "partial_latency": round(self.latency, 4) if self.latency is not None else None,
+                "target_latency": self.target_latency, "max_queue_depth": self.max_queue_depth,
+                "changes": dict(self._changes), "options": self.current.describe()}
+
@@ -0,0 +1,396 @@
+#Run Whisper inference off the asyncio event loop (thread or process pool)
+# backend/core/inference_executor.py
+import asyncio
+import math
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Container, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.stt_engine import feature_size, transcribe_pcm
+from utils.timer import REGISTRY, observe_stage
+
+
+# busy time of the model, against audio seconds ingested this gives the real-time factor
+INFERENCE_SECONDS = REGISTRY.counter("stt_inference_seconds_total", "Wall time spent running inference jobs")
+
+
+class InferenceQueueFull(RuntimeError):
+    """Raised by submit() when max_pending sessions are already waiting for the model."""
+
+
+class JobSuperseded(Exception):
+    """Raised to the awaiter of a pending window that was replaced by a newer one from the same session."""
+
+
+def warmup_audio(seconds: float, sample_rate: int = 16000, seed: int = 0) -> np.ndarray:
+    """Quiet noise with a voiced-like harmonic burst: enough for the encoder and a few decoder steps."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sample_rate)
+    t = np.arange(n, dtype=np.float32) / sample_rate
+    audio = 0.003 * rng.standard_normal(n).astype(np.float32)
+    burst = (t > seconds * 0.25) & (t < seconds * 0.75)
+    for harmonic in (1, 2, 3):
+        audio[burst] += (0.05 / harmonic) * np.sin(2 * np.pi * 140 * harmonic * t[burst])
+    return audio
+
+
+def _rounded(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+# --- process-pool side: every worker process loads its own model once ---
+_worker_model = None
+
+def _init_worker(loader: Callable, loader_args: tuple, loader_kwargs: dict):
+    global _worker_model
+    _worker_model = loader(*loader_args, **loader_kwargs)
+
+def _worker_ready() -> bool:
+    return _worker_model is not None
+
+def _worker_feature_size() -> Optional[int]:
+    return feature_size(_worker_model)
+
+def _worker_transcribe(audio: np.ndarray, options: dict, features: Optional[np.ndarray] = None):
+    return transcribe_pcm(_worker_model, audio, features, **options)
+
+
+class _Job:
+    __slots__ = ("session_id", "audio", "options", "future", "enqueued_at", "cache_key", "features")
+
+    def __init__(self, session_id, audio, options, future, cache_key=None, features=None):
+        self.session_id = session_id
+        self.audio = audio
+        self.options = options
+        self.features = features
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.cache_key = cache_key
+
+
+class DeficitRoundRobin:
+    """
+    Deficit round-robin over sessions, charging every window its length in audio seconds.
+
+    Sessions with pending work are visited in a fixed cyclic order; each visit adds
+    `quantum` seconds to the session's deficit, and its window runs once the deficit
+    covers the window. A session decoding 20 s windows therefore gets a tenth of the turns
+    of one decoding 2 s windows, and over time every backlogged session gets the same
+    audio seconds of inference. A session with nothing pending leaves the rotation and
+    loses its deficit; it rejoins at the end.
+    """
+
+    def __init__(self, quantum: float = 2.0):
+        self.quantum = max(1e-3, float(quantum))
+        self._deficit: "OrderedDict[str, float]" = OrderedDict()  # rotation order, next visit first
+
+    def __len__(self) -> int:
+        return len(self._deficit)
+
+    def pick(self, candidates: List[Tuple[str, float]], backlogged: Container[str]) -> Optional[str]:
+        """
+        The session to run next among `candidates` ((session_id, window seconds) that could
+        start now), or None if there are none. `backlogged` holds every session with pending work.
+        """
+        for session_id in [s for s in self._deficit if s not in backlogged]:
+            del self._deficit[session_id]
+        if not candidates:
+            return None
+        cost = dict(candidates)
+        for session_id in cost:
+            self._deficit.setdefault(session_id, 0.0)
+        order = [s for s in self._deficit if s in cost]
+        # rather than stepping through rounds: visits each candidate needs until its deficit covers its window
+        need = {s: max(0, math.ceil((cost[s] - self._deficit[s]) / self.quantum - 1e-9)) for s in order}
+        rounds = min(need.values())
+        chosen = next(s for s in order if need[s] == rounds)
+        # in the last round the candidates before the chosen one were visited, those after it not yet
+        visits = rounds
+        for s in order:
+            if s == chosen:
+                self._deficit[s] += rounds * self.quantum - cost[s]
+                visits = max(rounds - 1, 0)
+            else:
+                self._deficit[s] += visits * self.quantum
+        # the next round starts after the chosen session
+        for s in list(self._deficit):
+            self._deficit.move_to_end(s)
+            if s == chosen:
+                break
+        return chosen
+
+
+class InferenceExecutor:
+    """
+    Owns the faster-whisper model and runs transcribe() jobs in a thread or process pool.
+
+    - mode="thread": one model shared by `workers` threads (load it with num_workers=workers
+      so CTranslate2 actually runs them in parallel).
+    - mode="process": every worker process loads its own copy of the model, sidestepping the GIL
+      for the Python parts of decoding at the cost of memory.
+
+    Jobs are keyed by session. Each session has at most one pending and one running job:
+    submitting a new window while an older one is still pending replaces it (the old
+    awaiter gets JobSuperseded), so a lagging session coalesces its work instead of
+    queuing stale decodes. Jobs of one session never run concurrently, so results come
+    back in order.
+
+    `model_release`, if given, is called with the model on shutdown (thread mode), e.g.
+    to hand a pooled model back to models.load_whisper.
+
+    With a `result_cache` (core.result_cache.ResultCache), a window that was transcribed
+    before with the same options is answered from the cache: right away in submit() if the
+    session has nothing queued or running (so results still come back in order), else
+    when its turn comes, without running the model. `cache_namespace` tells models apart
+    in the cache key (default: the loader arguments).
+
+    start() records how long loading took in `load_seconds`; warm_up() runs a synthetic
+    decode on every worker before real traffic arrives and records `warmup_seconds`.
+
+    With `fair_quantum` (audio seconds) the next job is picked by DeficitRoundRobin, so
+    sessions share the model by audio seconds decoded rather than by arrival order;
+    without it the session that has been waiting longest goes first. `busy_seconds`
+    totals the wall time jobs took.
+
+    `feature_size` is the number of mel bins of the loaded model once started, or None if
+    jobs run elsewhere; only then is it worth passing a window's precomputed log-mel
+    features to submit(), which the model then uses instead of extracting them again.
+    """
+
+    def __init__(self, model_loader: Callable, loader_args: tuple = (), loader_kwargs: Optional[dict] = None,
+                 mode: str = "thread", workers: int = 1, max_pending: int = 64,
+                 model_release: Optional[Callable] = None, result_cache=None, cache_namespace: Optional[str] = None,
+                 fair_quantum: Optional[float] = None):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"unknown inference mode: {mode}")
+        self.model_loader = model_loader
+        self.loader_args = tuple(loader_args)
+        self.loader_kwargs = dict(loader_kwargs or {})
+        self.model_release = model_release
+        self.result_cache = result_cache
+        self.cache_namespace = cache_namespace if cache_namespace is not None else "/".join(map(str, self.loader_args))
+        self.mode = mode
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.model = None
+        self.ready = False
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.feature_size: Optional[int] = None
+        self.busy_seconds = 0.0
+        self._fair = DeficitRoundRobin(fair_quantum) if fair_quantum else None
+        self._pool: Optional[Executor] = None
+        self._pending: "OrderedDict[str, _Job]" = OrderedDict()
+        self._running = set()
+        self._slots_used = 0  # workers holding a job (or a batch)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._stats = {"submitted": 0, "completed": 0, "superseded": 0, "cancelled": 0, "rejected": 0, "failed": 0,
+                       "cached": 0}
+
+    async def start(self):
+        """Create the pool and load the model(s). Runs the loading off the event loop."""
+        started = time.perf_counter()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._wakeup = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        if self.mode == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="whisper")
+            self.model = await loop.run_in_executor(
+                self._pool, lambda: self.model_loader(*self.loader_args, **self.loader_kwargs))
+            self.feature_size = feature_size(self.model)
+        else:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_loader, self.loader_args, self.loader_kwargs),
+            )
+            # one call per worker makes the pool spawn them all and load the models now
+            await asyncio.gather(*[loop.run_in_executor(self._pool, _worker_ready) for _ in range(self.workers)])
+            self.feature_size = await loop.run_in_executor(self._pool, _worker_feature_size)
+        self.load_seconds = time.perf_counter() - started
+        self.ready = True
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def shutdown(self):
+        self.ready = False
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+        for job in self._pending.values():
+            if not job.future.done():
+                job.future.cancel()
+        self._pending.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self.model is not None and self.model_release is not None:
+            self.model_release(self.model)
+        self.model = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    @property
+    def running(self) -> int:
+        """Jobs being decoded now (a batch counts each of its jobs)."""
+        return len(self._running)
+
+    @property
+    def busy(self) -> bool:
+        """Every worker (or in-flight slot) holds a job, a new window would have to wait."""
+        return self._slots_used >= self.workers
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats, pending=len(self._pending), running=self.running,
+                    workers=self.workers, mode=self.mode, load_seconds=_rounded(self.load_seconds),
+                    warmup_seconds=_rounded(self.warmup_seconds), busy_seconds=_rounded(self.busy_seconds),
+                    scheduling="drr" if self._fair is not None else "fifo")
+
+    async def warm_up(self, seconds: float = 2.0, **options) -> float:
+        """
+        Decode `seconds` of synthetic audio once per worker, concurrently, so the first real
+        window does not pay for lazy allocations and first-run kernel setup. Bypasses the
+        queue, the result cache and the stats. Returns the elapsed time.
+        """
+        if not self.ready:
+            raise RuntimeError("model not loaded")
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        jobs = [_Job(f"warmup:{i}", warmup_audio(seconds, seed=i), options, loop.create_future())
+                for i in range(self.workers)]
+        await asyncio.gather(*(self._execute(job) for job in jobs))
+        self.warmup_seconds = time.perf_counter() - started
+        return self.warmup_seconds
+
+    async def submit(self, session_id: str, audio: np.ndarray, features: Optional[np.ndarray] = None,
+                     **options) -> Tuple[list, dict]:
+        """
+        Queue `audio` (16 kHz float32) for transcription and wait for (segments, info).
+        `audio` must not be modified afterwards; pass a copy of ring-buffer views.
+        `features`, if given, are the window's log-mel features (see feature_size).
+        Raises JobSuperseded if a newer window of the same session replaces this one before
+        it starts, and InferenceQueueFull if too many sessions are already waiting.
+        """
+        if not self.ready:
+            raise RuntimeError("model not loaded")
+        loop = asyncio.get_running_loop()
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self.result_cache.key(self.cache_namespace, audio, options)
+            if session_id not in self._pending and session_id not in self._running:
+                cached = self.result_cache.get_local(cache_key)
+                if cached is not None:
+                    self._stats["submitted"] += 1
+                    self._stats["cached"] += 1
+                    return cached
+        job = _Job(session_id, audio, options, loop.create_future(), cache_key, features)
+        old = self._pending.get(session_id)
+        if old is not None:
+            # replace in place: the session keeps its position in the queue
+            if not old.future.done():
+                old.future.set_exception(JobSuperseded())
+            self._stats["superseded"] += 1
+        elif len(self._pending) >= self.max_pending:
+            self._stats["rejected"] += 1
+            raise InferenceQueueFull(f"{len(self._pending)} sessions already waiting for inference")
+        self._pending[session_id] = job
+        self._stats["submitted"] += 1
+        self._wakeup.set()
+        return await job.future
+
+    def cancel(self, session_id: str):
+        """Drop the session's pending window (e.g. the client disconnected). A running job finishes but its result is discarded."""
+        job = self._pending.pop(session_id, None)
+        if job is not None and not job.future.done():
+            job.future.cancel()
+            self._stats["cancelled"] += 1
+
+    def _next_job(self, accept: Optional[Callable[[_Job], bool]] = None) -> Optional[_Job]:
+        if self._fair is not None:
+            candidates = [(session_id, len(job.audio) / 16000) for session_id, job in self._pending.items()
+                          if session_id not in self._running and (accept is None or accept(job))]
+            session_id = self._fair.pick(candidates, self._pending)
+            return self._pending.pop(session_id) if session_id is not None else None
+        for session_id, job in self._pending.items():
+            if session_id in self._running or (accept is not None and not accept(job)):
+                continue
+            del self._pending[session_id]
+            return job
+        return None
+
+    async def _dispatch_loop(self):
+        while True:
+            await self._slots.acquire()
+            job = self._next_job()
+            while job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                job = self._next_job()
+            if job.future.done():
+                # awaiter went away while the job was queued
+                self._slots.release()
+                continue
+            self._running.add(job.session_id)
+            self._slots_used += 1
+            asyncio.create_task(self._run(job))
+
+    def _call(self, audio: np.ndarray, options: dict, features: Optional[np.ndarray] = None):
+        return transcribe_pcm(self.model, audio, features, **options)
+
+    async def _execute(self, job: _Job):
+        loop = asyncio.get_running_loop()
+        if self.mode == "thread":
+            return await loop.run_in_executor(self._pool, self._call, job.audio, job.options, job.features)
+        return await loop.run_in_executor(self._pool, _worker_transcribe, job.audio, job.options, job.features)
+
+    async def _from_cache(self, job: _Job) -> bool:
+        """Answer the job from the result cache if possible."""
+        if job.cache_key is None:
+            return False
+        result = await self.result_cache.get(job.cache_key)
+        if result is None:
+            return False
+        self._stats["cached"] += 1
+        if not job.future.done():
+            job.future.set_result(result)
+        return True
+
+    async def _remember(self, job: _Job, result):
+        if job.cache_key is not None:
+            await self.result_cache.put(job.cache_key, result)
+
+    async def _run(self, job: _Job):
+        started = time.perf_counter()
+        observe_stage("inference_queue", started - job.enqueued_at, job.session_id)
+        try:
+            if await self._from_cache(job):
+                return
+            result = await self._execute(job)
+            elapsed = time.perf_counter() - started
+            observe_stage("inference", elapsed, job.session_id)
+            INFERENCE_SECONDS.inc(elapsed)
+            self.busy_seconds += elapsed
+            self._stats["completed"] += 1
+            if not job.future.done():
+                job.future.set_result(result)
+            await self._remember(job, result)
+        except Exception as e:
+            self._stats["failed"] += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            self._running.discard(job.session_id)
+            self._slots_used -= 1
+            self._slots.release()
+            self._wakeup.set()
@@ -0,0 +1,234 @@
+#Local inference server: one process owns the models for every API worker on the box
+# backend/core/inference_server.py
+#
+#   cd Code/backend && python -m core.inference_server
+#   INFERENCE_MODE=shm uvicorn main:app --workers 4
+#
+# Without it every uvicorn worker loads its own copy of each model and runs its own CTranslate2
+# thread pool. Here the models are loaded once, INFERENCE_CPU_THREADS is split between them,
+# and windows from all API workers meet in the same executor, where they can be batched.
+import asyncio
+import os
+import signal
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import numpy as np
+from dotenv import load_dotenv
+
+from core.batch_scheduler import BatchScheduler
+from core.inference_executor import InferenceExecutor, InferenceQueueFull, JobSuperseded
+from core.shm_channel import DEFAULT_SOCKET, AudioArena, read_message, send_message
+from models.load_whisper import get_model, release_model
+from utils.logger import get_logger
+from utils.timer import forget_session
+
+log = get_logger("inference_server")
+
+
+class InferenceServer:
+    """
+    Serves transcription over a Unix socket to SharedMemoryExecutor clients.
+
+    A client says hello with the model it wants and the name of its shared memory arena;
+    the reply comes once that model is loaded and warmed up. Each window header then names
+    an arena slot (or carries the audio inline) and the decoding options; the audio is
+    decoded straight from the arena and the segments go back as JSON. Sessions are keyed
+    by client, so the executor coalesces windows per session as it does in-process.
+    """
+
+    def __init__(self, create_executor: Callable[[str], InferenceExecutor], allowed_models: List[str],
+                 warmup_seconds: float = 0.0, warmup_options: Optional[Dict[str, Any]] = None):
+        self.create_executor = create_executor
+        self.allowed_models = list(allowed_models)
+        self.warmup_seconds = warmup_seconds
+        self.warmup_options = dict(warmup_options or {})
+        self.executors: Dict[str, InferenceExecutor] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._clients: Set[str] = set()
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._stats = {"clients": 0, "windows": 0, "inline": 0, "errors": 0}
+
+    async def get_executor(self, model: str) -> InferenceExecutor:
+        if model not in self.allowed_models:
+            raise ValueError(f"model {model} is not served here (ALLOWED_MODELS)")
+        executor = self.executors.get(model)
+        if executor is not None:
+            return executor
+        async with self._locks.setdefault(model, asyncio.Lock()):
+            executor = self.executors.get(model)
+            if executor is None:
+                executor = self.create_executor(model)
+                await executor.start()
+                log.info("Model %s loaded in %.2fs", model, executor.load_seconds)
+                if self.warmup_seconds > 0:
+                    try:
+                        await executor.warm_up(self.warmup_seconds, **self.warmup_options)
+                        log.info("Model %s warmed up in %.2fs", model, executor.warmup_seconds)
+                    except Exception as e:
+                        log.warning("Warm-up of %s failed: %s", model, e)
+                self.executors[model] = executor
+        return executor
+
+    async def serve(self, path: str):
+        if os.path.exists(path):
+            os.unlink(path)  # left behind by a server that did not shut down cleanly
+        self._server = await asyncio.start_unix_server(self._handle, path=path)
+        log.info("Inference server listening on %s (models: %s)", path, ", ".join(self.allowed_models))
+
+    async def shutdown(self):
+        if self._server is not None:
+            self._server.close()
+        # closing the connections ends their handlers, which wait for running windows
+        for writer in self._connections.values():
+            writer.close()
+        if self._connections:
+            await asyncio.wait(list(self._connections), timeout=10)
+        for executor in self.executors.values():
+            await executor.shutdown()
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats, connected=len(self._clients),
+                    models={m: ex.stats() for m, ex in self.executors.items()})
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        handler = asyncio.current_task()
+        self._connections[handler] = writer
+        try:
+            await self._serve_client(reader, writer)
+        finally:
+            self._connections.pop(handler, None)
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            hello = await read_message(reader)
+            client = hello["client"]
+            executor = await self.get_executor(hello["model"])
+            arena = AudioArena(hello["slots"], hello["slot_samples"], name=hello["shm"])
+        except asyncio.IncompleteReadError:
+            writer.close()
+            return
+        except Exception as e:
+            log.warning("Refused client: %s", e)
+            await send_message(writer, {"ok": False, "error": str(e)})
+            writer.close()
+            return
+        await send_message(writer, {"ok": True})
+        self._clients.add(client)
+        self._stats["clients"] += 1
+        log.info("Client %s connected (%s, %d slots)", client, hello["model"], arena.slots)
+        tasks: Set[asyncio.Task] = set()
+        sessions: Set[str] = set()
+        try:
+            while True:
+                message = await read_message(reader)
+                key = f"{client}:{message.get('session_id')}"
+                if message.get("op") == "transcribe":
+                    if "inline" in message:
+                        audio = np.frombuffer(await reader.readexactly(message["inline"]), dtype=np.float32)
+                        self._stats["inline"] += 1
+                    else:
+                        # read in place; the client keeps the slot until it has our reply
+                        audio = arena.view(message["slot"], message["samples"])
+                    sessions.add(key)
+                    task = asyncio.create_task(self._transcribe(executor, key, audio, message, writer))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                elif message.get("op") == "cancel":
+                    executor.cancel(key)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for key in sessions:
+                executor.cancel(key)
+            # windows already running still read the arena
+            if tasks:
+                await asyncio.wait(tasks)
+            for key in sessions:
+                forget_session(key)
+            arena.close()
+            writer.close()
+            self._clients.discard(client)
+            log.info("Client %s disconnected", client)
+
+    async def _transcribe(self, executor: InferenceExecutor, key: str, audio: np.ndarray, message: Dict[str, Any],
+                          writer: asyncio.StreamWriter):
+        self._stats["windows"] += 1
+        try:
+            segments, info = await executor.submit(key, audio, **message["options"])
+            reply = {"id": message["id"], "ok": True, "segments": segments, "info": info}
+        except JobSuperseded:
+            reply = {"id": message["id"], "ok": False, "error": "superseded"}
+        except asyncio.CancelledError:
+            # executor.cancel() dropped the window before it ran; the client holds a slot until it hears back
+            reply = {"id": message["id"], "ok": False, "error": "cancelled"}
+        except InferenceQueueFull:
+            reply = {"id": message["id"], "ok": False, "error": "busy"}
+        except Exception as e:
+            self._stats["errors"] += 1
+            reply = {"id": message["id"], "ok": False, "error": f"transcription error: {e}"}
+        try:
+            await send_message(writer, reply)
+        except ConnectionError:
+            pass
+
+
+async def main():
+    load_dotenv()
+    socket_path = os.getenv("INFERENCE_SERVER_SOCKET", DEFAULT_SOCKET)
+    model_size = os.getenv("MODEL_SIZE", "tiny.en")
+    allowed = [m.strip() for m in os.getenv("ALLOWED_MODELS", model_size).split(",") if m.strip()]
+    if model_size not in allowed:
+        allowed.insert(0, model_size)
+    device = os.getenv("WHISPER_DEVICE", "cpu")
+    compute_type = os.getenv("WHISPER_COMPUTE", "int8")
+    mode = os.getenv("INFERENCE_SERVER_MODE", "thread")
+    workers = int(os.getenv("INFERENCE_WORKERS", "1"))
+    batch_size = int(os.getenv("INFERENCE_BATCH_SIZE", "1"))
+    max_pending = int(os.getenv("INFERENCE_SERVER_MAX_PENDING", "256"))
+    # sessions of all API workers share the models by deficit round-robin on audio seconds
+    fair_quantum = float(os.getenv("FAIR_QUANTUM_SECONDS", "2.0"))
+    # the box's CPU budget, shared by the concurrent decodes of a model
+    cpu_threads = int(os.getenv("INFERENCE_CPU_THREADS", str(os.cpu_count() or 1)))
+    threads_per_worker = max(1, cpu_threads // workers)
+    warmup = float(os.getenv("WARMUP_SECONDS", "2.0")) if os.getenv("WARMUP_ENABLED", "1") not in ("0", "false", "False") else 0.0
+
+    def create_executor(model: str) -> InferenceExecutor:
+        loader_kwargs = {"num_workers": workers if mode == "thread" else 1, "cpu_threads": threads_per_worker}
+        executor_args = dict(mode=mode, workers=workers, max_pending=max_pending, model_release=release_model,
+                             fair_quantum=fair_quantum)
+        if batch_size > 1:
+            return BatchScheduler(get_model, (model, device, compute_type), loader_kwargs, max_batch_size=batch_size,
+                                  max_wait_ms=float(os.getenv("INFERENCE_BATCH_WAIT_MS", "20")), **executor_args)
+        return InferenceExecutor(get_model, (model, device, compute_type), loader_kwargs, **executor_args)
+
+    server = InferenceServer(create_executor, allowed, warmup_seconds=warmup,
+                             warmup_options={"beam_size": int(os.getenv("BEAM_SIZE", "5")), "language": "en",
+                                             "word_timestamps": True})
+    # listen first: clients that connect meanwhile get their hello answered once the model is up
+    await server.serve(socket_path)
+    log.info("Loading %s (%s x%d, %d CPU threads each, batch %d)", model_size, mode, workers, threads_per_worker,
+             batch_size)
+    started = time.perf_counter()
+    await server.get_executor(model_size)
+    log.info("Ready in %.2fs", time.perf_counter() - started)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:
+            pass
+    await stopping.wait()
+    log.info("Inference server stopping: %s", server.stats())
+    await server.shutdown()
+    try:
+        os.unlink(socket_path)
+    except FileNotFoundError:
+        pass
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
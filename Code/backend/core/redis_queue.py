@@ -1 +1,279 @@
-#Redis Stream handling (push/pull chunk)
\ No newline at end of file
+#Redis Stream handling (push/pull chunk)
+# backend/core/redis_queue.py
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+
+from core.inference_executor import InferenceExecutor, JobSuperseded, _Job
+from utils.logger import get_logger
+
+log = get_logger("redis_queue")
+
+JOB_STREAM = "stt:jobs"
+JOB_GROUP = "stt-workers"
+DEAD_LETTER_STREAM = "stt:jobs:dead"
+RESULT_CHANNEL_PREFIX = "stt:results:"
+
+
+def encode_audio(audio: np.ndarray) -> bytes:
+    """16 kHz float32 PCM -> little-endian int16 bytes (what ffmpeg/Opus delivers anyway, at half the size)."""
+    return (np.clip(np.asarray(audio, dtype=np.float32), -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+
+def decode_audio(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32767.0
+
+
+def _text(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+class TranscriptionQueue:
+    """
+    Redis Streams work queue between WebSocket front ends (producers) and transcription
+    workers (consumers).
+
+    Every job is one stream entry holding the audio window, the decoding options, the
+    session id and the pub/sub channel its result goes to. Workers read through a
+    consumer group, so each entry is delivered to one worker, and acknowledge it only after
+    the result was published. Entries of a worker that died stay pending and are claimed
+    by another worker once idle for `claim_idle_ms`; after `max_deliveries` attempts they
+    move to the dead-letter stream instead. Jobs carry an expiry, a partial nobody waits
+    for any more is dropped rather than decoded.
+
+    `redis` must be a client created with decode_responses=False (the audio is binary).
+    """
+
+    def __init__(self, redis, stream: str = JOB_STREAM, group: str = JOB_GROUP, maxlen: int = 10000,
+                 claim_idle_ms: int = 30000, max_deliveries: int = 3, dead_letter_stream: str = DEAD_LETTER_STREAM):
+        self.redis = redis
+        self.stream = stream
+        self.group = group
+        self.maxlen = maxlen
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+        self.dead_letter_stream = dead_letter_stream
+
+    async def ensure_group(self):
+        """Create the stream and consumer group if they do not exist yet."""
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    # --- producer side ---
+
+    async def enqueue(self, session_id: str, audio: np.ndarray, options: dict, reply_to: str,
+                      ttl: float = 30.0, job_id: Optional[str] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        await self.redis.xadd(self.stream, {
+            "job_id": job_id,
+            "session_id": session_id,
+            "reply_to": reply_to,
+            "options": json.dumps(options),
+            "expires_at": repr(time.time() + ttl),
+            "audio": encode_audio(audio),
+        }, maxlen=self.maxlen, approximate=True)
+        return job_id
+
+    # --- consumer side ---
+
+    async def read(self, consumer: str, count: int = 1, block_ms: int = 1000) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Return up to `count` jobs for `consumer`: stuck entries of other consumers first,
+        then new ones (blocking up to `block_ms`). Each item is (entry_id, job).
+        """
+        jobs = await self._claim_stuck(consumer, count)
+        if len(jobs) < count:
+            response = await self.redis.xreadgroup(self.group, consumer, {self.stream: ">"},
+                                                   count=count - len(jobs), block=block_ms)
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    jobs.append((_text(entry_id), self._parse(fields)))
+        return jobs
+
+    async def _claim_stuck(self, consumer: str, count: int) -> List[Tuple[str, Dict[str, Any]]]:
+        response = await self.redis.xautoclaim(self.stream, self.group, consumer, self.claim_idle_ms,
+                                               start_id="0-0", count=count)
+        jobs = []
+        for entry_id, fields in response[1]:
+            entry_id = _text(entry_id)
+            if not fields:
+                # trimmed away while pending
+                await self.ack(entry_id)
+                continue
+            job = self._parse(fields)
+            pending = await self.redis.xpending_range(self.stream, self.group, min=entry_id, max=entry_id, count=1)
+            deliveries = pending[0]["times_delivered"] if pending else 1
+            if deliveries > self.max_deliveries:
+                await self.dead_letter(entry_id, fields, f"gave up after {deliveries - 1} deliveries")
+                await self.publish_result(job, {"status": "error", "error": "transcription job failed repeatedly"})
+                continue
+            jobs.append((entry_id, job))
+        return jobs
+
+    @staticmethod
+    def _parse(fields: dict) -> Dict[str, Any]:
+        fields = {_text(k): v for k, v in fields.items()}
+        return {
+            "job_id": _text(fields["job_id"]),
+            "session_id": _text(fields["session_id"]),
+            "reply_to": _text(fields["reply_to"]),
+            "options": json.loads(_text(fields["options"])),
+            "expires_at": float(_text(fields["expires_at"])),
+            "audio": decode_audio(fields["audio"]),
+        }
+
+    async def ack(self, entry_id: str):
+        # the audio is useless once acknowledged, drop the entry instead of waiting for MAXLEN
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream, self.group, entry_id)
+            pipe.xdel(self.stream, entry_id)
+            await pipe.execute()
+
+    async def dead_letter(self, entry_id: str, fields: dict, reason: str):
+        fields = dict(fields, reason=reason, entry_id=entry_id)
+        await self.redis.xadd(self.dead_letter_stream, fields, maxlen=1000, approximate=True)
+        await self.ack(entry_id)
+
+    async def publish_result(self, job: Dict[str, Any], result: Dict[str, Any]):
+        payload = dict(result, job_id=job["job_id"], session_id=job["session_id"])
+        await self.redis.publish(job["reply_to"], json.dumps(payload))
+
+    async def info(self) -> Dict[str, Any]:
+        """Queue length, entries delivered but not acknowledged yet, and consumer count."""
+        length = await self.redis.xlen(self.stream)
+        try:
+            groups = await self.redis.xinfo_groups(self.stream)
+        except ResponseError:
+            groups = []
+        group = next((g for g in groups if _text(g["name"]) == self.group), None)
+        return {
+            "length": length,
+            "pending": group["pending"] if group else 0,
+            "consumers": group["consumers"] if group else 0,
+        }
+
+
+class RemoteExecutor(InferenceExecutor):
+    """
+    InferenceExecutor that runs jobs on transcription workers through the Redis Streams
+    queue instead of a local model (INFERENCE_MODE=remote).
+
+    Per-session coalescing, max_pending and the stats work as in the local executor;
+    `max_in_flight` bounds how many windows this front end has queued at once. Results
+    come back on a pub/sub channel owned by this process and are routed to the waiting
+    session by job id.
+    """
+
+    def __init__(self, redis_url: str, max_in_flight: int = 32, max_pending: int = 64,
+                 result_timeout: float = 30.0, node_id: Optional[str] = None, redis=None,
+                 result_cache=None, cache_namespace: str = "remote", fair_quantum: Optional[float] = None,
+                 **queue_kwargs):
+        super().__init__(None, workers=max_in_flight, max_pending=max_pending,
+                         result_cache=result_cache, cache_namespace=cache_namespace, fair_quantum=fair_quantum)
+        self.mode = "remote"
+        self.redis_url = redis_url
+        self.result_timeout = result_timeout
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.reply_channel = RESULT_CHANNEL_PREFIX + self.node_id
+        self.redis = redis
+        self.queue: Optional[TranscriptionQueue] = None
+        self._queue_kwargs = queue_kwargs
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._replies: Dict[str, asyncio.Future] = {}
+
+    async def start(self):
+        started = time.perf_counter()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._wakeup = asyncio.Event()
+        if self.redis is None:
+            self.redis = aioredis.from_url(self.redis_url, decode_responses=False)
+        self.queue = TranscriptionQueue(self.redis, **self._queue_kwargs)
+        await self.queue.ensure_group()
+        self._pubsub = self.redis.pubsub()
+        await self._pubsub.subscribe(self.reply_channel)
+        self._listener = asyncio.create_task(self._listen())
+        # no model here: what loading costs is the Redis handshake
+        self.load_seconds = time.perf_counter() - started
+        self.ready = True
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def shutdown(self):
+        await super().shutdown()
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        for future in self._replies.values():
+            if not future.done():
+                future.cancel()
+        self._replies.clear()
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.unsubscribe(self.reply_channel)
+                await self._pubsub.aclose()
+            except Exception:
+                pass
+        if self.redis is not None:
+            await self.redis.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(super().stats(), in_flight=len(self._replies), node_id=self.node_id)
+
+    async def warm_up(self, seconds: float = 2.0, **options) -> float:
+        # the transcription workers own the model and warm it up before they read jobs
+        self.warmup_seconds = 0.0
+        return 0.0
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("Result listener error: %s", e)
+                await asyncio.sleep(1.0)
+                continue
+            if message is None or message.get("type") != "message":
+                continue
+            try:
+                result = json.loads(_text(message["data"]))
+            except ValueError:
+                continue
+            future = self._replies.get(result.get("job_id"))
+            if future is not None and not future.done():
+                future.set_result(result)
+
+    async def _execute(self, job: _Job):
+        job_id = uuid.uuid4().hex
+        # register before the job is visible to workers, a fast worker may answer at once
+        future = asyncio.get_running_loop().create_future()
+        self._replies[job_id] = future
+        try:
+            await self.queue.enqueue(job.session_id, job.audio, job.options, self.reply_channel,
+                                     ttl=self.result_timeout, job_id=job_id)
+            try:
+                result = await asyncio.wait_for(future, self.result_timeout)
+            except asyncio.TimeoutError:
+                raise RuntimeError(f"no transcription worker answered within {self.result_timeout:g}s") from None
+        finally:
+            self._replies.pop(job_id, None)
+        status = result.get("status")
+        if status == "ok":
+            return result["segments"], result["info"]
+        if status == "superseded":
+            raise JobSuperseded()
+        raise RuntimeError(result.get("error") or f"transcription job {status}")
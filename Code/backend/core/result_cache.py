@@ -0,0 +1,124 @@
+#Content-addressed cache of transcription results
+# backend/core/result_cache.py
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from utils.logger import get_logger
+from utils.timer import REGISTRY
+
+log = get_logger("result_cache")
+
+CACHE_LOOKUPS = REGISTRY.counter(
+    "stt_result_cache_lookups_total", "Transcription result cache lookups by outcome (memory_hit, redis_hit, miss)",
+    labels=("result",))
+CACHE_BYTES = REGISTRY.gauge("stt_result_cache_bytes", "Bytes of results held in the in-memory cache")
+
+
+class ResultCache:
+    """
+    Transcription results keyed by a fingerprint of the exact PCM window, the model and every
+    decoding option (beam size, language, prompt, ...), so only a bit-identical request
+    can hit: a flush over the window the last partial just decoded, or a client retrying
+    the same audio.
+
+    Results are kept as JSON in an LRU bounded by `max_bytes`. With `redis` (a client
+    created with decode_responses=True) they are also written there for `ttl_seconds`,
+    shared by every process, and a memory miss falls back to Redis.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2**20, redis=None, ttl_seconds: float = 3600.0,
+                 prefix: str = "stt:result:"):
+        self.max_bytes = int(max_bytes)
+        self.redis = redis
+        self.ttl = int(ttl_seconds)
+        self.prefix = prefix
+        self.bytes = 0
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._stats = {"memory_hit": 0, "redis_hit": 0, "miss": 0, "stored": 0, "evicted": 0}
+
+    @staticmethod
+    def key(namespace: str, audio: np.ndarray, options: Dict[str, Any]) -> str:
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(namespace.encode())
+        digest.update(json.dumps(options, sort_keys=True, default=str).encode())
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        digest.update(str(audio.shape[0]).encode())
+        digest.update(audio.data)
+        return digest.hexdigest()
+
+    def get_local(self, key: str) -> Optional[Tuple[list, dict]]:
+        """Memory-only lookup (no await, no miss counted)."""
+        data = self._entries.get(key)
+        if data is None:
+            return None
+        self._entries.move_to_end(key)
+        self._count("memory_hit")
+        return _decode(data)
+
+    async def get(self, key: str) -> Optional[Tuple[list, dict]]:
+        result = self.get_local(key)
+        if result is not None:
+            return result
+        if self.redis is not None:
+            try:
+                data = await self.redis.get(self.prefix + key)
+            except Exception as e:
+                log.warning("redis lookup failed: %s", e)
+                data = None
+            if data is not None:
+                self._store(key, data)
+                self._count("redis_hit")
+                return _decode(data)
+        self._count("miss")
+        return None
+
+    async def put(self, key: str, result: Tuple[list, dict]):
+        segments, info = result
+        data = json.dumps([segments, info], default=_plain)
+        self._store(key, data)
+        self._stats["stored"] += 1
+        if self.redis is not None:
+            try:
+                await self.redis.set(self.prefix + key, data, ex=self.ttl)
+            except Exception as e:
+                log.warning("redis store failed: %s", e)
+
+    def _store(self, key: str, data: str):
+        size = len(data)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= len(old)
+        self._entries[key] = data
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= len(evicted)
+            self._stats["evicted"] += 1
+        CACHE_BYTES.set(self.bytes)
+
+    def _count(self, outcome: str):
+        self._stats[outcome] += 1
+        CACHE_LOOKUPS.inc(result=outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self._stats["memory_hit"] + self._stats["redis_hit"]
+        lookups = hits + self._stats["miss"]
+        return dict(self._stats, entries=len(self._entries), bytes=self.bytes, max_bytes=self.max_bytes,
+                    hit_rate=round(hits / lookups, 4) if lookups else 0.0, redis=self.redis is not None)
+
+
+def _decode(data: str) -> Tuple[list, dict]:
+    segments, info = json.loads(data)
+    return segments, info
+
+def _plain(value):
+    # numpy scalars in segment dicts
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
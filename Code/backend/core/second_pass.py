@@ -0,0 +1,142 @@
+#Background re-decoding of finished utterances with a larger model
+# backend/core/second_pass.py
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import numpy as np
+
+from core.inference_executor import InferenceExecutor
+from utils.logger import get_logger
+from utils.timer import REGISTRY, forget_session, observe_stage
+
+log = get_logger("second_pass")
+
+SECOND_PASS_JOBS = REGISTRY.counter("stt_second_pass_jobs_total", "Utterances handed to the second pass by outcome",
+                                    labels=("result",))
+
+
+class _Utterance:
+    __slots__ = ("session_id", "segment_id", "audio", "offset", "options", "deliver", "queued_at")
+
+    def __init__(self, session_id, segment_id, audio, offset, options, deliver):
+        self.session_id = session_id
+        self.segment_id = segment_id
+        self.audio = audio
+        self.offset = offset
+        self.options = options
+        self.deliver = deliver
+        self.queued_at = time.perf_counter()
+
+
+class SecondPass:
+    """
+    Re-decodes utterances that already got a first-pass final with a larger model, in the
+    background and oldest first.
+
+    First-pass work always goes first: an utterance is only handed to the second-pass
+    executor while `first_pass_idle()` is true (no session waiting for the first-pass
+    model and a worker free), and at most `max_in_flight` of them run at once. When more
+    than `max_queued` utterances are waiting the oldest are dropped; their first-pass
+    finals simply stay.
+
+    `deliver(segments, info)` is awaited with the result in stream time (the utterance's
+    offset already added); exceptions from it are logged and otherwise ignored, the
+    session may be gone by then.
+    """
+
+    def __init__(self, get_executor: Callable[[], Awaitable[InferenceExecutor]], first_pass_idle: Callable[[], bool],
+                 max_in_flight: int = 1, max_queued: int = 64, poll_seconds: float = 0.05):
+        self.get_executor = get_executor
+        self.first_pass_idle = first_pass_idle
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_queued = max(1, int(max_queued))
+        self.poll = poll_seconds
+        self._queue: Deque[_Utterance] = deque()
+        self._wakeup = asyncio.Event()
+        self._in_flight = 0
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"queued": 0, "done": 0, "dropped": 0, "failed": 0}
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._queue.clear()
+
+    def submit(self, session_id: str, segment_id: int, audio: np.ndarray, offset: float, options: Dict[str, Any],
+               deliver: Callable[[list, dict], Awaitable[None]]):
+        """Queue an utterance (`audio` must not change afterwards) starting at stream time `offset`."""
+        self._queue.append(_Utterance(session_id, segment_id, audio, offset, options, deliver))
+        self._stats["queued"] += 1
+        while len(self._queue) > self.max_queued:
+            self._queue.popleft()
+            self._count("dropped")
+        self._wakeup.set()
+
+    def cancel(self, session_id: str):
+        """Forget the queued utterances of a session that went away."""
+        kept = [u for u in self._queue if u.session_id != session_id]
+        for _ in range(len(self._queue) - len(kept)):
+            self._count("dropped")
+        self._queue = deque(kept)
+
+    async def _loop(self):
+        while True:
+            if not self._queue or self._in_flight >= self.max_in_flight:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if not self.first_pass_idle():
+                # back off while live sessions wait for the first-pass model
+                await asyncio.sleep(self.poll)
+                continue
+            self._in_flight += 1
+            asyncio.create_task(self._run(self._queue.popleft()))
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    async def _run(self, utt: _Utterance):
+        # a job id of its own per utterance, so utterances of one session never supersede each other
+        job_id = f"{utt.session_id}:pass2:{utt.segment_id}"
+        try:
+            executor = await self.get_executor()
+            segments, info = await executor.submit(job_id, utt.audio, **utt.options)
+            segments = [_shifted(seg, utt.offset) for seg in segments]
+            observe_stage("second_pass", time.perf_counter() - utt.queued_at)
+            self._count("done")
+            try:
+                await utt.deliver(segments, info)
+            except Exception as e:
+                log.info("Second pass result for %s dropped: %s", utt.session_id, e)
+        except Exception as e:
+            self._count("failed")
+            log.warning("Second pass of %s segment %d failed: %s", utt.session_id, utt.segment_id, e)
+        finally:
+            forget_session(job_id)
+            self._in_flight -= 1
+            self._wakeup.set()
+
+    def _count(self, result: str):
+        self._stats[result] += 1
+        SECOND_PASS_JOBS.inc(result=result)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats, waiting=len(self._queue), in_flight=self._in_flight)
+
+
+def _shifted(segment: Dict[str, Any], offset: float) -> Dict[str, Any]:
+    """A copy of a segment dict with its (and its words') times moved by `offset`; results may be shared via the cache."""
+    words = segment.get("words")
+    if words is not None:
+        words = [dict(w, start=w["start"] + offset, end=w["end"] + offset) for w in words]
+    return dict(segment, start=segment["start"] + offset, end=segment["end"] + offset, words=words)
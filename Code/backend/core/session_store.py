@@ -0,0 +1,167 @@
+#Session state kept outside the WebSocket handler, so a session can resume after a reconnect
+# backend/core/session_store.py
+#
+# A snapshot is a JSON-serializable dict (transcript, VAD and decoder offsets, ...) plus the
+# uncommitted audio tail. SESSION_STORE=memory keeps snapshots in this process (one uvicorn
+# worker); SESSION_STORE=redis keeps them in Redis, so a client can reconnect to any worker.
+import json
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import redis.asyncio as aioredis
+from redis.exceptions import WatchError
+
+from core.redis_queue import decode_audio, encode_audio
+
+Snapshot = Tuple[Dict[str, Any], np.ndarray]
+
+
+class SessionTakenOver(Exception):
+    """The client reconnected and another connection owns the session now."""
+
+
+class SessionStore(ABC):
+    """
+    Snapshots of live sessions, keyed by session id, expiring `ttl_seconds` after the last save.
+
+    A connection claim()s a session before using it: that returns the last snapshot (None
+    for a new session) and makes the caller the owner. save() only succeeds for the current
+    owner, so a handler whose client has already reconnected elsewhere cannot overwrite the
+    newer state.
+    """
+
+    name = "base"
+
+    def __init__(self, ttl_seconds: float = 600.0):
+        self.ttl = float(ttl_seconds)
+
+    @abstractmethod
+    async def claim(self, session_id: str, owner: str) -> Optional[Snapshot]:
+        """Take over a session; its last snapshot, or None for a new (or expired) one."""
+
+    @abstractmethod
+    async def save(self, session_id: str, owner: str, state: Dict[str, Any], audio: np.ndarray) -> bool:
+        """Store a snapshot; False if another connection owns the session now."""
+
+    @abstractmethod
+    async def delete(self, session_id: str, owner: Optional[str] = None):
+        """Forget a session (only if `owner` still owns it, when given)."""
+
+    async def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    name = "memory"
+
+    def __init__(self, ttl_seconds: float = 600.0):
+        super().__init__(ttl_seconds)
+        # session_id -> [owner, state, audio, expires_at]
+        self._sessions: Dict[str, list] = {}
+
+    def _expire(self):
+        now = time.monotonic()
+        for session_id in [sid for sid, entry in self._sessions.items() if entry[3] < now]:
+            del self._sessions[session_id]
+
+    async def claim(self, session_id: str, owner: str) -> Optional[Snapshot]:
+        self._expire()
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            self._sessions[session_id] = [owner, None, None, time.monotonic() + self.ttl]
+            return None
+        entry[0] = owner
+        entry[3] = time.monotonic() + self.ttl
+        return (entry[1], entry[2]) if entry[1] is not None else None
+
+    async def save(self, session_id: str, owner: str, state: Dict[str, Any], audio: np.ndarray) -> bool:
+        entry = self._sessions.get(session_id)
+        if entry is not None and entry[0] != owner:
+            return False
+        # round trip through JSON like the Redis store, so nothing aliases live handler state
+        self._sessions[session_id] = [owner, json.loads(json.dumps(state)), np.array(audio, dtype=np.float32),
+                                      time.monotonic() + self.ttl]
+        return True
+
+    async def delete(self, session_id: str, owner: Optional[str] = None):
+        entry = self._sessions.get(session_id)
+        if entry is not None and (owner is None or entry[0] == owner):
+            del self._sessions[session_id]
+
+
+class RedisSessionStore(SessionStore):
+    """
+    One hash per session (session:<id>) with the owner, the state as JSON and the audio tail
+    as int16 PCM. It uses its own binary-safe client, like the RemoteExecutor.
+    """
+
+    name = "redis"
+
+    def __init__(self, redis_url: str, ttl_seconds: float = 600.0, prefix: str = "session:", redis=None):
+        super().__init__(ttl_seconds)
+        self.redis = redis if redis is not None else aioredis.from_url(redis_url, decode_responses=False)
+        self._owns_client = redis is None
+        self.prefix = prefix
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}"
+
+    async def claim(self, session_id: str, owner: str) -> Optional[Snapshot]:
+        key = self._key(session_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hgetall(key)
+        pipe.hset(key, "owner", owner)
+        pipe.expire(key, int(self.ttl))
+        entry, _, _ = await pipe.execute()
+        if not entry or b"state" not in entry:
+            return None
+        state = json.loads(entry[b"state"])
+        return state, decode_audio(entry.get(b"audio", b""))
+
+    async def save(self, session_id: str, owner: str, state: Dict[str, Any], audio: np.ndarray) -> bool:
+        key = self._key(session_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                current = await pipe.hget(key, "owner")
+                if current is not None and current.decode() != owner:
+                    return False
+                pipe.multi()
+                pipe.hset(key, mapping={"owner": owner, "state": json.dumps(state), "audio": encode_audio(audio)})
+                pipe.expire(key, int(self.ttl))
+                await pipe.execute()
+                return True
+            except WatchError:
+                # claimed by another connection while we were writing
+                return False
+
+    async def delete(self, session_id: str, owner: Optional[str] = None):
+        key = self._key(session_id)
+        if owner is None:
+            await self.redis.delete(key)
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                current = await pipe.hget(key, "owner")
+                if current is not None and current.decode() != owner:
+                    return
+                pipe.multi()
+                pipe.delete(key)
+                await pipe.execute()
+            except WatchError:
+                pass
+
+    async def close(self):
+        if self._owns_client:
+            await self.redis.aclose()
+
+
+def create_session_store(kind: str, redis_url: str, ttl_seconds: float) -> SessionStore:
+    if kind == "redis":
+        return RedisSessionStore(redis_url, ttl_seconds)
+    if kind == "memory":
+        return MemorySessionStore(ttl_seconds)
+    raise ValueError(f"unknown session store {kind!r}, expected memory or redis")
@@ -0,0 +1,258 @@
+#Shared-memory audio transport between API workers and the local inference server
+# backend/core/shm_channel.py
+#
+# Audio windows are written into a shared memory arena that the API worker owns and the
+# inference server reads in place; only small length-prefixed JSON messages go over the
+# Unix socket (a header per window, the segments back).
+import asyncio
+import itertools
+import json
+import os
+import struct
+import time
+import uuid
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from core.inference_executor import InferenceExecutor, InferenceQueueFull, JobSuperseded, _Job
+
+DEFAULT_SOCKET = "/tmp/stt-inference.sock"
+SAMPLE_RATE = 16000
+_LENGTH = struct.Struct("<I")
+
+
+async def send_message(writer: asyncio.StreamWriter, message: Dict[str, Any], payload: bytes = b""):
+    """One length-prefixed JSON message, optionally followed by `payload` (its size goes in the message)."""
+    data = json.dumps(message).encode()
+    writer.write(_LENGTH.pack(len(data)) + data + payload)
+    await writer.drain()
+
+
+async def read_message(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    """Raises asyncio.IncompleteReadError once the peer has gone."""
+    (size,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return json.loads(await reader.readexactly(size))
+
+
+class AudioArena:
+    """
+    `slots` float32 windows of up to `slot_samples` samples in one shared memory segment.
+    The creating side hands out slots with acquire()/release(); the other side attaches
+    by name and only reads.
+    """
+
+    def __init__(self, slots: int, slot_samples: int, name: Optional[str] = None):
+        self.slots = int(slots)
+        self.slot_samples = int(slot_samples)
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_samples * 4)
+        else:
+            self.shm = _attach(name)
+        self.array = np.ndarray((self.slots, self.slot_samples), dtype=np.float32, buffer=self.shm.buf)
+        self._free: List[int] = list(range(self.slots)) if self.owner else []
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def acquire(self) -> Optional[int]:
+        return self._free.pop() if self._free else None
+
+    def release(self, slot: int):
+        self._free.append(slot)
+
+    def write(self, slot: int, audio: np.ndarray):
+        self.array[slot, :len(audio)] = audio
+
+    def view(self, slot: int, samples: int) -> np.ndarray:
+        return self.array[slot, :samples]
+
+    def close(self):
+        self.array = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # a view is still referenced somewhere; the mapping goes away with it
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Open a segment another process created without this process unlinking it at exit."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SharedMemoryExecutor(InferenceExecutor):
+    """
+    InferenceExecutor that runs jobs on the local inference server (python -m
+    core.inference_server, INFERENCE_MODE=shm) instead of a model in this process, so
+    every API worker of `uvicorn --workers N` shares one copy of each model and one CPU
+    thread budget.
+
+    Each window is copied once into a slot of this executor's shared memory arena and the
+    server decodes it from there; windows longer than `slot_seconds` go inline over the
+    socket. Per-session coalescing, max_pending and the stats work as in the local
+    executor; `max_in_flight` (one arena slot each) bounds the windows this process has
+    at the server. start() returns once the server has `model` loaded; a window the server
+    has not answered within `result_timeout` fails and gives its slot back.
+    """
+
+    def __init__(self, socket_path: str, model: str, max_in_flight: int = 8, max_pending: int = 64,
+                 slot_seconds: float = 32.0, connect_timeout: float = 30.0, result_timeout: float = 60.0,
+                 result_cache=None, cache_namespace: Optional[str] = None, fair_quantum: Optional[float] = None):
+        super().__init__(None, workers=max_in_flight, max_pending=max_pending, result_cache=result_cache,
+                         cache_namespace=cache_namespace or model, fair_quantum=fair_quantum)
+        self.mode = "shm"
+        self.socket_path = socket_path
+        self.model_name = model
+        self.slot_seconds = float(slot_seconds)
+        self.connect_timeout = float(connect_timeout)
+        self.result_timeout = float(result_timeout)
+        self.client_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.arena: Optional[AudioArena] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._replies: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._transport = {"shared": 0, "inline": 0, "reconnects": 0}
+
+    async def start(self):
+        started = time.perf_counter()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._wakeup = asyncio.Event()
+        self._connect_lock = asyncio.Lock()
+        self.arena = AudioArena(self.workers, int(self.slot_seconds * SAMPLE_RATE))
+        try:
+            await self._connect(self.connect_timeout)
+        except Exception:
+            self.arena.close()
+            self.arena = None
+            raise
+        self.load_seconds = time.perf_counter() - started
+        self.ready = True
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def _connect(self, wait: float = 0.0):
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                if time.monotonic() >= deadline:
+                    raise RuntimeError(f"inference server not reachable at {self.socket_path}: {e}") from None
+                await asyncio.sleep(0.2)
+        await send_message(writer, {"op": "hello", "client": self.client_id, "model": self.model_name,
+                                    "shm": self.arena.name, "slots": self.arena.slots,
+                                    "slot_samples": self.arena.slot_samples})
+        # the server answers once the model is loaded
+        reply = await read_message(reader)
+        if not reply.get("ok"):
+            writer.close()
+            raise RuntimeError(f"inference server refused {self.model_name}: {reply.get('error')}")
+        self._reader, self._writer = reader, writer
+        self._listener = asyncio.create_task(self._listen(reader))
+
+    async def _listen(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                reply = await read_message(reader)
+                future = self._replies.get(reply.get("id"))
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writer = None
+            for future in self._replies.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection to the inference server lost"))
+
+    async def shutdown(self):
+        await super().shutdown()
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self.arena is not None:
+            self.arena.close()
+            self.arena = None
+
+    async def warm_up(self, seconds: float = 2.0, **options) -> float:
+        # the inference server warms its models up when it loads them
+        self.warmup_seconds = 0.0
+        return 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(super().stats(), in_flight=len(self._replies), socket=self.socket_path, **self._transport)
+
+    def cancel(self, session_id: str):
+        super().cancel(session_id)
+        if self._writer is not None:
+            asyncio.create_task(self._send_quietly({"op": "cancel", "session_id": session_id}))
+
+    async def _send_quietly(self, message: Dict[str, Any]):
+        try:
+            await send_message(self._writer, message)
+        except Exception:
+            pass
+
+    async def _execute(self, job: _Job):
+        if self._writer is None:
+            async with self._connect_lock:
+                if self._writer is None:
+                    self._transport["reconnects"] += 1
+                    await self._connect()
+        request_id = next(self._ids)
+        message = {"op": "transcribe", "id": request_id, "session_id": job.session_id, "options": job.options,
+                   "samples": len(job.audio)}
+        payload = b""
+        # one slot per running job: the dispatcher never runs more than `workers` at once
+        slot = self.arena.acquire() if len(job.audio) <= self.arena.slot_samples else None
+        if slot is not None:
+            self.arena.write(slot, job.audio)
+            message["slot"] = slot
+            self._transport["shared"] += 1
+        else:
+            payload = np.ascontiguousarray(job.audio, dtype=np.float32).tobytes()
+            message["inline"] = len(payload)
+            self._transport["inline"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._replies[request_id] = future
+        try:
+            await send_message(self._writer, message, payload)
+            try:
+                reply = await asyncio.wait_for(future, self.result_timeout)
+            except asyncio.TimeoutError:
+                raise RuntimeError(f"inference server did not answer within {self.result_timeout:g}s") from None
+        finally:
+            self._replies.pop(request_id, None)
+            if slot is not None:
+                self.arena.release(slot)
+        if reply.get("ok"):
+            return reply["segments"], reply["info"]
+        error = reply.get("error", "")
+        if error in ("superseded", "cancelled"):
+            raise JobSuperseded()
+        if error == "busy":
+            raise InferenceQueueFull("inference server busy")
+        raise RuntimeError(error or "inference server error")
@@ -1,9 +1,14 @@
 """STT wrapper (safe import)
 This module intentionally does NOT load the model at import time. Use
 load_whisper_model() to load and cache a model object, and transcribe_file()
-to run transcription.
+to run transcription. transcribe_pcm() runs a faster-whisper model on an
+in-memory PCM window and returns plain, picklable results, and
+StreamingTranscriber turns repeated passes over a growing window into a
+stable, committed transcript.
 """
-from typing import Any, Optional
+import copy
+import re
+from typing import Any, Dict, List, Optional, Tuple
 
 _model: Optional[Any] = None
 
@@ -25,3 +30,309 @@ def transcribe_file(path: str) -> str:
 		raise RuntimeError("model not loaded, call load_whisper_model() first")
 	res = _model.transcribe(path)
 	return res.get("text", "")
+
+
+def segment_to_dict(segment: Any) -> Dict[str, Any]:
+	"""Convert a faster-whisper Segment into a plain dict (safe to pickle across processes)."""
+	words = getattr(segment, "words", None)
+	return {
+		"id": getattr(segment, "id", 0),
+		"start": float(segment.start),
+		"end": float(segment.end),
+		"text": segment.text,
+		"avg_logprob": getattr(segment, "avg_logprob", None),
+		"no_speech_prob": getattr(segment, "no_speech_prob", None),
+		"words": None if words is None else [
+			{"start": float(w.start), "end": float(w.end), "word": w.word, "probability": w.probability}
+			for w in words
+		],
+	}
+
+def feature_size(model: Any) -> Optional[int]:
+	"""Number of mel bins the model's encoder takes (80, or 128 for large-v3), None if it has no FeatureExtractor."""
+	extractor = getattr(model, "feature_extractor", None)
+	filters = getattr(extractor, "mel_filters", None)
+	return int(filters.shape[0]) if filters is not None else None
+
+class _Precomputed:
+	"""Stands in for a model's FeatureExtractor during one transcribe() call and returns features computed elsewhere."""
+
+	def __init__(self, extractor: Any, features: Any):
+		self._extractor = extractor
+		self._features = features
+
+	def __getattr__(self, name: str) -> Any:
+		return getattr(self._extractor, name)
+
+	def __call__(self, waveform: Any, padding: int = 160, chunk_length: Optional[int] = None) -> Any:
+		return self._features
+
+def _usable(model: Any, audio: Any, features: Any) -> bool:
+	"""Precomputed features fit if they have the model's mel bins and one frame per 10 ms of audio, plus one."""
+	return features is not None and features.shape == (feature_size(model), len(audio) // 160 + 1)
+
+def transcribe_pcm(model: Any, audio: Any, features: Any = None, **options: Any) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+	"""
+	Transcribe a 16 kHz float32 PCM array with a faster-whisper model.
+	faster-whisper decodes lazily, so the segment generator is consumed here, inside
+	whichever thread or process runs the job, and never on the event loop.
+	`features` are the window's log-mel features if they were already computed (see
+	core.audio_processor.LogMelCache); transcribe() then skips its own extraction.
+	"""
+	if _usable(model, audio, features):
+		# transcribe() always runs self.feature_extractor(audio): hand it a shallow copy of
+		# the model whose extractor returns ours, the shared model stays untouched
+		model = copy.copy(model)
+		model.feature_extractor = _Precomputed(model.feature_extractor, features)
+	segments, info = model.transcribe(audio, **options)
+	results = [segment_to_dict(seg) for seg in segments]
+	return results, {"duration": getattr(info, "duration", None), "language": getattr(info, "language", None)}
+
+def batch_key(options: Dict[str, Any]) -> Optional[tuple]:
+	"""
+	Options that must match for windows to share one batched pass, or None if the
+	request cannot be batched. The initial prompt may differ per window.
+	"""
+	if options.get("vad_filter"):
+		return None
+	return tuple(sorted((k, repr(v)) for k, v in options.items() if k != "initial_prompt"))
+
+def transcribe_batch(model: Any, audios: List[Any], options_list: List[Dict[str, Any]],
+		features_list: Optional[List[Any]] = None) -> List[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+	"""
+	Transcribe several <= 30 s PCM windows (typically from different sessions) with one
+	batched encoder pass and one batched decoder call, like faster-whisper's
+	BatchedInferencePipeline but with a prompt per window. All windows must share
+	batch_key(); there is no temperature fallback, so the first temperature is used.
+	`features_list` may carry precomputed features per window (None where there are none).
+	Returns one (segments, info) pair per window, same shape as transcribe_pcm().
+	"""
+	import numpy as np
+	from faster_whisper.audio import pad_or_trim
+	from faster_whisper.tokenizer import Tokenizer
+	from faster_whisper.transcribe import get_suppressed_tokens
+
+	opts = options_list[0]
+	language = opts.get("language") or "en"
+	beam_size = opts.get("beam_size", 5)
+	temperature = opts.get("temperature", 0.0)
+	if isinstance(temperature, (list, tuple)):
+		temperature = temperature[0]
+	word_timestamps = opts.get("word_timestamps", False)
+
+	tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language=language)
+	features_list = features_list or [None] * len(audios)
+	features = np.stack([
+		pad_or_trim((f if _usable(model, audio, f) else model.feature_extractor(audio))[..., :-1])
+		for audio, f in zip(audios, features_list)
+	])
+	prompts = []
+	for o in options_list:
+		prompt_text = o.get("initial_prompt")
+		previous = tokenizer.encode(" " + prompt_text.strip()) if prompt_text else []
+		prompts.append(model.get_prompt(tokenizer, previous_tokens=previous, without_timestamps=False))
+
+	encoder_output = model.encode(features)
+	results = model.model.generate(
+		encoder_output,
+		prompts,
+		beam_size=beam_size,
+		max_length=model.max_length,
+		suppress_blank=True,
+		suppress_tokens=get_suppressed_tokens(tokenizer, [-1]),
+		return_scores=True,
+		return_no_speech_prob=True,
+		sampling_temperature=temperature,
+	)
+
+	batch_segments = []
+	segment_sizes = []
+	for audio, result in zip(audios, results):
+		tokens = result.sequences_ids[0]
+		duration = len(audio) / model.feature_extractor.sampling_rate
+		segment_size = min(int(np.ceil(duration * model.frames_per_second)), model.feature_extractor.nb_max_frames)
+		segment_sizes.append(segment_size)
+		avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+		if result.no_speech_prob > 0.6 and avg_logprob < -1.0:
+			# same silence rule as WhisperModel.transcribe's defaults
+			batch_segments.append([])
+			continue
+		subsegments, _, _ = model._split_segments_by_timestamps(
+			tokenizer=tokenizer, tokens=tokens, time_offset=0.0,
+			segment_size=segment_size, segment_duration=duration, seek=0,
+		)
+		for sub in subsegments:
+			sub["avg_logprob"] = avg_logprob
+			sub["no_speech_prob"] = result.no_speech_prob
+		batch_segments.append([s for s in subsegments if any(t < tokenizer.eot for t in s["tokens"])])
+
+	if word_timestamps and any(batch_segments):
+		aligned = [i for i, segs in enumerate(batch_segments) if segs]
+		model.add_word_timestamps(
+			[batch_segments[i] for i in aligned], tokenizer,
+			model.encode(features[aligned]) if len(aligned) < len(audios) else encoder_output,
+			[segment_sizes[i] for i in aligned],
+			"\"'“¿([{-", "\"'.。,，!！?？:：”)]}、", 0.0,
+		)
+
+	outputs = []
+	for audio, segs in zip(audios, batch_segments):
+		segments = []
+		for i, s in enumerate(segs):
+			text_tokens = [t for t in s["tokens"] if t < tokenizer.eot]
+			segments.append({
+				"id": i + 1,
+				"start": round(float(s["start"]), 3),
+				"end": round(float(s["end"]), 3),
+				"text": tokenizer.decode(text_tokens),
+				"avg_logprob": s["avg_logprob"],
+				"no_speech_prob": s["no_speech_prob"],
+				"words": s.get("words") if word_timestamps else None,
+			})
+		outputs.append((segments, {"duration": len(audio) / model.feature_extractor.sampling_rate, "language": language}))
+	return outputs
+
+
+def _norm_word(word: str) -> str:
+	return re.sub(r"[^\w']", "", word.lower())
+
+def segment_words(segments: List[Dict[str, Any]], offset: float = 0.0) -> List[Dict[str, Any]]:
+	"""
+	Flatten segments into words with absolute times (offset + relative time).
+	Segments without word timestamps get their words spread evenly over the segment.
+	"""
+	words = []
+	for seg in segments:
+		if seg.get("words"):
+			for w in seg["words"]:
+				words.append({"start": offset + w["start"], "end": offset + w["end"], "word": w["word"]})
+			continue
+		tokens = seg["text"].split()
+		if not tokens:
+			continue
+		step = (seg["end"] - seg["start"]) / len(tokens)
+		for i, tok in enumerate(tokens):
+			start = offset + seg["start"] + i * step
+			words.append({"start": start, "end": start + step, "word": " " + tok})
+	return words
+
+def words_text(words: List[Dict[str, Any]]) -> str:
+	return "".join(w["word"] for w in words).strip()
+
+
+class StreamingTranscriber:
+	"""
+	Incremental transcript for one stream using LocalAgreement-2 (as in whisper_streaming).
+
+	Each pass decodes only the audio after `committed_until`. A word is committed once two
+	consecutive hypotheses agree on it; committed words never change, so the transcript
+	only grows. The caller trims committed audio out of its buffer (see committed_until)
+	and passes prompt() as the initial prompt of the next pass, so the cost of a pass
+	depends on the uncommitted tail, not on how long the session has been running.
+	"""
+
+	def __init__(self, prompt_chars: int = 200):
+		self.prompt_chars = prompt_chars
+		self.committed: List[Dict[str, Any]] = []
+		self.committed_until = 0.0
+		self._hypothesis: List[Dict[str, Any]] = []
+		self._utterance_start = 0
+
+	@property
+	def text(self) -> str:
+		"""All committed text."""
+		return words_text(self.committed)
+
+	@property
+	def tail(self) -> str:
+		"""Latest uncommitted hypothesis."""
+		return words_text(self._hypothesis)
+
+	@property
+	def full_text(self) -> str:
+		return words_text(self.committed + self._hypothesis)
+
+	def prompt(self) -> str:
+		"""Committed text to condition the next pass on."""
+		return self.text[-self.prompt_chars:]
+
+	def insert(self, segments: List[Dict[str, Any]], offset: float) -> List[Dict[str, Any]]:
+		"""Add a new hypothesis for audio starting at stream time `offset`; return newly committed words."""
+		new = [w for w in segment_words(segments, offset) if w["start"] > self.committed_until - 0.1]
+		# the prompt makes Whisper repeat the last committed words now and then; drop that overlap
+		if new and self.committed and abs(new[0]["start"] - self.committed_until) < 1.0:
+			for n in range(min(len(self.committed), len(new), 5), 0, -1):
+				head = [_norm_word(w["word"]) for w in new[:n]]
+				last = [_norm_word(w["word"]) for w in self.committed[-n:]]
+				if head == last:
+					new = new[n:]
+					break
+		commit = []
+		for old, word in zip(self._hypothesis, new):
+			if _norm_word(old["word"]) != _norm_word(word["word"]):
+				break
+			commit.append(word)
+		self._hypothesis = new[len(commit):]
+		self._commit(commit)
+		return commit
+
+	def force_commit(self, until: float) -> List[Dict[str, Any]]:
+		"""Commit hypothesis words ending before stream time `until` (used when the buffer is about to overflow)."""
+		commit = []
+		while self._hypothesis and self._hypothesis[0]["end"] <= until:
+			commit.append(self._hypothesis.pop(0))
+		self._commit(commit)
+		return commit
+
+	def finish(self, until: Optional[float] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+		"""
+		End the current utterance: commit whatever hypothesis is left. `until` marks audio up to
+		that stream time as done even if no word reached it (e.g. trailing silence).
+		Returns (newly committed words, all words of the utterance since the previous finish()).
+		"""
+		commit = self._hypothesis
+		self._hypothesis = []
+		self._commit(commit)
+		if until is not None:
+			self.committed_until = max(self.committed_until, until)
+		utterance = self.committed[self._utterance_start:]
+		self._utterance_start = len(self.committed)
+		return commit, utterance
+
+	def replace(self, start: float, end: float, words: List[Dict[str, Any]]) -> Tuple[int, int, List[Dict[str, Any]]]:
+		"""
+		Swap the committed words of a finished utterance (those starting between stream times
+		`start` and `end`) for `words`, e.g. its second-pass decode; words overlapping the next
+		utterance are left out. Returns (index of the first replaced word, number of words
+		removed, words inserted); (-1, 0, []) if no committed word is in the range.
+		"""
+		found = [i for i, w in enumerate(self.committed[:self._utterance_start]) if start - 0.01 <= w["start"] <= end + 0.01]
+		if not found:
+			return -1, 0, []
+		first, last = found[0], found[-1] + 1
+		if last < len(self.committed):
+			words = [w for w in words if w["start"] < self.committed[last]["start"]]
+		self.committed[first:last] = words
+		self._utterance_start += len(words) - (last - first)
+		return first, last - first, words
+
+	def state(self) -> Dict[str, Any]:
+		"""Everything needed to continue this transcript elsewhere (JSON-serializable)."""
+		def plain(words):
+			return [{"start": float(w["start"]), "end": float(w["end"]), "word": str(w["word"])} for w in words]
+		return {"committed": plain(self.committed), "committed_until": float(self.committed_until),
+				"hypothesis": plain(self._hypothesis), "utterance_start": int(self._utterance_start)}
+
+	@classmethod
+	def from_state(cls, state: Dict[str, Any], prompt_chars: int = 200) -> "StreamingTranscriber":
+		transcriber = cls(prompt_chars)
+		transcriber.committed = list(state["committed"])
+		transcriber.committed_until = float(state["committed_until"])
+		transcriber._hypothesis = list(state["hypothesis"])
+		transcriber._utterance_start = int(state["utterance_start"])
+		return transcriber
+
+	def _commit(self, words: List[Dict[str, Any]]):
+		if words:
+			self.committed.extend(words)
+			self.committed_until = max(self.committed_until, words[-1]["end"])
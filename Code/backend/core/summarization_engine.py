@@ -1 +1,206 @@
-#Summarization model (LLM, T5, v.v.)
\ No newline at end of file
+#Summarization model (LLM, T5, v.v.)
+# backend/core/summarization_engine.py
+import hashlib
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from utils.timer import timed_fn
+
+CHUNK_INSTRUCTION = ("Summarize this part of a conversation transcript in a few short sentences. "
+                     "Keep important points, decisions and speaker actions.")
+REDUCE_INSTRUCTION = ("Merge these partial summaries of one conversation, in order, into a single short, clear "
+                      "paragraph. Keep important points, decisions and speaker actions.")
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class SummaryBackend(ABC):
+    """
+    A summarizer. `summarize` takes a batch of texts and returns one summary per text;
+    it is blocking and is called from a worker thread, never on the event loop.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def summarize(self, texts: List[str], instruction: str) -> List[str]:
+        """One summary of each of `texts`, in order, following `instruction`."""
+
+
+class StubBackend(SummaryBackend):
+    """Local, deterministic stand-in for tests and offline runs: keeps the leading sentences of each text."""
+
+    name = "stub"
+
+    def __init__(self, max_words: int = 40):
+        self.max_words = max_words
+        self.calls = 0
+
+    def summarize(self, texts: List[str], instruction: str) -> List[str]:
+        self.calls += 1
+        out = []
+        for text in texts:
+            words = []
+            for sentence in _SENTENCE_END.split(text.strip()):
+                if words and len(words) + len(sentence.split()) > self.max_words:
+                    break
+                words += sentence.split()
+            out.append(" ".join(words[:self.max_words]))
+        return out
+
+
+class OpenAIBackend(SummaryBackend):
+    """Chat-completions backend (what the Streamlit button uses)."""
+
+    name = "openai"
+
+    def __init__(self, model: str = "gpt-4o-mini", api_key: Optional[str] = None, max_tokens: int = 300):
+        from openai import OpenAI  # optional dependency, only needed for this backend
+        self.client = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
+        self.model = model
+        self.max_tokens = max_tokens
+
+    def summarize(self, texts: List[str], instruction: str) -> List[str]:
+        out = []
+        for text in texts:
+            resp = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": "You are a concise summarization assistant."},
+                    {"role": "user", "content": instruction},
+                    {"role": "user", "content": text},
+                ],
+                max_tokens=self.max_tokens,
+                temperature=0.2,
+            )
+            out.append(resp.choices[0].message.content.strip())
+        return out
+
+
+class LocalBackend(SummaryBackend):
+    """Offline backend on the shared, int8-quantized local seq2seq model (models/load_summary_model.py)."""
+
+    name = "local"
+
+    def __init__(self, model_name: Optional[str] = None, **kwargs):
+        from models.load_summary_model import DEFAULT_SUMMARY_MODEL, get_summary_model
+        self.model = get_summary_model(model_name or DEFAULT_SUMMARY_MODEL, **kwargs)
+        self.name = f"local:{self.model.model_name}"
+
+    def summarize(self, texts: List[str], instruction: str) -> List[str]:
+        return self.model.summarize(texts, instruction)
+
+
+BACKENDS: Dict[str, Callable[..., SummaryBackend]] = {
+    "stub": StubBackend,
+    "openai": OpenAIBackend,
+    "local": LocalBackend,
+}
+
+def get_backend(name: str, **kwargs) -> SummaryBackend:
+    try:
+        factory = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"unknown summary backend: {name} (known: {', '.join(sorted(BACKENDS))})") from None
+    return factory(**kwargs)
+
+
+def split_chunks(text: str, chunk_chars: int = 2000) -> List[str]:
+    """Split text into chunks of at most ~chunk_chars, on sentence boundaries where possible."""
+    chunks, current = [], ""
+    for sentence in _SENTENCE_END.split(text.strip()):
+        while len(sentence) > chunk_chars:
+            # one very long "sentence" (no punctuation from the recognizer): cut at a space
+            cut = sentence.rfind(" ", 0, chunk_chars)
+            cut = cut if cut > 0 else chunk_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > chunk_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class SummarizationEngine:
+    """
+    Map-reduce summarization over transcript chunks with a content-hash cache.
+
+    map: every chunk is summarized on its own; results are cached by a hash of
+    (backend, instruction, text), so a chunk that was summarized once is never sent to
+    the backend again. reduce: summaries are merged in groups of about `chunk_chars`,
+    repeating until a single summary is left.
+    """
+
+    def __init__(self, backend: SummaryBackend, chunk_chars: int = 2000, cache_size: int = 4096):
+        self.backend = backend
+        self.chunk_chars = chunk_chars
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"cache_hits": 0, "cache_misses": 0, "backend_calls": 0}
+
+    def _key(self, text: str, instruction: str) -> str:
+        return hashlib.sha256(f"{self.backend.name}\0{instruction}\0{text}".encode("utf-8")).hexdigest()
+
+    def _summarize_cached(self, texts: List[str], instruction: str) -> List[str]:
+        keys = [self._key(t, instruction) for t in texts]
+        results: List[Optional[str]] = [None] * len(texts)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    results[i] = self._cache[key]
+                    self.stats["cache_hits"] += 1
+                else:
+                    missing.append(i)
+                    self.stats["cache_misses"] += 1
+        if missing:
+            # one backend call for everything that is not cached
+            summaries = self.backend.summarize([texts[i] for i in missing], instruction)
+            with self._lock:
+                self.stats["backend_calls"] += 1
+                for i, summary in zip(missing, summaries):
+                    results[i] = summary
+                    self._cache[keys[i]] = summary
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return results
+
+    @timed_fn("summarize_map")
+    def summarize_chunks(self, chunks: List[str]) -> List[str]:
+        """map step"""
+        return self._summarize_cached(chunks, CHUNK_INSTRUCTION)
+
+    @timed_fn("summarize_reduce")
+    def reduce(self, summaries: List[str]) -> str:
+        """reduce step: merge summaries (oldest first) into one"""
+        summaries = [s for s in summaries if s]
+        while len(summaries) > 1:
+            # groups of at least two summaries (only the last may be alone), so every round shrinks the list
+            groups, current, size = [], [], 0
+            for summary in summaries:
+                if len(current) >= 2 and size + len(summary) > self.chunk_chars:
+                    groups.append(current)
+                    current, size = [], 0
+                current.append(summary)
+                size += len(summary) + 2
+            groups.append(current)
+            merged = iter(self._summarize_cached(["\n\n".join(g) for g in groups if len(g) > 1], REDUCE_INSTRUCTION))
+            summaries = [next(merged) if len(g) > 1 else g[0] for g in groups]
+        return summaries[0] if summaries else ""
+
+    def summarize(self, text: str) -> str:
+        """Summarize a whole transcript in one go."""
+        return self.reduce(self.summarize_chunks(split_chunks(text, self.chunk_chars)))
@@ -1 +1,250 @@
-# Parallel running worker for summarization tasks 
\ No newline at end of file
+# Parallel running worker for summarization tasks
+# backend/core/summarization_worker.py
+#
+#   cd Code/backend && python -m core.summarization_worker
+#
+# Subscribes to the "transcripts" channel the WebSocket server publishes to and keeps a
+# rolling summary per session in Redis (key summary:<session_id>, channel "summaries").
+# Transcript messages carry only newly committed segments (core/transcript_store.py);
+# a gap in their sequence numbers is filled from the session's segment stream.
+import asyncio
+import json
+import os
+import signal
+import time
+from typing import Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+from core.summarization_engine import SummarizationEngine, get_backend, split_chunks
+from core.transcript_store import TRANSCRIPTS_CHANNEL, TranscriptStore, apply_segments
+from utils.logger import get_logger
+from utils.timer import forget_session, timed_fn
+
+log = get_logger("summarization_worker")
+SUMMARIES_CHANNEL = "summaries"
+
+
+class _SessionState:
+    __slots__ = ("committed", "segments", "seq", "resync", "consumed", "passes", "chunk_summaries", "summary",
+                 "stale", "rollbacks", "final", "first_update", "last_update", "task")
+
+    def __init__(self):
+        self.committed = ""      # latest committed transcript of the session
+        self.segments: Dict[int, str] = {}  # its segment texts by seq, in transcript order
+        self.seq = 0             # last transcript segment applied to `segments`
+        self.resync = False      # segments were missed, read them from the store before the next pass
+        self.consumed = 0        # chars of `committed` already turned into chunks
+        self.passes: List[Tuple[int, int]] = []  # (consumed, len(chunk_summaries)) after each pass
+        self.chunk_summaries: List[str] = []
+        self.summary = ""
+        self.stale = False       # chunk summaries were dropped, the summary needs another reduce
+        self.rollbacks = 0
+        self.final = False
+        self.first_update: Optional[float] = None  # first update not summarized yet
+        self.last_update = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+
+class SummarizationWorker:
+    """
+    Keeps a rolling summary per session from the committed transcript text.
+
+    Updates are debounced per session: a summary pass runs once the session has been
+    quiet for `debounce` seconds, at the latest `max_delay` seconds after the first
+    unsummarized update, and right away on a final. A pass only looks at committed text
+    it has not seen: complete sentences adding up to `min_chunk_chars` or more become new
+    chunks (everything left on a final), each chunk is summarized once (map), and the
+    chunk summaries are merged into the session summary (reduce; merges of unchanged
+    groups come from the engine's cache). When text that was already summarized changes
+    (a second-pass segment replaced it), the chunks from there on are summarized again.
+    """
+
+    def __init__(self, redis, engine: SummarizationEngine, debounce: float = 3.0, max_delay: float = 15.0,
+                 min_chunk_chars: int = 300, idle_expiry: float = 3600.0):
+        self.redis = redis
+        self.engine = engine
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.min_chunk_chars = min_chunk_chars
+        self.idle_expiry = idle_expiry
+        self.sessions: Dict[str, _SessionState] = {}
+        self.transcripts = TranscriptStore(redis)
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(TRANSCRIPTS_CHANNEL)
+        log.info("Summarization worker listening on '%s' (%s backend)", TRANSCRIPTS_CHANNEL, self.engine.backend.name)
+        try:
+            while not self._stopping.is_set():
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is not None and message.get("type") == "message":
+                    self.handle(message["data"])
+                self._expire_idle()
+        finally:
+            await pubsub.unsubscribe(TRANSCRIPTS_CHANNEL)
+            await pubsub.aclose()
+            tasks = [s.task for s in self.sessions.values() if s.task is not None]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def handle(self, data):
+        try:
+            payload = json.loads(data)
+            session_id = payload["session_id"]
+        except (ValueError, KeyError, TypeError):
+            return
+        state = self.sessions.setdefault(session_id, _SessionState())
+        if "segments" in payload:
+            committed = self._apply_segments(state, payload)
+        else:
+            # older publishers send the whole transcript; without a committed field use it as is
+            committed = payload.get("committed", payload.get("transcript", "")) or ""
+        if not committed.startswith(state.committed[:state.consumed]):
+            # summarized text changed (replaced by a second pass, or the session id was reused)
+            self._roll_back(state, committed)
+        now = time.monotonic()
+        if committed != state.committed or payload.get("final"):
+            state.committed = committed
+            state.final = state.final or bool(payload.get("final"))
+            state.first_update = state.first_update or now
+        state.last_update = now
+        if state.first_update is not None and (state.task is None or state.task.done()):
+            state.task = asyncio.create_task(self._debounced(session_id, state))
+
+    def _apply_segments(self, state: _SessionState, payload) -> str:
+        """The session's committed text with the segments of a delta message appended."""
+        segments = payload["segments"]
+        if not segments:
+            return state.committed
+        first = int(segments[0]["seq"])
+        if first == 1 and state.seq >= 1:
+            # a new transcript under the same session id
+            state.segments, state.seq, state.resync = {}, 0, False
+        elif state.resync or first > state.seq + 1:
+            # missed a message: the next pass reads the gap from the store
+            state.resync = True
+            return state.committed
+        fresh = [seg for seg in segments if int(seg["seq"]) > state.seq]
+        if fresh:
+            state.seq = int(fresh[-1]["seq"])
+            apply_segments(state.segments, fresh)
+        return "".join(state.segments.values()).strip()
+
+    async def _resync(self, session_id: str, state: _SessionState):
+        segments = await self.transcripts.read_segments(session_id, state.seq)
+        if segments:
+            apply_segments(state.segments, segments)
+            committed = "".join(state.segments.values()).strip()
+            if not committed.startswith(state.committed[:state.consumed]):
+                self._roll_back(state, committed)
+            state.committed = committed
+            state.seq = segments[-1]["seq"]
+        state.resync = False
+
+    @staticmethod
+    def _roll_back(state: _SessionState, committed: str):
+        """Forget the chunks that no longer match `committed`; they are summarized again on the next pass."""
+        unchanged = len(os.path.commonprefix([state.committed[:state.consumed], committed]))
+        while state.passes and state.passes[-1][0] > unchanged:
+            state.passes.pop()
+        state.consumed, kept = state.passes[-1] if state.passes else (0, 0)
+        del state.chunk_summaries[kept:]
+        state.stale = True
+        state.rollbacks += 1
+
+    async def _debounced(self, session_id: str, state: _SessionState):
+        # updates that arrive during a pass set first_update again and get their own pass
+        while state.first_update is not None:
+            now = time.monotonic()
+            due = min(state.last_update + self.debounce, state.first_update + self.max_delay)
+            if not state.final and now < due:
+                await asyncio.sleep(due - now)
+                continue
+            try:
+                await self.summarize_session(session_id, state)
+            except Exception as e:
+                log.warning("Summarization error for session %s: %s", session_id, e)
+
+    def _take_new_text(self, state: _SessionState, final: bool) -> str:
+        pending = state.committed[state.consumed:]
+        if not final:
+            # stop at the last sentence end so a chunk never splits a sentence
+            end = max(pending.rfind(". "), pending.rfind("? "), pending.rfind("! "))
+            if pending.rstrip().endswith((".", "?", "!")):
+                end = len(pending.rstrip()) - 1
+            if end < 0 or end + 1 < self.min_chunk_chars:
+                return ""
+            pending = pending[:end + 1]
+        state.consumed += len(pending)
+        return pending.strip()
+
+    @timed_fn("summarize")
+    async def summarize_session(self, session_id: str, state: _SessionState):
+        state.first_update = None
+        if state.resync:
+            await self._resync(session_id, state)
+        final, state.final = state.final, False
+        new_text = self._take_new_text(state, final)
+        if not new_text and not final and not state.stale:
+            return
+        if new_text:
+            chunks = split_chunks(new_text, self.engine.chunk_chars)
+            rollbacks = state.rollbacks
+            summaries = await asyncio.to_thread(self.engine.summarize_chunks, chunks)
+            if state.rollbacks != rollbacks:
+                # the text changed meanwhile; the next pass starts where it was rolled back to
+                state.final = state.final or final
+                return
+            state.chunk_summaries += summaries
+            state.passes.append((state.consumed, len(state.chunk_summaries)))
+        if new_text or state.stale:
+            state.stale = False
+            state.summary = await asyncio.to_thread(self.engine.reduce, state.chunk_summaries)
+        record = {"session_id": session_id, "summary": state.summary, "chunks": len(state.chunk_summaries),
+                  "summarized_chars": state.consumed, "final": final, "ts": int(time.time())}
+        await self.redis.set(f"summary:{session_id}", json.dumps(record))
+        await self.redis.publish(SUMMARIES_CHANNEL, json.dumps(record))
+
+    def _expire_idle(self):
+        cutoff = time.monotonic() - self.idle_expiry
+        for session_id in [sid for sid, s in self.sessions.items()
+                           if s.last_update < cutoff and (s.task is None or s.task.done())]:
+            del self.sessions[session_id]
+            forget_session(session_id)
+
+
+async def main():
+    load_dotenv()
+    redis_client = aioredis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+    backend = get_backend(os.getenv("SUMMARY_BACKEND", "stub"))
+    engine = SummarizationEngine(backend, chunk_chars=int(os.getenv("SUMMARY_CHUNK_CHARS", "2000")))
+    worker = SummarizationWorker(
+        redis_client, engine,
+        debounce=float(os.getenv("SUMMARY_DEBOUNCE_SECONDS", "3")),
+        max_delay=float(os.getenv("SUMMARY_MAX_DELAY_SECONDS", "15")),
+        min_chunk_chars=int(os.getenv("SUMMARY_MIN_CHUNK_CHARS", "300")),
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except NotImplementedError:
+            pass
+    try:
+        await worker.run()
+    finally:
+        log.info("Summarization worker stopping: %s", engine.stats)
+        if hasattr(backend, "model"):
+            log.info("Summary model: %s", backend.model.info())
+        await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
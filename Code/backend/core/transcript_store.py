@@ -0,0 +1,190 @@
+#Delta-based transcript persistence in Redis
+# backend/core/transcript_store.py
+#
+# Per session:
+#   transcript:<session_id>:segments  stream of committed segments, entry id "<seq>-0",
+#                                     fields seq, text, start, end, final, ts (and replaces)
+#   transcript:<session_id>:partial   the current uncommitted tail (overwritten)
+# and on the "transcripts" channel one message per update with only what is new:
+#   {"session_id", "seq": <last committed seq>, "segments": [{"seq", "text", "start", "end", "final"}],
+#    "tail": "<uncommitted>", "final": bool, "ts"}
+# Segment texts keep their leading space, so the transcript is "".join(texts).strip(). A
+# segment with "replaces": [first, last] (a second-pass decode of an utterance) takes the
+# place of the segments first..last; apply_segments()/join_segments() handle that.
+# Expects a client created with decode_responses=True.
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+TRANSCRIPTS_CHANNEL = "transcripts"
+
+
+def segments_key(session_id: str) -> str:
+    return f"transcript:{session_id}:segments"
+
+def partial_key(session_id: str) -> str:
+    return f"transcript:{session_id}:partial"
+
+def apply_segments(texts: Dict[int, str], segments: List[Dict[str, Any]]) -> Dict[int, str]:
+    """Add segments (in seq order) to `texts`, seq -> text in transcript order; a replacing segment takes the place of the ones it replaces."""
+    for seg in segments:
+        replaces = seg.get("replaces")
+        if replaces and any(replaces[0] <= seq <= replaces[1] for seq in texts):
+            replaced = dict(texts)
+            texts.clear()
+            for seq, text in replaced.items():
+                if not replaces[0] <= seq <= replaces[1]:
+                    texts[seq] = text
+                elif seg["seq"] not in texts:
+                    texts[seg["seq"]] = seg["text"]
+        else:
+            texts[seg["seq"]] = seg["text"]
+    return texts
+
+def join_segments(segments: List[Dict[str, Any]]) -> str:
+    return "".join(apply_segments({}, segments).values()).strip()
+
+
+class TranscriptStore:
+    """
+    Appends committed segments to a per-session Redis stream and keeps the uncommitted tail
+    in a small key that is overwritten, so the cost of an update depends on what changed,
+    not on how long the session has been running. All writes of an update go out in one
+    pipeline. Sequence numbers start at 1 per session and double as the stream entry ids,
+    which lets a subscriber that missed a message read exactly the gap (read_segments).
+    """
+
+    def __init__(self, redis, ttl_seconds: float = 86400.0, channel: str = TRANSCRIPTS_CHANNEL):
+        self.redis = redis
+        self.ttl = int(ttl_seconds)
+        self.channel = channel
+
+    async def append(self, session_id: str, segments: List[Dict[str, Any]], first_seq: int,
+                     tail: str = "", final: bool = False) -> Dict[str, Any]:
+        """
+        Store `segments` (dicts with text, start, end) as seq first_seq, first_seq + 1, ...,
+        overwrite the tail and publish the delta. Returns the published message.
+        """
+        now = int(time.time())
+        records = []
+        pipe = self.redis.pipeline(transaction=False)
+        for i, seg in enumerate(segments):
+            record = {"seq": first_seq + i, "text": seg["text"], "start": round(float(seg["start"]), 3),
+                      "end": round(float(seg["end"]), 3), "final": int(bool(final and i == len(segments) - 1))}
+            records.append(record)
+            pipe.xadd(segments_key(session_id), dict(record, ts=now), id=f"{record['seq']}-0")
+        if segments:
+            pipe.expire(segments_key(session_id), self.ttl)
+        pipe.set(partial_key(session_id), tail, ex=self.ttl)
+        message = {"session_id": session_id, "seq": first_seq + len(segments) - 1, "segments": records,
+                   "tail": tail, "final": final, "ts": now}
+        pipe.publish(self.channel, json.dumps(message))
+        await pipe.execute()
+        return message
+
+    async def replace(self, session_id: str, start: float, end: float, segment: Dict[str, Any], seq: int,
+                      tail: str = "", scan: int = 64) -> Optional[Dict[str, Any]]:
+        """
+        Store `segment` as seq `seq` in place of the stored segments between stream times
+        `start` and `end` (looking at the latest `scan` ones) and publish it. None if no
+        stored segment is in that range.
+        """
+        entries = await self.redis.xrevrange(segments_key(session_id), count=scan)
+        seqs = [int(fields["seq"]) for _, fields in entries
+                if float(fields["start"]) >= start - 0.01 and float(fields["end"]) <= end + 0.01]
+        if not seqs:
+            return None
+        now = int(time.time())
+        record = {"seq": seq, "text": segment["text"], "start": round(float(segment["start"]), 3),
+                  "end": round(float(segment["end"]), 3), "final": 1, "replaces": [min(seqs), max(seqs)]}
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.xadd(segments_key(session_id), dict(record, replaces=f"{min(seqs)}-{max(seqs)}", ts=now), id=f"{seq}-0")
+        pipe.expire(segments_key(session_id), self.ttl)
+        message = {"session_id": session_id, "seq": seq, "segments": [record], "tail": tail, "final": True, "ts": now}
+        pipe.publish(self.channel, json.dumps(message))
+        await pipe.execute()
+        return message
+
+    async def last_seq(self, session_id: str) -> int:
+        entries = await self.redis.xrevrange(segments_key(session_id), count=1)
+        return int(entries[0][1]["seq"]) if entries else 0
+
+    async def read_segments(self, session_id: str, after_seq: int = 0, count: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Committed segments with seq > after_seq, in order."""
+        entries = await self.redis.xrange(segments_key(session_id), min=f"{after_seq + 1}-0", count=count)
+        return [_segment(fields) for _, fields in entries]
+
+    async def tail(self, session_id: str) -> str:
+        return await self.redis.get(partial_key(session_id)) or ""
+
+    async def rebuild(self, session_id: str, with_tail: bool = False) -> str:
+        """The full transcript of a session from its stored segments (plus the current tail)."""
+        text = join_segments(await self.read_segments(session_id))
+        if with_tail:
+            text = f"{text} {await self.tail(session_id)}".strip()
+        return text
+
+    async def delete(self, session_id: str):
+        await self.redis.delete(segments_key(session_id), partial_key(session_id))
+
+
+class TranscriptWriter:
+    """
+    Tracks what of one session's StreamingTranscriber has been stored: each sync() writes the
+    words committed since the previous one as a single segment, plus the current tail.
+    """
+
+    def __init__(self, store: TranscriptStore, session_id: str):
+        self.store = store
+        self.session_id = session_id
+        self.seq = 0
+        self.words_done = 0
+        self._started = False
+
+    def state(self) -> Dict[str, Any]:
+        return {"seq": self.seq, "words_done": self.words_done}
+
+    def restore(self, state: Dict[str, Any]):
+        """Continue a transcript that was already being written (a resumed session)."""
+        self.seq = int(state["seq"])
+        self.words_done = int(state["words_done"])
+        self._started = True
+
+    async def sync(self, transcriber, final: bool = False) -> Optional[Dict[str, Any]]:
+        if not self._started:
+            # a new session under an old id starts a new transcript
+            await self.store.delete(self.session_id)
+            self._started = True
+        words = transcriber.committed[self.words_done:]
+        segments = []
+        if words:
+            segments.append({"text": "".join(w["word"] for w in words), "start": words[0]["start"], "end": words[-1]["end"]})
+        message = await self.store.append(self.session_id, segments, self.seq + 1, tail=transcriber.tail, final=final)
+        self.words_done += len(words)
+        self.seq += len(segments)
+        return message
+
+    async def replace(self, transcriber, first: int, removed: int, words: List[Dict[str, Any]], start: float,
+                      end: float) -> Optional[Dict[str, Any]]:
+        """
+        The transcriber's committed words first..first + removed, spoken between `start` and
+        `end`, were swapped for `words` (StreamingTranscriber.replace): store those in place of
+        the segments that held the old ones. Words not stored yet are left to the next sync().
+        """
+        if self.words_done <= first:
+            return None
+        self.words_done = max(first + len(words), self.words_done + len(words) - removed)
+        segment = {"text": "".join(w["word"] for w in words),
+                   "start": words[0]["start"] if words else start, "end": words[-1]["end"] if words else end}
+        message = await self.store.replace(self.session_id, start, end, segment, self.seq + 1, tail=transcriber.tail)
+        if message is not None:
+            self.seq += 1
+        return message
+
+
+def _segment(fields: Dict[str, Any]) -> Dict[str, Any]:
+    segment = {"seq": int(fields["seq"]), "text": fields["text"], "start": float(fields["start"]),
+               "end": float(fields["end"]), "final": bool(int(fields.get("final", 0)))}
+    if fields.get("replaces"):
+        segment["replaces"] = [int(seq) for seq in fields["replaces"].split("-")]
+    return segment
\ No newline at end of file
@@ -0,0 +1,147 @@
+#Standalone transcription worker: consumes audio windows from the Redis job stream
+# backend/core/transcription_worker.py
+#
+#   cd Code/backend && python -m core.transcription_worker
+#
+# Run as many of these as needed, on any box that can reach Redis; the WebSocket front
+# end sends them work when started with INFERENCE_MODE=remote.
+import asyncio
+import os
+import signal
+import socket
+import time
+from typing import Any, Dict
+
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+from core.batch_scheduler import BatchScheduler
+from core.inference_executor import InferenceExecutor, JobSuperseded
+from core.redis_queue import TranscriptionQueue
+from models.load_whisper import get_model, release_model
+from utils.logger import get_logger
+
+log = get_logger("transcription_worker")
+
+
+class TranscriptionWorker:
+    """
+    Pulls jobs from a TranscriptionQueue, runs them on a local executor (which loads the
+    model once, and batches across sessions if it is a BatchScheduler) and publishes each
+    result to the job's reply channel before acknowledging the entry.
+
+    Up to `concurrency` jobs are held at once, so a batching executor has windows to merge.
+    """
+
+    def __init__(self, queue: TranscriptionQueue, executor: InferenceExecutor, consumer: str, concurrency: int = 2):
+        self.queue = queue
+        self.executor = executor
+        self.consumer = consumer
+        self.concurrency = max(1, int(concurrency))
+        self._tasks = set()
+        self._stopping = asyncio.Event()
+        self._stats = {"ok": 0, "error": 0, "expired": 0, "superseded": 0}
+
+    def stop(self):
+        self._stopping.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats, in_progress=len(self._tasks), consumer=self.consumer)
+
+    async def run(self):
+        await self.queue.ensure_group()
+        log.info("Worker %s consuming %s (group %s)", self.consumer, self.queue.stream, self.queue.group)
+        while not self._stopping.is_set():
+            free = self.concurrency - len(self._tasks)
+            if free <= 0:
+                await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            try:
+                jobs = await self.queue.read(self.consumer, count=free, block_ms=1000)
+            except Exception as e:
+                log.warning("Queue read error: %s", e)
+                await asyncio.sleep(1.0)
+                continue
+            for entry_id, job in jobs:
+                task = asyncio.create_task(self._handle(entry_id, job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        # finish what we hold; anything unacknowledged is retried by another worker
+        if self._tasks:
+            await asyncio.wait(self._tasks)
+
+    async def _handle(self, entry_id: str, job: Dict[str, Any]):
+        if job["expires_at"] < time.time():
+            # the front end stopped waiting for this window
+            result = {"status": "expired", "error": "job expired before a worker picked it up"}
+        else:
+            try:
+                segments, info = await self.executor.submit(job["session_id"], job["audio"], **job["options"])
+                result = {"status": "ok", "segments": segments, "info": info}
+            except JobSuperseded:
+                result = {"status": "superseded"}
+            except Exception as e:
+                result = {"status": "error", "error": f"transcription error: {e}"}
+        self._stats[result["status"]] += 1
+        try:
+            await self.queue.publish_result(job, result)
+            await self.queue.ack(entry_id)
+        except Exception as e:
+            log.warning("Could not complete job %s: %s", job["job_id"], e)
+
+
+async def main():
+    load_dotenv()
+    redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    model_size = os.getenv("MODEL_SIZE", "tiny.en")
+    device = os.getenv("WHISPER_DEVICE", "cpu")
+    compute_type = os.getenv("WHISPER_COMPUTE", "int8")
+    mode = os.getenv("INFERENCE_MODE", "thread")
+    if mode == "remote":
+        mode = "thread"  # the front end's setting, workers always run the model themselves
+    workers = int(os.getenv("INFERENCE_WORKERS", "1"))
+    batch_size = int(os.getenv("INFERENCE_BATCH_SIZE", "1"))
+    concurrency = int(os.getenv("WORKER_CONCURRENCY", str(workers * max(1, batch_size) * 2)))
+    consumer = os.getenv("WORKER_NAME", f"{socket.gethostname()}-{os.getpid()}")
+
+    num_workers = workers if mode == "thread" else 1
+    loader_args = (model_size, device, compute_type)
+    if batch_size > 1:
+        executor = BatchScheduler(get_model, loader_args, {"num_workers": num_workers}, mode=mode,
+                                  workers=workers, max_pending=concurrency, model_release=release_model,
+                                  max_batch_size=batch_size, max_wait_ms=float(os.getenv("INFERENCE_BATCH_WAIT_MS", "20")))
+    else:
+        executor = InferenceExecutor(get_model, loader_args, {"num_workers": num_workers}, mode=mode,
+                                     workers=workers, max_pending=concurrency, model_release=release_model)
+    log.info("Loading faster-whisper model: %s (%s x%d, batch %d)", model_size, mode, workers, batch_size)
+    await executor.start()
+    log.info("Model loaded in %.1fs", executor.load_seconds)
+    if os.getenv("WARMUP_ENABLED", "1") not in ("0", "false", "False"):
+        # before joining the consumer group, so no job waits for a cold model
+        elapsed = await executor.warm_up(float(os.getenv("WARMUP_SECONDS", "2.0")),
+                                         beam_size=int(os.getenv("BEAM_SIZE", "5")), word_timestamps=True)
+        log.info("Warm-up decode took %.2fs", elapsed)
+
+    redis_client = aioredis.from_url(redis_url, decode_responses=False)
+    queue = TranscriptionQueue(
+        redis_client,
+        claim_idle_ms=int(os.getenv("QUEUE_CLAIM_IDLE_MS", "30000")),
+        max_deliveries=int(os.getenv("QUEUE_MAX_DELIVERIES", "3")),
+    )
+    worker = TranscriptionWorker(queue, executor, consumer, concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except NotImplementedError:
+            pass
+    try:
+        await worker.run()
+    finally:
+        log.info("Worker stopping: %s", worker.stats())
+        await executor.shutdown()
+        await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
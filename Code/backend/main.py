@@ -2,31 +2,144 @@
 import os
 import asyncio
 import json
-import tempfile
 import time
-from pathlib import Path
-from typing import Optional, List
+import uuid
+from collections import Counter
+from typing import Optional
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
 import redis.asyncio as aioredis
 from dotenv import load_dotenv
 
-from models.load_whisper import get_model
-from core.audio_processor import webm_bytes_to_wav_file
+from api import rest
+from models.load_whisper import get_model, get_model_pool, release_model
+from core.admission import AdmissionRejected, CapacityManager
+from core.audio_processor import HOP_LENGTH, EnergyVAD, FrameDecoder, LogMelCache, StreamingDecoder
+from core.inference_executor import INFERENCE_SECONDS, InferenceExecutor, InferenceQueueFull, JobSuperseded
+from core.batch_scheduler import BatchScheduler
+from core.decoding_policy import DecodingPolicy, default_levels
+from core.redis_queue import RemoteExecutor
+from core.result_cache import ResultCache
+from core.second_pass import SecondPass
+from core.session_store import SessionTakenOver, create_session_store
+from core.shm_channel import DEFAULT_SOCKET, SharedMemoryExecutor
+from core.stt_engine import StreamingTranscriber, segment_words, words_text
+from core.transcript_store import TranscriptStore, TranscriptWriter, join_segments
+from utils.chunk_utils import PCMRingBuffer
+from utils.logger import get_logger
+from utils.timer import REGISTRY, forget_session, timed
 
 load_dotenv()
+log = get_logger("server")
+# uvicorn imports this module right after the interpreter starts; readiness is timed from here
+PROCESS_STARTED = time.monotonic()
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+TRANSCRIPT_TTL_SECONDS = float(os.getenv("TRANSCRIPT_TTL_SECONDS", "86400"))  # stored transcripts expire after this
+# session state (audio tail, transcript, offsets) is checkpointed to SESSION_STORE, so a client
+# that reconnects with the same session_id resumes where it left off: "memory" works within
+# one process, "redis" across all uvicorn workers behind a load balancer
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "600"))  # idle sessions are forgotten after this
+SESSION_CHECKPOINT_SECONDS = float(os.getenv("SESSION_CHECKPOINT_SECONDS", "2.0"))
 MODEL_SIZE = os.getenv("MODEL_SIZE", "tiny.en")
 DEVICE = os.getenv("WHISPER_DEVICE", "cpu")
 COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE", "int8")
+# model tiers a session may ask for with ?model=<size> (e.g. tiny.en for cheap partials,
+# small.en for premium sessions); MODEL_SIZE is the default tier and is loaded at startup,
+# in the background: /readyz answers 503 until it is loaded and warmed up.
+# Weights come from MODEL_CACHE_DIR (see models/load_whisper.py); MODEL_OFFLINE=1 never downloads
+ALLOWED_MODELS = [m.strip() for m in os.getenv("ALLOWED_MODELS", MODEL_SIZE).split(",") if m.strip()]
+if MODEL_SIZE not in ALLOWED_MODELS:
+    ALLOWED_MODELS.insert(0, MODEL_SIZE)
+# other tiers hand their model back to the pool once no session used them for this long;
+# the pool keeps it warm until MODEL_POOL_BUDGET_MB forces an eviction
+MODEL_IDLE_SECONDS = float(os.getenv("MODEL_IDLE_SECONDS", "300"))
+# every tier decodes this much synthetic audio after loading, before it takes real windows
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") not in ("0", "false", "False")
+WARMUP_SECONDS = float(os.getenv("WARMUP_SECONDS", "2.0"))
 
 # transcription config
-CHUNK_SECONDS = float(os.getenv("CHUNK_SECONDS", "6.0"))  # sliding buffer window to transcribe
-MIN_AUDIO_BYTES_FOR_TRANSCRIBE = int(os.getenv("MIN_AUDIO_BYTES_FOR_TRANSCRIBE", "1000"))
+MAX_BUFFER_SECONDS = float(os.getenv("MAX_BUFFER_SECONDS", "30.0"))  # per-session ring buffer capacity
+# if this much audio is still uncommitted, commit the older half of the hypothesis so the
+# ring buffer never overwrites audio that has no committed text yet
+MAX_UNCOMMITTED_SECONDS = float(os.getenv("MAX_UNCOMMITTED_SECONDS", str(MAX_BUFFER_SECONDS * 0.8)))
+MIN_AUDIO_SECONDS_FOR_TRANSCRIBE = float(os.getenv("MIN_AUDIO_SECONDS_FOR_TRANSCRIBE", "0.5"))
+BEAM_SIZE = int(os.getenv("BEAM_SIZE", "5"))  # finals; partials decode greedily
+# compute log-mel features as audio arrives and hand them to the model with each window,
+# instead of the model extracting them from the whole window on every pass
+FEATURE_CACHE_ENABLED = os.getenv("FEATURE_CACHE", "1") not in ("0", "false", "False")
+# decoding gets cheaper (smaller beams, no temperature fallback, shorter partial windows) while
+# partials take longer than the target or too many sessions wait for a worker
+DECODING_ADAPTIVE = os.getenv("DECODING_ADAPTIVE", "1") not in ("0", "false", "False")
+PARTIAL_LATENCY_TARGET_MS = float(os.getenv("PARTIAL_LATENCY_TARGET_MS", "1000"))
+DECODING_MAX_QUEUE_DEPTH = int(os.getenv("DECODING_MAX_QUEUE_DEPTH", "4"))
+DECODING_DWELL_SECONDS = float(os.getenv("DECODING_DWELL_SECONDS", "3"))
+# two-pass mode: each finished utterance is decoded again by this (larger) model in the
+# background, only while the first-pass model has nothing waiting; "" disables it
+TWO_PASS_MODEL = os.getenv("TWO_PASS_MODEL", "").strip()
+TWO_PASS_MAX_SECONDS = float(os.getenv("TWO_PASS_MAX_SECONDS", "30"))  # longer utterances keep their first-pass final
+TWO_PASS_MAX_QUEUED = int(os.getenv("TWO_PASS_MAX_QUEUED", "64"))
+TWO_PASS_PADDING_SECONDS = 0.3  # audio kept around the utterance's words
+SAMPLE_RATE = 16000
+# how long to wait for ffmpeg to hand back the PCM of a chunk we just fed it
+DECODER_READ_TIMEOUT = float(os.getenv("DECODER_READ_TIMEOUT", "0.25"))
+# protocol 2 (?protocol=2): lost frames up to this long are filled with silence
+FRAME_MAX_GAP_SECONDS = float(os.getenv("FRAME_MAX_GAP_SECONDS", "2.0"))
+
+# voice activity: silent audio is never sent to the model, and an utterance is finalized
+# automatically once the speaker has paused for ENDPOINT_SILENCE_MS
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") not in ("0", "false", "False")
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "9.0"))  # dB above the noise floor
+ENDPOINT_SILENCE_MS = float(os.getenv("ENDPOINT_SILENCE_MS", "800"))
+VAD_PREROLL_SECONDS = 0.3  # silence kept before speech so word onsets are not clipped
+
+# inference execution: "thread" shares one model between INFERENCE_WORKERS threads,
+# "process" loads one model per worker process, "remote" sends windows through the Redis
+# job stream to `python -m core.transcription_worker` processes, "shm" hands them through
+# shared memory to the `python -m core.inference_server` process on this box, which holds
+# the models for all API workers (uvicorn --workers N)
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", "64"))  # sessions waiting for a worker
+# cross-session batching: >1 merges windows from different sessions into one model pass
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "1"))
+INFERENCE_BATCH_WAIT_MS = float(os.getenv("INFERENCE_BATCH_WAIT_MS", "20"))
+# sessions share a tier's workers by deficit round-robin on the audio seconds of their
+# windows, this many seconds per turn; 0 runs windows in arrival order
+FAIR_QUANTUM_SECONDS = float(os.getenv("FAIR_QUANTUM_SECONDS", "2.0"))
+# remote mode: windows this node may have queued at once, and how long to wait for a worker
+REMOTE_MAX_IN_FLIGHT = int(os.getenv("REMOTE_MAX_IN_FLIGHT", "32"))
+REMOTE_RESULT_TIMEOUT = float(os.getenv("REMOTE_RESULT_TIMEOUT", "30"))
+# shm mode: the inference server's socket, windows this worker may have there at once, and
+# how long to wait for the server's answer to one
+INFERENCE_SERVER_SOCKET = os.getenv("INFERENCE_SERVER_SOCKET", DEFAULT_SOCKET)
+INFERENCE_SERVER_MAX_IN_FLIGHT = int(os.getenv("INFERENCE_SERVER_MAX_IN_FLIGHT", "8"))
+INFERENCE_SERVER_RESULT_TIMEOUT = float(os.getenv("INFERENCE_SERVER_RESULT_TIMEOUT", "60"))
+# results of identical windows (same audio, model and options) are reused; 0 disables the cache,
+# RESULT_CACHE_REDIS=1 shares it between processes through Redis
+RESULT_CACHE_MB = float(os.getenv("RESULT_CACHE_MB", "64"))
+RESULT_CACHE_REDIS = os.getenv("RESULT_CACHE_REDIS", "0") not in ("0", "false", "False")
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600"))
+# admission control: a tier takes new sessions while the measured real-time factor says its
+# workers keep up (at ADMISSION_TARGET_UTILIZATION); beyond that they wait up to
+# ADMISSION_QUEUE_SECONDS for a slot and are then closed with 1013 and a retry-after hint
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") not in ("0", "false", "False")
+ADMISSION_TARGET_UTILIZATION = float(os.getenv("ADMISSION_TARGET_UTILIZATION", "0.8"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "0"))  # per tier and process, 0 = only the estimate limits
+ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "8"))
+ADMISSION_QUEUE_SECONDS = float(os.getenv("ADMISSION_QUEUE_SECONDS", "10"))
+ADMISSION_MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "32"))
+ADMISSION_RETRY_AFTER_SECONDS = float(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "5"))
+# a session whose received audio is this far ahead of its latest transcription result is
+# told it is lagging, and told again once it is back under half of it
+LAG_THRESHOLD_SECONDS = float(os.getenv("LAG_THRESHOLD_SECONDS", "5.0"))
+CLOSE_TRY_AGAIN_LATER = 1013
 
 app = FastAPI(title="Realtime Transcription Backend")
+# batch transcription of uploaded files (/jobs)
+app.include_router(rest.router)
 
 
 # NOTE: Do NOT perform heavy I/O or model loading at import time.
@@ -34,32 +147,258 @@ app = FastAPI(title="Realtime Transcription Backend")
 # and accept connections even if model loading is slow or fails.
 
 
+def create_executor(model_size: str) -> InferenceExecutor:
+    """Executor for one model tier; the model itself comes from the shared pool in models.load_whisper."""
+    result_cache = getattr(app.state, "result_cache", None)
+    if INFERENCE_MODE == "remote":
+        if model_size != MODEL_SIZE:
+            raise ValueError("remote transcription workers only serve MODEL_SIZE")
+        return RemoteExecutor(
+            REDIS_URL, max_in_flight=REMOTE_MAX_IN_FLIGHT, max_pending=INFERENCE_MAX_PENDING,
+            result_timeout=REMOTE_RESULT_TIMEOUT, result_cache=result_cache, cache_namespace=model_size,
+            fair_quantum=FAIR_QUANTUM_SECONDS,
+        )
+    if INFERENCE_MODE == "shm":
+        return SharedMemoryExecutor(
+            INFERENCE_SERVER_SOCKET, model_size, max_in_flight=INFERENCE_SERVER_MAX_IN_FLIGHT,
+            max_pending=INFERENCE_MAX_PENDING, slot_seconds=max(MAX_BUFFER_SECONDS, TWO_PASS_MAX_SECONDS) + 2,
+            result_timeout=INFERENCE_SERVER_RESULT_TIMEOUT,
+            result_cache=result_cache, cache_namespace=model_size, fair_quantum=FAIR_QUANTUM_SECONDS,
+        )
+    num_workers = INFERENCE_WORKERS if INFERENCE_MODE == "thread" else 1
+    executor_args = dict(mode=INFERENCE_MODE, workers=INFERENCE_WORKERS, max_pending=INFERENCE_MAX_PENDING,
+                         model_release=release_model, result_cache=result_cache, cache_namespace=model_size,
+                         fair_quantum=FAIR_QUANTUM_SECONDS)
+    if INFERENCE_BATCH_SIZE > 1:
+        return BatchScheduler(
+            get_model, (model_size, DEVICE, COMPUTE_TYPE), {"num_workers": num_workers},
+            max_batch_size=INFERENCE_BATCH_SIZE, max_wait_ms=INFERENCE_BATCH_WAIT_MS, **executor_args,
+        )
+    return InferenceExecutor(
+        get_model, (model_size, DEVICE, COMPUTE_TYPE), {"num_workers": num_workers}, **executor_args,
+    )
+
+
+# sessions currently connected per model tier, and the locks that serialize tier startup
+TIER_SESSIONS = Counter()
+LAGGING_SESSIONS = Counter()
+_TIER_LOCKS = {}
+# decoding policy per model tier; it outlives the tier's executor so its history is kept
+DECODING_POLICIES = {}
+
+def get_policy(model_size: str) -> DecodingPolicy:
+    policy = DECODING_POLICIES.get(model_size)
+    if policy is None:
+        policy = DECODING_POLICIES[model_size] = DecodingPolicy(
+            model_size, default_levels(BEAM_SIZE), target_latency=PARTIAL_LATENCY_TARGET_MS / 1000,
+            max_queue_depth=DECODING_MAX_QUEUE_DEPTH, adaptive=DECODING_ADAPTIVE, dwell_seconds=DECODING_DWELL_SECONDS,
+        )
+    return policy
+
+# admission state per model tier; like the policies it outlives the tier's executor
+CAPACITY = {}
+
+def get_capacity(model_size: str) -> CapacityManager:
+    capacity = CAPACITY.get(model_size)
+    if capacity is None:
+        capacity = CAPACITY[model_size] = CapacityManager(
+            model_size, lambda: getattr(app.state, "executors", {}).get(model_size),
+            lambda: AUDIO_SECONDS.value(model=model_size), target_utilization=ADMISSION_TARGET_UTILIZATION,
+            max_sessions=MAX_SESSIONS, max_queue_depth=ADMISSION_MAX_QUEUE_DEPTH, queue_seconds=ADMISSION_QUEUE_SECONDS,
+            max_queued=ADMISSION_MAX_QUEUED, retry_after=ADMISSION_RETRY_AFTER_SECONDS,
+        )
+    return capacity
+
+def hop_floor(sample: int) -> int:
+    """Round a stream position down to the log-mel hop, where windows can reuse a session's cached features."""
+    return sample // HOP_LENGTH * HOP_LENGTH
+
+# Prometheus metrics served on /metrics; per-stage timings are recorded with utils.timer.timed
+AUDIO_SECONDS = REGISTRY.counter("stt_audio_seconds_total", "Seconds of audio decoded from clients", labels=("model",))
+UPLINK_BYTES = REGISTRY.counter("stt_uplink_bytes_total", "Audio bytes received from clients", labels=("protocol",))
+FEATURE_WINDOWS = REGISTRY.counter("stt_feature_cache_windows_total",
+                                   "Windows submitted with cached log-mel features (hit) or without (miss)",
+                                   labels=("result",))
+REGISTRY.gauge("stt_active_sessions", "Connected WebSocket sessions", labels=("model",),
+               callback=lambda: {(size,): n for size, n in TIER_SESSIONS.items()})
+REGISTRY.gauge("stt_inference_queue_depth", "Sessions waiting for an inference worker", labels=("model",),
+               callback=lambda: {(size,): ex.queue_depth for size, ex in getattr(app.state, "executors", {}).items()})
+REGISTRY.gauge("stt_inference_running", "Inference jobs currently running", labels=("model",),
+               callback=lambda: {(size,): ex.running for size, ex in getattr(app.state, "executors", {}).items()})
+# inference time per second of audio since startup; < 1 means the server keeps up
+REGISTRY.gauge("stt_session_capacity", "Sessions a model tier is estimated to keep up with (0 = not known yet)",
+               labels=("model",), callback=lambda: {(size,): c.capacity or 0 for size, c in CAPACITY.items()})
+REGISTRY.gauge("stt_lagging_sessions", "Sessions whose transcription is more than LAG_THRESHOLD_SECONDS behind",
+               labels=("model",), callback=lambda: {(size,): n for size, n in LAGGING_SESSIONS.items()})
+REGISTRY.gauge("stt_second_pass_queue_depth", "Utterances waiting for the second pass",
+               callback=lambda: {(): app.state.second_pass.queue_depth} if getattr(app.state, "second_pass", None) else {})
+REGISTRY.gauge("stt_realtime_factor", "Inference seconds per audio second since startup",
+               callback=lambda: INFERENCE_SECONDS.total() / AUDIO_SECONDS.total() if AUDIO_SECONDS.total() else 0.0)
+STARTUP_SECONDS = REGISTRY.gauge("stt_startup_seconds", "Duration of the startup phases (load, warmup, ready)",
+                                 labels=("model", "phase"))
+REGISTRY.gauge("stt_ready", "1 while the default model tier is loaded and warmed up",
+               callback=lambda: {(): 1.0 if is_ready() else 0.0})
+
+async def get_executor(model_size: str) -> InferenceExecutor:
+    """Running executor for a model tier, started (and its model loaded) on first use."""
+    executor = app.state.executors.get(model_size)
+    if executor is not None:
+        return executor
+    async with _TIER_LOCKS.setdefault(model_size, asyncio.Lock()):
+        executor = app.state.executors.get(model_size)
+        if executor is None:
+            executor = await start_tier(model_size)
+            app.state.executors[model_size] = executor
+    return executor
+
+def warmup_options(model_size: str) -> dict:
+    """What a final window of the tier is decoded with, without counting it in the policy's metrics."""
+    return dict(get_policy(model_size).current.final, language="en", vad_filter=False, word_timestamps=True,
+                condition_on_previous_text=False)
+
+async def start_tier(model_size: str) -> InferenceExecutor:
+    """Create a tier's executor, load its model and warm it up. The default tier reports its progress in app.state.startup."""
+    default = model_size == MODEL_SIZE
+    startup = app.state.startup
+    executor = create_executor(model_size)
+    if default:
+        app.state.executor = executor
+        startup.update(status="loading", error=None)
+    log.info("Loading model tier %s (%s x%d, batch %d)...", model_size, INFERENCE_MODE, INFERENCE_WORKERS,
+             INFERENCE_BATCH_SIZE)
+    try:
+        await executor.start()
+        await _prepare_tier(model_size, executor, default, startup)
+    except BaseException as e:
+        # never leave a started executor behind: the next session starts the tier afresh
+        if default:
+            startup.update(status="failed", error=str(e) or type(e).__name__)
+        await executor.shutdown()
+        raise
+    return executor
+
+async def _prepare_tier(model_size: str, executor: InferenceExecutor, default: bool, startup: dict):
+    """Record how long a started tier took to load, warm it up and, for the default tier, mark the server ready."""
+    # executors without a local model (remote, shm) may not time their start
+    load_seconds = executor.load_seconds or 0.0
+    STARTUP_SECONDS.set(load_seconds, model=model_size, phase="load")
+    log.info("Model tier %s loaded in %.2fs", model_size, load_seconds)
+    if WARMUP_ENABLED:
+        if default:
+            startup.update(status="warming")
+        try:
+            await executor.warm_up(WARMUP_SECONDS, **warmup_options(model_size))
+            STARTUP_SECONDS.set(executor.warmup_seconds or 0.0, model=model_size, phase="warmup")
+            log.info("Model tier %s warmed up in %.2fs", model_size, executor.warmup_seconds or 0.0)
+        except Exception as e:
+            # a cold model still works, the first windows are just slower
+            log.warning("Warm-up of model tier %s failed: %s", model_size, e)
+    if default:
+        ready_seconds = time.monotonic() - PROCESS_STARTED
+        startup.update(status="ready", load_seconds=round(load_seconds, 3),
+                       warmup_seconds=round(executor.warmup_seconds, 3) if executor.warmup_seconds is not None else None,
+                       ready_seconds=round(ready_seconds, 3))
+        STARTUP_SECONDS.set(ready_seconds, model=model_size, phase="ready")
+        log.info("Ready %.2fs after process start", ready_seconds)
+
+def is_ready() -> bool:
+    executor = getattr(app.state, "executors", {}).get(MODEL_SIZE)
+    return executor is not None and executor.ready
+
+async def prepare_models():
+    """Startup task: load the default tier (and the second-pass tier) while the server already answers probes."""
+    try:
+        await get_executor(MODEL_SIZE)
+    except Exception as e:
+        log.error("Model load error: %s", e)
+        return
+    if TWO_PASS_MODEL and TWO_PASS_MODEL != MODEL_SIZE:
+        try:
+            await get_executor(TWO_PASS_MODEL)
+        except Exception as e:
+            log.warning("Second-pass tier %s not loaded, retrying on its first utterance: %s", TWO_PASS_MODEL, e)
+
+def first_pass_idle() -> bool:
+    """No live session waits for its model tier (the second-pass tier counts only if sessions use it too)."""
+    for size, executor in app.state.executors.items():
+        if size == TWO_PASS_MODEL and TIER_SESSIONS[size] <= 0:
+            continue
+        if executor.queue_depth or executor.busy:
+            return False
+    return True
+
+async def retire_executor(model_size: str):
+    """Stop an unused non-default tier after MODEL_IDLE_SECONDS; its model goes back to the pool."""
+    await asyncio.sleep(MODEL_IDLE_SECONDS)
+    if TIER_SESSIONS[model_size] > 0 or model_size in (MODEL_SIZE, TWO_PASS_MODEL):
+        return
+    executor = app.state.executors.pop(model_size, None)
+    if executor is not None:
+        log.info("Retiring idle model tier %s", model_size)
+        await executor.shutdown()
+
+
 @app.on_event("startup")
 async def startup_event():
-    print("Starting FastAPI app...")
+    log.info("Starting FastAPI app...")
     # initialize redis client
     try:
         app.state.redis = aioredis.from_url(REDIS_URL, decode_responses=True)
-        print("Redis client initialized.")
+        log.info("Redis client initialized.")
     except Exception as e:
         app.state.redis = None
-        print("Redis init error:", e)
-
-    # load Whisper/faster-whisper model in a thread to avoid blocking the event loop
-    try:
-        print("Loading faster-whisper model:", MODEL_SIZE)
-        # get_model is CPU-bound / may block; run it in a thread
-        model_obj = await asyncio.to_thread(get_model, MODEL_SIZE, DEVICE, COMPUTE_TYPE)
-        app.state.model = model_obj
-        print("Model loaded.")
-    except Exception as e:
-        app.state.model = None
-        print("Model load error:", e)
+        log.error("Redis init error: %s", e)
+
+    app.state.sessions = create_session_store(SESSION_STORE, REDIS_URL, SESSION_TTL_SECONDS)
+    log.info("Session store: %s (ttl %.0fs)", app.state.sessions.name, SESSION_TTL_SECONDS)
+
+    app.state.result_cache = None
+    if RESULT_CACHE_MB > 0:
+        app.state.result_cache = ResultCache(
+            int(RESULT_CACHE_MB * 2**20), redis=app.state.redis if RESULT_CACHE_REDIS else None,
+            ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+        )
+
+    # what the REST routes need from here
+    app.state.get_executor = get_executor
+    app.state.get_policy = get_policy
+    app.state.allowed_models = ALLOWED_MODELS
+    app.state.default_model = MODEL_SIZE
+
+    # the executor owns the Whisper/faster-whisper model and loads it off the event loop
+    # (in remote mode the transcription workers own it and the executor talks to Redis);
+    # loading runs in the background so /healthz and /readyz answer meanwhile
+    app.state.executors = {}
+    app.state.executor = None
+    app.state.startup = {"status": "starting", "model": MODEL_SIZE, "load_seconds": None, "warmup_seconds": None,
+                         "ready_seconds": None, "error": None}
+    app.state.startup_task = asyncio.create_task(prepare_models())
+
+    app.state.second_pass = None
+    if TWO_PASS_MODEL:
+        app.state.second_pass = SecondPass(lambda: get_executor(TWO_PASS_MODEL), first_pass_idle,
+                                           max_queued=TWO_PASS_MAX_QUEUED)
+        app.state.second_pass.start()
+        log.info("Two-pass mode: finals are re-decoded with %s", TWO_PASS_MODEL)
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    print("Shutting down FastAPI app...")
+    log.info("Shutting down FastAPI app...")
+    startup_task = getattr(app.state, "startup_task", None)
+    if startup_task is not None and not startup_task.done():
+        startup_task.cancel()
+        try:
+            await startup_task
+        except (asyncio.CancelledError, Exception):
+            pass
+    if getattr(app.state, "second_pass", None) is not None:
+        await app.state.second_pass.shutdown()
+    for executor in list(getattr(app.state, "executors", {}).values()):
+        await executor.shutdown()
+    sessions = getattr(app.state, "sessions", None)
+    if sessions is not None:
+        await sessions.close()
     try:
         redis_client = getattr(app.state, "redis", None)
         if redis_client is not None:
@@ -70,125 +409,522 @@ async def shutdown_event():
 
 @app.get("/")
 async def root():
-    """Simple health endpoint to verify the server is up."""
-    model_status = "loaded" if getattr(app.state, "model", None) is not None else "not_loaded"
+    """Overview of the server: model tiers, queues and caches."""
+    executor = getattr(app.state, "executor", None)
+    model_status = "loaded" if executor is not None and executor.ready else "not_loaded"
     redis_status = "connected" if getattr(app.state, "redis", None) is not None else "not_connected"
-    return {"status": "ok", "model": model_status, "redis": redis_status}
-
-# In-memory store per-session: buffer of wav file paths (rotating)
-SESSION_BUFFERS = {}  # session_id -> list of WAV temp file paths
-
-async def publish_transcript(session_id: str, transcript_text: str):
-    key = f"transcript:{session_id}"
+    inference = executor.stats() if executor is not None else None
+    tiers = {size: dict(ex.stats(), sessions=TIER_SESSIONS[size], decoding=get_policy(size).stats(),
+                        admission=get_capacity(size).stats())
+             for size, ex in getattr(app.state, "executors", {}).items()}
+    result_cache = getattr(app.state, "result_cache", None)
+    startup = getattr(app.state, "startup", None)
+    status = "ok" if is_ready() else (startup or {}).get("status", "starting")
+    return {"status": status, "model": model_status, "redis": redis_status, "inference": inference, "startup": startup,
+            "tiers": tiers, "model_pool": get_model_pool().stats(),
+            "second_pass": app.state.second_pass.stats() if getattr(app.state, "second_pass", None) else None,
+            "result_cache": result_cache.stats() if result_cache is not None else None}
+
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process serves requests (the model may still be loading)."""
+    return {"status": "alive", "uptime_seconds": round(time.monotonic() - PROCESS_STARTED, 3)}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once the default model tier is loaded and warmed up, 503 before that or if loading failed."""
+    startup = dict(getattr(app.state, "startup", None) or {"status": "starting"})
+    if is_ready():
+        return dict(startup, status="ready")
+    if startup["status"] == "ready":
+        startup["status"] = "stopped"
+    return JSONResponse(startup, status_code=503)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/sessions/{session_id}/transcript")
+async def session_transcript(session_id: str, after_seq: int = Query(0, ge=0)):
+    """Transcript rebuilt from the stored segments; with after_seq only the segments after it."""
     redis_client = getattr(app.state, "redis", None)
     if redis_client is None:
+        raise HTTPException(503, "redis not available")
+    store = TranscriptStore(redis_client, TRANSCRIPT_TTL_SECONDS)
+    segments = await store.read_segments(session_id, after_seq)
+    return {"session_id": session_id, "seq": segments[-1]["seq"] if segments else after_seq,
+            "text": join_segments(segments),
+            "tail": await store.tail(session_id), "segments": segments}
+
+async def publish_transcript(writer: Optional[TranscriptWriter], transcriber: StreamingTranscriber, final: bool = False):
+    """
+    Store what the session committed since the last call and its current tail, and announce
+    only that on the "transcripts" channel (see core/transcript_store.py); `final` marks the
+    end of an utterance. The full text is rebuilt from the stored segments when needed.
+    """
+    if writer is None or getattr(app.state, "redis", None) is None:
         # Redis not available; skip persisting
         return
-    await redis_client.set(key, transcript_text)
-    payload = json.dumps({"session_id": session_id, "transcript": transcript_text, "ts": int(time.time())})
-    await redis_client.publish("transcripts", payload)
+    with timed("publish", writer.session_id):
+        await writer.sync(transcriber, final=final)
 
 
 @app.websocket("/ws/transcribe")
-async def websocket_transcribe(ws: WebSocket, session_id: Optional[str] = Query(None)):
+async def websocket_transcribe(ws: WebSocket, session_id: Optional[str] = Query(None), model: Optional[str] = Query(None),
+                               protocol: int = Query(1), codec: str = Query("pcm16")):
     """
     WebSocket endpoint to receive binary audio chunks (webm/opus) from browser and return incremental transcripts.
     Query param: session_id (string) — must be provided by the client to identify session.
+    Query param: model (optional) — model tier from ALLOWED_MODELS, defaults to MODEL_SIZE.
+    Query param: protocol (optional) — 1 (default) or 2, see below; codec — "pcm16" (default) or "opus" for protocol 2.
     Protocol (client -> server):
       - Binary frames: webm/opus blob bytes (recorded chunks)
+        protocol 2: one audio frame per message, an 8 byte header (little-endian uint32 sequence
+        number, uint32 position of the first sample in the stream) followed by 16 kHz mono
+        PCM16 samples or one raw Opus packet; no container and no ffmpeg
       - Text frames: JSON command messages like {"command":"flush"} or {"command":"end"}
     Server -> client:
-      - JSON text messages: {"type":"partial","text":"..."} or {"type":"final","text":"...","full_text":"..."}
+      - JSON text messages: {"type":"partial","text":"<full transcript>","committed":"<newly committed>","tail":"<uncommitted>",
+        "end":<stream seconds of audio covered>}
+        or {"type":"final","text":"<utterance>","full_text":"...","reason":"flush"|"endpoint"|"gap"}
+        protocol 2 sends deltas only: {"type":"partial","seq":n,"commit":"<newly committed>","tail":"<uncommitted>","end":...}
+        and {"type":"final","seq":n,"commit":"<newly committed>","reason":...}; the transcript is the
+        concatenation of all "commit" strings (they keep their leading spaces) plus the latest tail.
+      Partials and finals carry "segment_id", the number of the utterance they belong to (a
+      final ends its utterance). In two-pass mode (TWO_PASS_MODEL) finals have "pass":1 and each
+      utterance is later decoded again by the larger model, which sends
+      {"type":"final","pass":2,"segment_id":n,"text":"<utterance>","start":...,"end":...,"reason":"second_pass"}
+      (plus "seq" in protocol 2): its text replaces everything of segment n.
+      With VAD enabled, silence is not transcribed and a final with reason "endpoint" is
+      sent on its own after ENDPOINT_SILENCE_MS of silence following speech. In protocol 2 a
+      frame that starts more than FRAME_MAX_GAP_SECONDS after the previous one ends the
+      utterance in progress (reason "gap"); the stream continues at the frame's position.
+      Reconnecting with the session_id of a session that is still in the session store resumes
+      it: the first message is {"type":"resumed","position":<samples received so far>,"end":<seconds>,
+      "seq":n,"text":"<committed transcript>","tail":"..."} and the client continues sending audio
+      from "position" (protocol 2 frames carry it in their header). A session taken over by a
+      newer connection is closed with code 4004.
+      When the model tier is at capacity the session first gets {"type":"queued","position":n,
+      "max_wait":<seconds>} and, once a slot frees up, {"type":"admitted","waited":<seconds>}; if
+      none does it gets {"type":"error","error":"...","retry_after":<seconds>} and is closed with
+      code 1013 (try again later, reason "retry-after=<seconds>"). Audio sent while queued is
+      only read once admitted.
+      A session whose transcription falls LAG_THRESHOLD_SECONDS behind the audio it sent gets
+      {"type":"status","status":"lagging","lag":<seconds>,"queue_depth":n}, and
+      {"type":"status","status":"ok","lag":<seconds>} once it has caught up.
     """
     if session_id is None:
         await ws.close(code=4001)
         return
+    model_size = model or MODEL_SIZE
+    if model_size not in ALLOWED_MODELS:
+        await ws.close(code=4002)
+        return
+    frames = None
+    if protocol == 2:
+        try:
+            frames = FrameDecoder(codec, SAMPLE_RATE, max_gap_seconds=FRAME_MAX_GAP_SECONDS)
+        except (ValueError, RuntimeError) as e:
+            log.warning("Rejecting session_id=%s: %s", session_id, e)
+            await ws.close(code=4003)
+            return
+    elif protocol != 1:
+        await ws.close(code=4003)
+        return
 
     await ws.accept()
-    print(f"WS accepted session_id={session_id}")
+    connected = time.monotonic()
+    capacity = get_capacity(model_size) if ADMISSION_ENABLED else None
+    if capacity is not None:
+        async def queued(position, max_wait):
+            await ws.send_text(json.dumps({"type":"queued","position": position, "max_wait": max_wait}))
 
-    # buffer list
-    SESSION_BUFFERS.setdefault(session_id, [])
-
-    # each session keeps a running full transcript
-    session_full_text = ""
+        try:
+            waited = await capacity.admit(queued)
+        except AdmissionRejected as e:
+            try:
+                await ws.send_text(json.dumps({"type":"error","error": str(e), "retry_after": e.retry_after}))
+                await ws.close(code=CLOSE_TRY_AGAIN_LATER, reason=f"retry-after={e.retry_after}")
+            except Exception:
+                pass
+            return
+        except Exception as e:
+            # the client went away while it was queued
+            log.info("Session %s gone while waiting for admission: %s", session_id, e)
+            return
+        if waited:
+            try:
+                await ws.send_text(json.dumps({"type":"admitted","waited": round(waited, 3)}))
+            except Exception:
+                capacity.release(time.monotonic() - connected)
+                return
+    log.info("WS accepted session_id=%s model=%s protocol=%d", session_id, model_size, protocol)
+    TIER_SESSIONS[model_size] += 1
+
+    # fixed-capacity audio buffer, memory per session is bounded by seconds of audio
+    buffer = PCMRingBuffer(MAX_BUFFER_SECONDS, SAMPLE_RATE)
+    # protocol 1: one ffmpeg process per session; MediaRecorder timeslices after the first
+    # carry no WebM header, so they can only be decoded as a continuous stream
+    decoder = StreamingDecoder(sample_rate=SAMPLE_RATE) if frames is None else None
+
+    # each session keeps an incremental transcript: committed words never change and only
+    # the uncommitted tail of the buffer is re-decoded on every chunk
+    transcriber = StreamingTranscriber()
+    vad = EnergyVAD(sample_rate=SAMPLE_RATE, threshold_db=VAD_THRESHOLD_DB, endpoint_ms=ENDPOINT_SILENCE_MS)
+    redis_client = getattr(app.state, "redis", None)
+    writer = TranscriptWriter(TranscriptStore(redis_client, TRANSCRIPT_TTL_SECONDS), session_id) if redis_client is not None else None
+    last_partial = ""
+    # protocol 2 bookkeeping: committed words the client already has, messages sent
+    sent_words = 0
+    out_seq = 0
+    # utterance in progress, and where (stream seconds) the previous one ended
+    segment_id = 1
+    segment_start = 0.0
+    second_pass = app.state.second_pass
+    # two-pass mode: the recent audio, committed or not, so whole utterances can be re-decoded
+    history = PCMRingBuffer(TWO_PASS_MAX_SECONDS, SAMPLE_RATE) if second_pass is not None else None
+
+    sessions = app.state.sessions
+    owner = uuid.uuid4().hex
+    claimed = False
+    executor = None
+    policy = get_policy(model_size)
+    mels = None
+    last_checkpoint = time.monotonic()
+    # stream sample up to which the latest transcription result covers the audio
+    decoded_until = buffer.start_sample
+    lagging = False
+    ended = False
+    taken_over = False
+    # partials run as background tasks so the receive loop keeps draining the socket
+    # while the model works; the executor coalesces them to the newest window
+    partial_tasks = set()
+
+    async def checkpoint(force=False):
+        """Save the session to the store, at most every SESSION_CHECKPOINT_SECONDS unless forced."""
+        nonlocal last_checkpoint
+        if not force and time.monotonic() - last_checkpoint < SESSION_CHECKPOINT_SECONDS:
+            return
+        last_checkpoint = time.monotonic()
+        state = {"model": model_size, "end_sample": buffer.end_sample, "transcriber": transcriber.state(),
+                 "vad": vad.state(), "out_seq": out_seq, "writer": writer.state() if writer is not None else None,
+                 "segment_id": segment_id, "segment_start": segment_start, "saved_at": time.time()}
+        try:
+            with timed("checkpoint", session_id):
+                saved = await sessions.save(session_id, owner, state, buffer.view())
+        except Exception as e:
+            log.warning("Checkpoint of session %s failed: %s", session_id, e)
+            return
+        if not saved:
+            raise SessionTakenOver(session_id)
+
+    def decode_options(kind):
+        """Options for a "partial" or "final" window; beam size etc. come from the tier's decoding policy."""
+        options = policy.options(kind, executor.queue_depth)
+        return dict(options, language="en", vad_filter=False, word_timestamps=True,
+                    condition_on_previous_text=False, initial_prompt=transcriber.prompt() or None)
+
+    def trim_committed():
+        # committed audio is never decoded again; windows start on a feature hop so the
+        # cached log-mel frames line up with them
+        buffer.discard_until(hop_floor(int(round(transcriber.committed_until * SAMPLE_RATE))))
+
+    async def report_lag():
+        """Tell the client when its transcription falls behind the audio it sent, and when it has caught up."""
+        nonlocal lagging
+        lag = (buffer.end_sample - max(decoded_until, buffer.start_sample)) / SAMPLE_RATE
+        if not lagging and lag > LAG_THRESHOLD_SECONDS:
+            lagging = True
+            LAGGING_SESSIONS[model_size] += 1
+            await ws.send_text(json.dumps({"type":"status","status":"lagging","lag": round(lag, 3),
+                                           "queue_depth": executor.queue_depth if executor is not None else None}))
+        elif lagging and lag < LAG_THRESHOLD_SECONDS / 2:
+            lagging = False
+            LAGGING_SESSIONS[model_size] -= 1
+            await ws.send_text(json.dumps({"type":"status","status":"ok","lag": round(lag, 3)}))
+
+    def window_features(start_sample, audio):
+        if mels is None:
+            return None
+        features = mels.window(start_sample, audio)
+        FEATURE_WINDOWS.inc(result="hit" if features is not None else "miss")
+        return features
+
+    def delta_message(kind, **fields):
+        """Protocol 2 message carrying only the words committed since the previous one."""
+        nonlocal sent_words, out_seq
+        words = transcriber.committed[sent_words:]
+        sent_words += len(words)
+        out_seq += 1
+        return json.dumps({"type": kind, "seq": out_seq, "commit": "".join(w["word"] for w in words), **fields})
+
+    async def send_final(utterance, reason):
+        nonlocal segment_id, segment_start
+        extra = {"pass": 1} if second_pass is not None else {}
+        if frames is not None:
+            await ws.send_text(delta_message("final", reason=reason, segment_id=segment_id, **extra))
+        else:
+            await ws.send_text(json.dumps({"type":"final","text": words_text(utterance), "full_text": transcriber.text,
+                                           "reason": reason, "segment_id": segment_id, **extra}))
+        if second_pass is not None and utterance:
+            queue_second_pass(segment_id, utterance)
+        segment_id += 1
+        if utterance:
+            segment_start = utterance[-1]["end"]
+
+    def queue_second_pass(seg_id, utterance):
+        start = max(segment_start, utterance[0]["start"] - TWO_PASS_PADDING_SECONDS)
+        end = utterance[-1]["end"] + TWO_PASS_PADDING_SECONDS
+        start_sample, end_sample = int(start * SAMPLE_RATE), int(end * SAMPLE_RATE)
+        if start_sample < history.start_sample:
+            # longer than TWO_PASS_MAX_SECONDS, the start is gone
+            return
+        audio = history.window(start_sample, end_sample).copy()
+        # condition on what was said before the utterance, not on its own first-pass text
+        before = transcriber.committed[:len(transcriber.committed) - len(utterance)]
+        # word timestamps: the words replace the first-pass ones in the transcript
+        options = dict(get_policy(TWO_PASS_MODEL).options("final"), language="en", vad_filter=False,
+                       word_timestamps=True, condition_on_previous_text=False,
+                       initial_prompt=words_text(before)[-transcriber.prompt_chars:] or None)
+
+        async def deliver(segments, info):
+            nonlocal out_seq, sent_words, last_checkpoint
+            # the larger model's words take the place of the first-pass ones in the transcript,
+            # and so in the session checkpoint, the stored segments and what summaries read
+            first, removed, words = transcriber.replace(utterance[0]["start"], utterance[-1]["end"],
+                                                        segment_words(segments))
+            if removed:
+                if sent_words > first:
+                    sent_words = max(first + len(words), sent_words + len(words) - removed)
+                # checkpoint on the next audio chunk instead of after SESSION_CHECKPOINT_SECONDS
+                last_checkpoint = 0.0
+            message = {"type": "final", "pass": 2, "segment_id": seg_id,
+                       "text": "".join(seg["text"] for seg in segments).strip(),
+                       "start": round(start_sample / SAMPLE_RATE, 3), "end": round(end_sample / SAMPLE_RATE, 3),
+                       "reason": "second_pass"}
+            if frames is not None:
+                out_seq += 1
+                message["seq"] = out_seq
+            try:
+                await ws.send_text(json.dumps(message))
+            finally:
+                # stored even if the client is gone by now
+                if removed and writer is not None and getattr(app.state, "redis", None) is not None:
+                    with timed("publish", session_id):
+                        await writer.replace(transcriber, first, removed, words, utterance[0]["start"],
+                                             utterance[-1]["end"])
+
+        second_pass.submit(session_id, seg_id, audio, start_sample / SAMPLE_RATE, options, deliver)
+
+    async def finalize(reason, end_sample=None):
+        """Transcribe the buffer up to end_sample (all of it if None), commit everything and send a final."""
+        with timed("final", session_id):
+            await _finalize(reason, end_sample)
+
+    async def _finalize(reason, end_sample):
+        nonlocal last_partial, decoded_until
+        if end_sample is None:
+            end_sample = buffer.end_sample
+        start_sample = buffer.start_sample
+        if end_sample > start_sample:
+            # the final window supersedes any partial still waiting for a worker
+            audio = buffer.window(start_sample, end_sample).copy()
+            segments, info = await executor.submit(session_id, audio, window_features(start_sample, audio),
+                                                   **decode_options("final"))
+            decoded_until = max(decoded_until, end_sample)
+            transcriber.insert(segments, start_sample / SAMPLE_RATE)
+        # everything up to end_sample is final now, agreed on or not
+        _, utterance = transcriber.finish(until=end_sample / SAMPLE_RATE)
+        # keep audio that arrived while the final was decoding
+        buffer.discard_until(hop_floor(end_sample))
+        if not utterance and reason in ("endpoint", "gap"):
+            return
+        last_partial = transcriber.full_text
+        await send_final(utterance, reason)
+        await publish_transcript(writer, transcriber, final=True)
+
+    async def skip_to(sample):
+        """The client's clock jumped past audio that never arrived: end the utterance and continue at `sample`."""
+        nonlocal decoded_until
+        if len(buffer) and (vad.speech_pending or not VAD_ENABLED) and executor is not None and executor.ready:
+            try:
+                await finalize("gap")
+            except JobSuperseded:
+                pass
+            except Exception as e:
+                await ws.send_text(json.dumps({"type":"error","error": f"gap error: {e}"}))
+        buffer.seek(sample)
+        if mels is not None:
+            mels.seek(sample)
+        if history is not None:
+            history.seek(sample)
+        vad.seek(sample)
+        decoded_until = max(decoded_until, sample)
+
+    async def transcribe_partial(audio, offset, features=None):
+        # "partial" covers queueing, inference and the transcript update, i.e. what the client waits for
+        started = time.perf_counter()
+        with timed("partial", session_id):
+            done = await _transcribe_partial(audio, offset, features)
+        if done:
+            policy.observe_partial(time.perf_counter() - started)
+
+    async def _transcribe_partial(audio, offset, features):
+        """False if the window was not transcribed (superseded or failed)."""
+        nonlocal last_partial, decoded_until
+        try:
+            segments, info = await executor.submit(session_id, audio, features, **decode_options("partial"))
+        except JobSuperseded:
+            return False
+        except InferenceQueueFull:
+            await ws.send_text(json.dumps({"type":"error","error": "server busy, partial skipped"}))
+            return False
+        except Exception as e:
+            await ws.send_text(json.dumps({"type":"error","error": f"transcription error: {e}"}))
+            return False
+        decoded_until = max(decoded_until, int(round(offset * SAMPLE_RATE)) + len(audio))
+        committed = transcriber.insert(segments, offset)
+        trim_committed()
+
+        # only send when the transcript actually changed
+        partial_text = transcriber.full_text
+        if partial_text and partial_text != last_partial:
+            last_partial = partial_text
+            end = round(offset + len(audio) / SAMPLE_RATE, 3)
+            if frames is not None:
+                await ws.send_text(delta_message("partial", tail=transcriber.tail, end=end, segment_id=segment_id))
+            else:
+                await ws.send_text(json.dumps({"type":"partial","text": partial_text,
+                                               "committed": words_text(committed), "tail": transcriber.tail,
+                                               "end": end, "segment_id": segment_id}))
+            # persist the delta to redis and publish it
+            await publish_transcript(writer, transcriber)
+        return True
+
+    # from here on the finally below gives back the tier and admission slots, even if the
+    # client is gone before the first chunk
     try:
+        # a reconnecting client continues its session: transcript, offsets and the audio that is
+        # not committed yet come back from the store, nothing is sent or transcribed twice
+        try:
+            snapshot = await sessions.claim(session_id, owner)
+        except Exception as e:
+            log.warning("Session store unavailable, session %s starts fresh: %s", session_id, e)
+            snapshot = None
+        claimed = True
+        if snapshot is not None:
+            state, audio = snapshot
+            buffer.seek(state["end_sample"] - len(audio))
+            buffer.append(audio)
+            if history is not None:
+                history.seek(buffer.start_sample)
+                history.append(audio)
+            transcriber = StreamingTranscriber.from_state(state["transcriber"])
+            vad.restore(state["vad"])
+            if writer is not None and state.get("writer"):
+                writer.restore(state["writer"])
+            if frames is not None:
+                frames.position = buffer.end_sample
+            # the resumed message carries the whole committed text
+            sent_words = len(transcriber.committed)
+            out_seq = state["out_seq"]
+            segment_id = state.get("segment_id", 1)
+            segment_start = state.get("segment_start", 0.0)
+            log.info("Resumed session %s at %.2fs (%d committed words, %.2fs uncommitted audio)",
+                     session_id, buffer.end_time, len(transcriber.committed), buffer.duration)
+            await ws.send_text(json.dumps({"type":"resumed","position": buffer.end_sample, "end": round(buffer.end_time, 3),
+                                           "seq": out_seq, "text": transcriber.text, "tail": transcriber.tail}))
+        decoded_until = buffer.start_sample
+        try:
+            executor = await get_executor(model_size)
+        except Exception as e:
+            await ws.send_text(json.dumps({"type":"error","error": f"model load error: {e}"}))
+        # log-mel frames of the buffered audio, kept up to date chunk by chunk; only worth it
+        # when this process runs the model (not for remote or shared-memory executors)
+        if FEATURE_CACHE_ENABLED and executor is not None and executor.feature_size:
+            mels = LogMelCache(MAX_BUFFER_SECONDS, n_mels=executor.feature_size, sample_rate=SAMPLE_RATE)
+            mels.seek(buffer.start_sample)
+            mels.append(buffer.view())
         while True:
             msg = await ws.receive()
             # handle disconnect
             if "type" in msg and msg["type"] == "websocket.disconnect":
                 raise WebSocketDisconnect(code=1000)
+            await checkpoint()
 
             if msg["type"] == "websocket.receive" and "bytes" in msg:
-                webm_bytes = msg["bytes"]
-                # Convert to wav file
-                tmp_wav = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-                tmp_wav_path = tmp_wav.name
-                tmp_wav.close()
+                data = msg["bytes"]
+                UPLINK_BYTES.inc(len(data), protocol=str(protocol))
                 try:
-                    webm_bytes_to_wav_file(webm_bytes, tmp_wav_path, sample_rate=16000)
+                    with timed("decode", session_id):
+                        if frames is not None:
+                            # protocol 2: the frame is the audio, append it as is
+                            pcm = frames.decode(data)
+                        else:
+                            # Stream into the session decoder and pick up whatever PCM it has produced
+                            await decoder.feed(data)
+                            pcm = await decoder.read(timeout=DECODER_READ_TIMEOUT)
                 except Exception as e:
                     # failed decode
-                    await ws.send_text(json.dumps({"type":"error","error": f"ffmpeg error: {e}"}))
+                    source = "frame" if frames is not None else "ffmpeg"
+                    await ws.send_text(json.dumps({"type":"error","error": f"{source} error: {e}"}))
                     continue
 
-                # keep buffer; rotate older files to maintain ~CHUNK_SECONDS of audio
-                SESSION_BUFFERS[session_id].append(tmp_wav_path)
-
-                # compute total covered seconds ~ we don't have exact durations easily here, but faster-whisper will accept the file
-                # For simplicity, trigger transcription whenever we have >1 file (or small bytes)
-                # Optionally compute sizes:
-                total_bytes = sum(Path(p).stat().st_size for p in SESSION_BUFFERS[session_id] if Path(p).exists())
-                if total_bytes < MIN_AUDIO_BYTES_FOR_TRANSCRIBE:
-                    # wait for more bytes
-                    await ws.send_text(json.dumps({"type":"ack","msg":"chunk_received","buffer_files": len(SESSION_BUFFERS[session_id])}))
-                    continue
-
-                # Merge all buffered wav files into a single temp wav for transcription
-                merged_tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-                merged_tmp_path = merged_tmp.name
-                merged_tmp.close()
-                try:
-                    # Use ffmpeg concat approach to join
-                    from core.audio_processor import combine_wavs
-                    combine_wavs(SESSION_BUFFERS[session_id], merged_tmp_path)
-
-                    # Transcribe merged file with faster-whisper
-                    model_obj = getattr(app.state, "model", None)
-                    if model_obj is None:
-                        await ws.send_text(json.dumps({"type":"error","error": "model not loaded"}))
-                        continue
-                    # We use model.transcribe(merged_tmp_path, language='en', beam_size=5) to get text
-                    # Note: faster-whisper returns segments generator/list
-                    segments, info = model_obj.transcribe(merged_tmp_path, beam_size=5, language="en", vad_filter=False)
-                    # Collect segments text
-                    partial_text = " ".join([seg.text.strip() for seg in segments]).strip()
-
-                    # compute diff vs session_full_text to send incremental updates
-                    if partial_text and (not session_full_text or partial_text != session_full_text):
-                        # choose to send partial or final depending on silence / command — here we treat it as partial and also update full
-                        session_full_text = partial_text
-                        await ws.send_text(json.dumps({"type":"partial","text": partial_text}))
-                        # persist to redis and publish
-                        await publish_transcript(session_id, session_full_text)
-
-                    # rotate buffer: keep only latest few files to bound disk usage
-                    # remove older files if we have >8 files
-                    while len(SESSION_BUFFERS[session_id]) > 8:
-                        old = SESSION_BUFFERS[session_id].pop(0)
+                if frames is not None and frames.jump is not None:
+                    await skip_to(frames.jump)
+                # the ring buffer overwrites its oldest audio once it is full
+                buffer.append(pcm)
+                if mels is not None:
+                    mels.append(pcm)
+                if history is not None:
+                    history.append(pcm)
+                AUDIO_SECONDS.inc(len(pcm) / SAMPLE_RATE, model=model_size)
+                await report_lag()
+
+                if VAD_ENABLED:
+                    # vad positions count samples since the stream start, like the buffer's
+                    with timed("vad", session_id):
+                        speech = vad.process(pcm)
+                    if vad.endpoint_sample is not None and executor is not None and executor.ready:
+                        # the speaker paused: finalize the utterance up to the pause
                         try:
-                            Path(old).unlink()
-                        except Exception:
+                            await finalize("endpoint", vad.endpoint_sample)
+                        except JobSuperseded:
                             pass
+                        except Exception as e:
+                            await ws.send_text(json.dumps({"type":"error","error": f"endpoint error: {e}"}))
+                    if not vad.speech_pending:
+                        # nothing but silence since the last final: no inference, keep a short preroll
+                        buffer.discard_until(hop_floor(buffer.end_sample - int(VAD_PREROLL_SECONDS * SAMPLE_RATE)))
+                        continue
+                    if not speech.any():
+                        # a pause that is too short to end the utterance, the tail is unchanged
+                        continue
 
-                except Exception as e:
-                    await ws.send_text(json.dumps({"type":"error","error": f"transcription error: {e}"}))
-                finally:
-                    # remove merged tmp
-                    try:
-                        Path(merged_tmp_path).unlink()
-                    except Exception:
-                        pass
+                if buffer.duration < MIN_AUDIO_SECONDS_FOR_TRANSCRIBE:
+                    # wait for more audio; protocol 2 clients send frames far too often to ack each
+                    if frames is not None:
+                        continue
+                    await ws.send_text(json.dumps({"type":"ack","msg":"chunk_received","buffer_seconds": round(buffer.duration, 3)}))
+                    continue
+
+                if executor is None or not executor.ready:
+                    await ws.send_text(json.dumps({"type":"error","error": "model not loaded"}))
+                    continue
+                if buffer.duration > policy.window_seconds(MAX_UNCOMMITTED_SECONDS):
+                    transcriber.force_commit(buffer.start_time + buffer.duration / 2)
+                    trim_committed()
+                # Transcribe the uncommitted audio off the event loop; copy it because
+                # the ring buffer keeps being written while the job waits
+                audio = buffer.view().copy()
+                task = asyncio.create_task(transcribe_partial(audio, buffer.start_time,
+                                                              window_features(buffer.start_sample, audio)))
+                partial_tasks.add(task)
+                task.add_done_callback(partial_tasks.discard)
 
             elif msg["type"] == "websocket.receive" and "text" in msg:
                 text = msg["text"]
@@ -200,45 +936,36 @@ async def websocket_transcribe(ws: WebSocket, session_id: Optional[str] = Query(
                 cmd = payload.get("command", "").lower()
                 if cmd == "flush":
                     # client requests to finalize current buffer into a final transcript
-                    # do one final transcription pass
-                    paths = SESSION_BUFFERS.get(session_id, [])
-                    if not paths:
-                        await ws.send_text(json.dumps({"type":"final","text": "", "full_text": session_full_text}))
+                    # pick up anything ffmpeg still holds, then do one final transcription pass
+                    if decoder is not None:
+                        pcm = await decoder.read(timeout=DECODER_READ_TIMEOUT)
+                        buffer.append(pcm)
+                        if mels is not None:
+                            mels.append(pcm)
+                        if history is not None:
+                            history.append(pcm)
+                        if VAD_ENABLED:
+                            vad.process(pcm)
+                    if VAD_ENABLED:
+                        vad.reset_utterance()
+                    if not len(buffer):
+                        _, utterance = transcriber.finish()
+                        await send_final(utterance, "flush")
+                        await publish_transcript(writer, transcriber, final=True)
                         continue
 
-                    merged_tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-                    merged_tmp_path = merged_tmp.name
-                    merged_tmp.close()
                     try:
-                        from core.audio_processor import combine_wavs
-                        combine_wavs(paths, merged_tmp_path)
-                        model_obj = getattr(app.state, "model", None)
-                        if model_obj is None:
+                        if executor is None or not executor.ready:
                             await ws.send_text(json.dumps({"type":"error","error": "model not loaded"}))
                             continue
-                        segments, info = model_obj.transcribe(merged_tmp_path, beam_size=5, language="en", vad_filter=False)
-                        final_text = " ".join([seg.text.strip() for seg in segments]).strip()
-                        session_full_text = final_text or session_full_text
-                        await ws.send_text(json.dumps({"type":"final","text": final_text, "full_text": session_full_text}))
-                        await publish_transcript(session_id, session_full_text)
-                        # clear buffer
-                        for p in list(SESSION_BUFFERS.get(session_id, [])):
-                            try:
-                                Path(p).unlink()
-                            except Exception:
-                                pass
-                        SESSION_BUFFERS[session_id] = []
+                        await finalize("flush")
                     except Exception as e:
                         await ws.send_text(json.dumps({"type":"error","error": f"flush error: {e}"}))
-                    finally:
-                        try:
-                            Path(merged_tmp_path).unlink()
-                        except Exception:
-                            pass
 
                 elif cmd == "end":
                     # client signals end-of-session; send final and close
                     await ws.send_text(json.dumps({"type":"info","msg":"ending session"}))
+                    ended = True
                     await ws.close()
                     break
 
@@ -246,19 +973,51 @@ async def websocket_transcribe(ws: WebSocket, session_id: Optional[str] = Query(
                     await ws.send_text(json.dumps({"type":"info","msg":"unknown command","payload":payload}))
 
     except WebSocketDisconnect:
-        print(f"Websocket disconnected for session_id={session_id}")
+        log.info("Websocket disconnected for session_id=%s", session_id)
+    except SessionTakenOver:
+        taken_over = True
+        log.info("Session %s resumed by another connection, closing this one", session_id)
+        try:
+            await ws.close(code=4004)
+        except Exception:
+            pass
     except Exception as e:
-        print("WS error:", e)
+        log.exception("WS error: %s", e)
     finally:
-        # cleanup
-        for p in SESSION_BUFFERS.get(session_id, []):
-            try:
-                Path(p).unlink()
-            except Exception:
-                pass
-        SESSION_BUFFERS.pop(session_id, None)
+        # cleanup: drop queued inference, stop the session's ffmpeg process and drop buffered audio
+        if executor is not None:
+            executor.cancel(session_id)
+        if second_pass is not None:
+            # results go to this connection only
+            second_pass.cancel(session_id)
+        for task in list(partial_tasks):
+            task.cancel()
+        # bookkeeping first: the awaits below can be cancelled when the server shuts down
+        TIER_SESSIONS[model_size] -= 1
+        if lagging:
+            LAGGING_SESSIONS[model_size] -= 1
+        if capacity is not None:
+            capacity.release(time.monotonic() - connected)
+        if TIER_SESSIONS[model_size] <= 0 and model_size != MODEL_SIZE:
+            asyncio.create_task(retire_executor(model_size))
+        forget_session(session_id)
+        try:
+            # an ended session is gone, a dropped one stays resumable until SESSION_TTL_SECONDS
+            if ended:
+                await sessions.delete(session_id, owner)
+            elif claimed and not taken_over:
+                await checkpoint(force=True)
+        except SessionTakenOver:
+            pass
+        except Exception as e:
+            log.warning("Could not save session %s: %s", session_id, e)
+        try:
+            if decoder is not None:
+                await decoder.close()
+        except Exception as e:
+            log.warning("Decoder shutdown error: %s", e)
         try:
             await ws.close()
         except Exception:
             pass
-        print(f"Cleaned up session {session_id}")
+        log.info("Cleaned up session %s", session_id)
@@ -1 +1,194 @@
-#Loading and cache LLMs functions
\ No newline at end of file
+#Loading and cache LLMs functions
+# backend/models/load_summary_model.py
+import os
+import queue
+import resource
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.logger import get_logger
+
+log = get_logger("summary_model")
+
+# instruction-tuned seq2seq, small enough for CPU; any AutoModelForSeq2SeqLM works
+DEFAULT_SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "google/flan-t5-base")
+
+
+def _rss_bytes() -> int:
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # no procfs (macOS): peak RSS is the best we have
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class LocalSummaryModel:
+    """
+    Local seq2seq summarizer (transformers + torch), loaded on first use.
+
+    - On CPU the Linear layers are dynamically quantized to int8, which roughly halves
+      memory and speeds up generation without a separate quantized checkpoint.
+    - Inputs longer than the model's context are cut into token windows that fit next
+      to the instruction; their summaries are joined.
+    - summarize() can be called from many threads at once: requests go to one generation
+      thread that waits up to `max_wait_ms` for more and runs them as one padded batch of
+      up to `max_batch_size`, so concurrent sessions share a forward pass.
+
+    info() reports load time and memory footprint.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_SUMMARY_MODEL, device: str = "cpu", quantize: bool = True,
+                 max_input_tokens: Optional[int] = None, max_new_tokens: int = 128, num_threads: int = 0,
+                 max_batch_size: int = 8, max_wait_ms: float = 20.0):
+        self.model_name = model_name
+        self.device = device
+        self.quantize = quantize and device == "cpu"
+        self.max_input_tokens = max_input_tokens
+        self.max_new_tokens = max_new_tokens
+        self.num_threads = num_threads
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.model = None
+        self.tokenizer = None
+        self.load_seconds: Optional[float] = None
+        self.memory_bytes: Optional[int] = None
+        self.param_bytes: Optional[int] = None
+        self._load_lock = threading.Lock()
+        self._requests: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"requests": 0, "batches": 0, "batched_inputs": 0}
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    def load(self):
+        """Load (and quantize) the model once; later calls return immediately."""
+        with self._load_lock:
+            if self.model is not None:
+                return
+            import torch
+            from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+            started, rss_before = time.perf_counter(), _rss_bytes()
+            if self.num_threads:
+                torch.set_num_threads(self.num_threads)
+            tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name)
+            model.eval()
+            if self.quantize:
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            model.to(self.device)
+            if self.max_input_tokens is None:
+                limit = getattr(tokenizer, "model_max_length", 512)
+                # some tokenizers report a huge sentinel instead of a real limit
+                self.max_input_tokens = limit if limit and limit < 100000 else 512
+            # quantized Linear weights are packed outside parameters(); count what is left
+            self.param_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+            self.tokenizer = tokenizer
+            self.model = model
+            self.load_seconds = time.perf_counter() - started
+            self.memory_bytes = max(0, _rss_bytes() - rss_before)
+            log.info("Summary model %s loaded in %.1fs (+%.0f MiB, int8=%s)", self.model_name, self.load_seconds,
+                     self.memory_bytes / 2**20, self.quantize)
+
+    def info(self) -> Dict[str, Any]:
+        batches = self._stats["batches"]
+        return dict(
+            self._stats,
+            model=self.model_name,
+            loaded=self.loaded,
+            quantized=self.quantize,
+            load_seconds=self.load_seconds,
+            memory_bytes=self.memory_bytes,
+            param_bytes=self.param_bytes,
+            max_input_tokens=self.max_input_tokens,
+            mean_batch_size=(self._stats["batched_inputs"] / batches) if batches else 0.0,
+        )
+
+    # --- chunking ---
+
+    def chunk_text(self, text: str, instruction: str) -> List[str]:
+        """Cut `text` into pieces whose tokens fit the context next to `instruction`."""
+        self.load()
+        budget = self.max_input_tokens - len(self.tokenizer(instruction + "\n\n")["input_ids"]) - 2
+        budget = max(32, budget)
+        ids = self.tokenizer(text, add_special_tokens=False)["input_ids"]
+        if len(ids) <= budget:
+            return [text]
+        return [self.tokenizer.decode(ids[i:i + budget], skip_special_tokens=True) for i in range(0, len(ids), budget)]
+
+    # --- batched generation ---
+
+    def summarize(self, texts: List[str], instruction: str) -> List[str]:
+        """Blocking; one summary per text. Safe to call from several threads."""
+        self.load()
+        self._ensure_thread()
+        pieces, owners = [], []
+        for i, text in enumerate(texts):
+            for piece in self.chunk_text(text, instruction):
+                pieces.append(f"{instruction}\n\n{piece}")
+                owners.append(i)
+        futures = []
+        for prompt in pieces:
+            future: Future = Future()
+            self._requests.put((prompt, future))
+            futures.append(future)
+        self._stats["requests"] += len(texts)
+        parts: List[List[str]] = [[] for _ in texts]
+        for owner, future in zip(owners, futures):
+            parts[owner].append(future.result())
+        return [" ".join(p).strip() for p in parts]
+
+    def _ensure_thread(self):
+        with self._load_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._generation_loop, name="summary-model", daemon=True)
+                self._thread.start()
+
+    def _generation_loop(self):
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                outputs = self._generate([prompt for prompt, _ in batch])
+                for (_, future), output in zip(batch, outputs):
+                    future.set_result(output)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            self._stats["batches"] += 1
+            self._stats["batched_inputs"] += len(batch)
+
+    def _generate(self, prompts: List[str]) -> List[str]:
+        import torch
+
+        encoded = self.tokenizer(prompts, return_tensors="pt", padding=True, truncation=True,
+                                 max_length=self.max_input_tokens).to(self.device)
+        with torch.inference_mode():
+            generated = self.model.generate(**encoded, max_new_tokens=self.max_new_tokens, num_beams=1)
+        return [t.strip() for t in self.tokenizer.batch_decode(generated, skip_special_tokens=True)]
+
+
+_models: Dict[tuple, LocalSummaryModel] = {}
+_models_lock = threading.Lock()
+
+def get_summary_model(model_name: str = DEFAULT_SUMMARY_MODEL, device: str = "cpu", quantize: bool = True,
+                      **kwargs) -> LocalSummaryModel:
+    """Shared instance per (model, device, quantize) for the whole process; it loads lazily on first use."""
+    key = (model_name, device, quantize)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            model = _models[key] = LocalSummaryModel(model_name, device=device, quantize=quantize, **kwargs)
+        return model
@@ -1,13 +1,240 @@
 #Loading and cache Whisper functions
 # backend/models/load_whisper.py
-from faster_whisper import WhisperModel
 import os
+import shutil
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
 
-_model = None
+from utils.logger import get_logger
 
-def get_model(model_size: str = "tiny.en", device: str = "cpu", compute_type: str = "int8"):
-    global _model
-    if _model is None:
-        # path or model size
-        _model = WhisperModel(model_size, device=device, compute_type=compute_type)
-    return _model
+log = get_logger("models")
+
+# approximate parameter counts (millions) of the Whisper checkpoints, longest prefix wins
+_WHISPER_PARAMS_M = {
+    "tiny": 39, "base": 74, "small": 244, "medium": 769, "large": 1550, "turbo": 809,
+    "distil-small": 166, "distil-medium": 394, "distil-large": 756, "large-v3-turbo": 809,
+}
+_BYTES_PER_PARAM = {
+    "int8": 1, "int8_float32": 1, "int8_float16": 1, "int8_bfloat16": 1,
+    "int16": 2, "float16": 2, "bfloat16": 2, "float32": 4,
+}
+
+ModelKey = Tuple[str, str, str, int]  # (model_size, device, compute_type, cpu_threads)
+
+# converted (CTranslate2) weights, one directory per model; once a model is in here startup
+# needs no network. Fill it ahead of time with: python -m models.load_whisper tiny.en small.en
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "stt-models"))
+MODEL_OFFLINE = os.getenv("MODEL_OFFLINE", "0") not in ("0", "false", "False")
+
+
+def estimate_model_bytes(model_size: str, compute_type: str = "int8") -> int:
+    """Rough resident size of a CTranslate2 Whisper model, used for the pool's memory budget."""
+    name = os.path.basename(str(model_size).rstrip("/")).lower().replace(".en", "")
+    prefix = max((p for p in _WHISPER_PARAMS_M if name.startswith(p)), key=len, default=None)
+    params = _WHISPER_PARAMS_M[prefix] if prefix else _WHISPER_PARAMS_M["small"]
+    # CTranslate2 keeps some layers in float and needs working buffers on top of the weights
+    return int(params * 1e6 * _BYTES_PER_PARAM.get(compute_type, 4) * 1.3)
+
+
+def resolve_model(model_size: str, cache_dir: Optional[str] = None, offline: Optional[bool] = None) -> str:
+    """
+    Local directory holding the converted weights of `model_size` (a faster-whisper size
+    like "tiny.en", a Hugging Face repo id, or a path, which is returned as is).
+
+    Cached models are used straight from `cache_dir` without asking the hub for updates;
+    a missing one is downloaded once into a temporary directory and moved into place, so
+    an interrupted download never looks complete. With `offline` a missing model raises
+    FileNotFoundError instead.
+    """
+    if os.path.isdir(model_size):
+        return model_size
+    cache_dir = cache_dir or MODEL_CACHE_DIR
+    offline = MODEL_OFFLINE if offline is None else offline
+    target = os.path.join(cache_dir, model_size.replace("/", "--"))
+    if os.path.isfile(os.path.join(target, "model.bin")):
+        return target
+    if offline:
+        raise FileNotFoundError(f"model {model_size!r} is not in the model cache {cache_dir} and MODEL_OFFLINE is set; "
+                                f"run: python -m models.load_whisper {model_size}")
+    from faster_whisper import download_model
+    os.makedirs(cache_dir, exist_ok=True)
+    partial = f"{target}.partial-{os.getpid()}"
+    started = time.perf_counter()
+    try:
+        download_model(model_size, output_dir=partial)
+        try:
+            os.replace(partial, target)
+        except OSError:
+            # another process finished the same download first
+            if not os.path.isfile(os.path.join(target, "model.bin")):
+                raise
+    finally:
+        shutil.rmtree(partial, ignore_errors=True)
+    log.info("Model cache: downloaded %s to %s in %.1fs", model_size, target, time.perf_counter() - started)
+    return target
+
+
+def _load_whisper(model_size: str, device: str, compute_type: str, cpu_threads: int, num_workers: int):
+    from faster_whisper import WhisperModel
+    # num_workers > 1 lets that many threads run transcribe() on this model concurrently
+    return WhisperModel(resolve_model(model_size), device=device, compute_type=compute_type,
+                        cpu_threads=cpu_threads, num_workers=num_workers)
+
+
+class _Entry:
+    __slots__ = ("key", "model", "refs", "bytes", "load_seconds", "last_used")
+
+    def __init__(self, key, model, nbytes, load_seconds):
+        self.key = key
+        self.model = model
+        self.refs = 0
+        self.bytes = nbytes
+        self.load_seconds = load_seconds
+        self.last_used = time.time()
+
+
+class ModelPool:
+    """
+    Process-wide cache of Whisper models keyed by (model_size, device, compute_type, cpu_threads).
+
+    acquire() returns the cached model for a key (loading it once, even when several
+    threads ask at the same time) and takes a reference; release() gives it back.
+    Unreferenced models stay loaded and warm until the estimated total exceeds
+    `memory_budget_mb`; then the least recently used unreferenced ones are dropped.
+    Referenced models are never evicted, so a budget that is too small is exceeded
+    rather than breaking running sessions. A budget of 0 means unlimited.
+
+    `num_workers` only matters for the first load of a key.
+    """
+
+    def __init__(self, memory_budget_mb: float = 0.0, loader: Callable = _load_whisper):
+        self.memory_budget = int(memory_budget_mb * 2**20)
+        self.loader = loader
+        self._entries: "OrderedDict[ModelKey, _Entry]" = OrderedDict()  # least recently used first
+        self._by_id: Dict[int, ModelKey] = {}
+        self._loading: Dict[ModelKey, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "loads": 0, "evictions": 0, "load_errors": 0}
+
+    @staticmethod
+    def key(model_size: str, device: str = "cpu", compute_type: str = "int8", cpu_threads: int = 0) -> ModelKey:
+        return (str(model_size), device, compute_type, int(cpu_threads))
+
+    def acquire(self, model_size: str, device: str = "cpu", compute_type: str = "int8",
+                cpu_threads: int = 0, num_workers: int = 1) -> Any:
+        key = self.key(model_size, device, compute_type, cpu_threads)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refs += 1
+                    entry.last_used = time.time()
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry.model
+                loading = self._loading.get(key)
+                if loading is None:
+                    # this thread loads it; make room first
+                    loading = self._loading[key] = threading.Event()
+                    self._evict_locked(estimate_model_bytes(model_size, compute_type))
+                    break
+            # another thread is loading the same weights: wait and take its result
+            loading.wait()
+
+        started = time.perf_counter()
+        try:
+            model = self.loader(model_size, device, compute_type, cpu_threads, num_workers)
+        except Exception:
+            with self._lock:
+                self._stats["load_errors"] += 1
+                del self._loading[key]
+            loading.set()
+            raise
+        with self._lock:
+            entry = _Entry(key, model, estimate_model_bytes(model_size, compute_type), time.perf_counter() - started)
+            entry.refs = 1
+            self._entries[key] = entry
+            self._by_id[id(model)] = key
+            self._stats["loads"] += 1
+            del self._loading[key]
+        loading.set()
+        log.info("Model pool: loaded %s in %.1fs (~%.0f MiB)", key, entry.load_seconds, entry.bytes / 2**20)
+        return model
+
+    def release(self, model: Any):
+        """Drop one reference taken by acquire(); unknown models are ignored."""
+        with self._lock:
+            key = self._by_id.get(id(model))
+            entry = self._entries.get(key) if key is not None else None
+            if entry is None:
+                return
+            entry.refs = max(0, entry.refs - 1)
+            entry.last_used = time.time()
+            self._evict_locked(0)
+
+    @contextmanager
+    def lease(self, model_size: str, device: str = "cpu", compute_type: str = "int8",
+              cpu_threads: int = 0, num_workers: int = 1):
+        model = self.acquire(model_size, device, compute_type, cpu_threads, num_workers)
+        try:
+            yield model
+        finally:
+            self.release(model)
+
+    @property
+    def used_bytes(self) -> int:
+        return sum(e.bytes for e in self._entries.values())
+
+    def _evict_locked(self, incoming: int):
+        if not self.memory_budget:
+            return
+        while self.used_bytes + incoming > self.memory_budget:
+            victim = next((e for e in self._entries.values() if e.refs == 0), None)
+            if victim is None:
+                log.warning("Model pool over budget (%.0f MiB), every loaded model is in use",
+                            (self.used_bytes + incoming) / 2**20)
+                return
+            del self._entries[victim.key]
+            self._by_id.pop(id(victim.model), None)
+            self._stats["evictions"] += 1
+            log.info("Model pool: evicted %s", victim.key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = [
+                {"model": k[0], "device": k[1], "compute_type": k[2], "cpu_threads": k[3], "refs": e.refs,
+                 "mib": round(e.bytes / 2**20), "load_seconds": round(e.load_seconds, 2)}
+                for k, e in self._entries.items()
+            ]
+            return dict(self._stats, budget_mib=round(self.memory_budget / 2**20), used_mib=round(self.used_bytes / 2**20),
+                        loading=len(self._loading), models=models)
+
+
+_pool: Optional[ModelPool] = None
+_pool_lock = threading.Lock()
+
+def get_model_pool() -> ModelPool:
+    """The process-wide pool (MODEL_POOL_BUDGET_MB, 0 = unlimited)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ModelPool(float(os.getenv("MODEL_POOL_BUDGET_MB", "0")))
+        return _pool
+
+def get_model(model_size: str = "tiny.en", device: str = "cpu", compute_type: str = "int8",
+              cpu_threads: int = 0, num_workers: int = 1):
+    """Take a reference to the pooled model for this config; pair with release_model()."""
+    return get_model_pool().acquire(model_size, device, compute_type, cpu_threads, num_workers)
+
+def release_model(model: Any):
+    get_model_pool().release(model)
+
+
+if __name__ == "__main__":
+    # python -m models.load_whisper [model ...]: put models into MODEL_CACHE_DIR (e.g. at image build time)
+    for name in sys.argv[1:] or [os.getenv("MODEL_SIZE", "tiny.en")]:
+        log.info("%s: %s", name, resolve_model(name, offline=False))
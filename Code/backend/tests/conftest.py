@@ -0,0 +1,66 @@
+# Tests import the backend the way main.py does (core.*, utils.*):
+#   cd Code/backend && python -m pytest -q
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeModel:
+    """Stands in for a faster-whisper model: one word every half second of audio, no real decoding."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = []
+
+    def transcribe(self, audio, **options):
+        import time
+
+        self.calls.append(options)
+        time.sleep(self.delay)
+        seconds = len(audio) / 16000
+        words = [SimpleNamespace(start=i * 0.5, end=i * 0.5 + 0.4, word=f" w{i}", probability=0.9)
+                 for i in range(int(seconds * 2))]
+        segment = SimpleNamespace(id=1, seek=0, start=0.0, end=seconds, text="".join(w.word for w in words),
+                                  words=words if options.get("word_timestamps") else None, tokens=[],
+                                  avg_logprob=-0.1, no_speech_prob=0.0, compression_ratio=1.0, temperature=0.0)
+        return iter([segment]), SimpleNamespace(duration=seconds, language="en")
+
+
+class GatedModel(FakeModel):
+    """FakeModel that holds every decode until `gate` (a threading.Event) is set."""
+
+    def __init__(self, gate):
+        super().__init__()
+        self.gate = gate
+
+    def transcribe(self, audio, **options):
+        self.gate.wait(5)
+        return super().transcribe(audio, **options)
+
+
+async def wait_until(condition, timeout=5.0):
+    """Poll `condition` on the running loop until it holds."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """main with FakeModel for every tier and no Redis; start it with fastapi.testclient.TestClient(server.app)."""
+    import redis.asyncio
+
+    import main
+
+    def no_redis(*args, **kwargs):
+        raise ConnectionError("no redis in tests")
+
+    monkeypatch.setattr(main, "get_model", lambda *args, **kwargs: FakeModel())
+    monkeypatch.setattr(redis.asyncio, "from_url", no_redis)
+    return main
@@ -0,0 +1,130 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from core import admission
+from core.admission import AdmissionRejected, CapacityManager
+
+
+@pytest.fixture
+def load(monkeypatch):
+    """A two-worker tier whose clock, busy time and received audio the test sets by hand."""
+    state = SimpleNamespace(now=1000.0, audio=0.0,
+                            executor=SimpleNamespace(workers=2, busy_seconds=0.0, queue_depth=0))
+    monkeypatch.setattr(admission, "time", SimpleNamespace(monotonic=lambda: state.now))
+    return state
+
+
+def manager(load, **kwargs):
+    kwargs.setdefault("queue_seconds", 0)
+    return CapacityManager("tiny.en", lambda: load.executor, lambda: load.audio, **kwargs)
+
+
+def run_for(load, capacity, seconds, busy, audio):
+    capacity.measure()
+    load.now += seconds
+    load.executor.busy_seconds += busy
+    load.audio += audio
+
+
+def test_without_a_measurement_only_max_sessions_limits(load):
+    capacity = manager(load, max_sessions=2, retry_after=4.2)
+
+    async def scenario():
+        await capacity.admit()
+        await capacity.admit()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await capacity.admit()
+        assert rejected.value.retry_after == 5
+
+    asyncio.run(scenario())
+    assert capacity.capacity == 2 and capacity.stats()["rejected"] == 1
+
+
+def test_capacity_follows_the_measured_real_time_factor(load):
+    capacity = manager(load, target_utilization=0.8)
+    # 60 s of audio cost 24 s of inference: rtf 0.4, the workers were busy a fifth of the time
+    run_for(load, capacity, 60.0, busy=24.0, audio=60.0)
+    rtf, utilization = capacity.measure()
+    assert rtf == pytest.approx(0.4) and utilization == pytest.approx(0.2)
+    assert capacity.capacity == 4  # 2 workers * 0.8 / 0.4
+
+    async def scenario():
+        for _ in range(4):
+            await capacity.admit()
+        with pytest.raises(AdmissionRejected):
+            await capacity.admit()
+
+    asyncio.run(scenario())
+
+
+def test_saturated_workers_take_no_new_sessions(load):
+    capacity = manager(load, target_utilization=0.8)
+    # a coalescing tier looks cheap per audio second while its workers are flat out
+    run_for(load, capacity, 60.0, busy=110.0, audio=600.0)
+    capacity.active = 3
+    assert capacity.capacity == 3
+
+
+def test_deep_inference_queue_blocks_admission(load):
+    capacity = manager(load, max_queue_depth=8)
+
+    async def scenario():
+        load.executor.queue_depth = 50
+        await capacity.admit()  # one session is always served
+        with pytest.raises(AdmissionRejected):
+            await capacity.admit()
+        load.executor.queue_depth = 8
+        await capacity.admit()
+
+    asyncio.run(scenario())
+
+
+def test_queued_session_gets_the_next_free_slot(load):
+    capacity = manager(load, max_sessions=1, queue_seconds=5.0, max_queued=1, poll_seconds=0.05)
+    positions = []
+
+    async def on_queued(position, max_wait):
+        positions.append((position, max_wait))
+
+    async def scenario():
+        await capacity.admit()
+        waiting = asyncio.create_task(capacity.admit(on_queued))
+        await asyncio.sleep(0.05)
+        assert positions == [(1, 5.0)] and not waiting.done()
+        # the line holds one session
+        with pytest.raises(AdmissionRejected):
+            await capacity.admit()
+        capacity.release(30.0)
+        assert await asyncio.wait_for(waiting, 1.0) > 0.0
+        assert capacity.active == 1
+
+    asyncio.run(scenario())
+    assert capacity.stats()["queued"] == 1 and capacity.stats()["rejected"] == 1
+
+
+def test_queued_session_is_rejected_when_no_slot_frees_up(load):
+    capacity = manager(load, max_sessions=1, queue_seconds=0.1, poll_seconds=0.02)
+
+    async def scenario():
+        await capacity.admit()
+        with pytest.raises(AdmissionRejected):
+            await capacity.admit()
+        assert capacity.stats()["waiting"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_hint_comes_from_how_long_sessions_stay(load):
+    capacity = manager(load, max_sessions=4, retry_after=5.0)
+    assert capacity.retry_after_hint() == 5
+    capacity.active = 1
+    capacity.release(100.0)
+    # a slot turns over every 100 s / 4 sessions
+    assert capacity.retry_after_hint() == 25
+    capacity._waiting.extend([object(), object()])
+    assert capacity.retry_after_hint() == 60  # capped
+    capacity._waiting.clear()
+    capacity.release(0.0)  # smoothed, not replaced
+    assert capacity.retry_after_hint() == 20
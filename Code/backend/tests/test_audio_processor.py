@@ -0,0 +1,250 @@
+import struct
+
+import numpy as np
+import pytest
+
+from core import audio_processor
+from core.audio_processor import FRAME_HEADER, EnergyVAD, FrameDecoder, LogMelCache, decode_file, load_wav, resample
+from utils.chunk_utils import PCMRingBuffer
+
+
+SAMPLE_RATE = 16000
+rng = np.random.default_rng(0)
+
+
+def voiced(seconds):
+    """A steady two-harmonic tone: loud and far from spectrally flat, like voiced speech."""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.2 * np.sin(2 * np.pi * 180 * t) + 0.1 * np.sin(2 * np.pi * 360 * t)).astype(np.float32)
+
+
+def quiet(seconds, level=1e-4):
+    return (rng.standard_normal(int(seconds * SAMPLE_RATE)) * level).astype(np.float32)
+
+
+def test_pause_after_speech_is_an_endpoint():
+    vad = EnergyVAD(SAMPLE_RATE)
+    speech = vad.process(np.concatenate([quiet(0.5), voiced(1.0), quiet(1.2)]))
+    assert speech[20:45].all() and not speech[:15].any()
+    # the pause starts where the hangover (240 ms) after the last voiced frame ends
+    assert vad.endpoint_sample == 24000 + 3840
+    assert not vad.speech_pending and vad.trailing_silence == 0.96
+
+
+def test_endpoint_is_reported_in_the_chunk_that_completes_the_pause():
+    vad = EnergyVAD(SAMPLE_RATE)
+    audio = np.concatenate([quiet(0.5), voiced(1.0), quiet(1.2)])
+    endpoints = []
+    for start in range(0, len(audio), 1600):
+        vad.process(audio[start:start + 1600])
+        if vad.endpoint_sample is not None:
+            endpoints.append((start, vad.endpoint_sample))
+    # 800 ms (endpoint_ms) of silence after sample 27840 is complete in the chunk at 40000
+    assert endpoints == [(40000, 27840)]
+
+
+def test_short_pauses_between_words_keep_the_utterance_open():
+    vad = EnergyVAD(SAMPLE_RATE)
+    vad.process(np.concatenate([quiet(0.5), voiced(0.5), quiet(0.3), voiced(0.5), quiet(0.3)]))
+    assert vad.endpoint_sample is None and vad.speech_pending
+
+
+def test_broadband_noise_is_not_speech():
+    vad = EnergyVAD(SAMPLE_RATE)
+    assert not vad.process(quiet(1.0, level=0.3)).any()
+    assert not vad.speech_pending
+
+
+def test_restored_detector_finds_the_same_endpoint():
+    audio = np.concatenate([quiet(0.5), voiced(1.0), quiet(1.2)])
+    vad = EnergyVAD(SAMPLE_RATE)
+    vad.process(audio[:20000])  # ends mid-frame
+    resumed = EnergyVAD(SAMPLE_RATE)
+    resumed.restore(vad.state())
+    resumed.process(audio[20000:])
+    assert resumed.endpoint_sample == 27840 and not resumed.speech_pending
+
+
+def frame(seq, position, samples):
+    pcm = (np.asarray(samples, dtype=np.float32) * 32767).astype("<i2").tobytes()
+    return FRAME_HEADER.pack(seq, position) + pcm
+
+
+def test_long_gap_reports_where_the_stream_continues():
+    decoder = FrameDecoder(sample_rate=16000, max_gap_seconds=1.0)
+    decoder.decode(frame(0, 0, np.zeros(1600)))
+    samples = decoder.decode(frame(1, 48000, np.zeros(1600)))
+    assert len(samples) == 1600 and decoder.jump == 48000
+    assert decoder.position == 49600 and decoder.stats["skipped_samples"] == 46400
+    # the next frame carries on normally
+    decoder.decode(frame(2, 49600, np.zeros(1600)))
+    assert decoder.jump is None and decoder.position == 51200
+
+
+def test_buffers_follow_the_clients_clock_after_a_gap():
+    decoder = FrameDecoder(sample_rate=16000, max_gap_seconds=1.0)
+    buffer = PCMRingBuffer(10.0, 16000)
+    vad = EnergyVAD(sample_rate=16000)
+    for seq, position in enumerate((0, 1600, 64000, 65600)):
+        samples = decoder.decode(frame(seq, position, np.full(1600, 0.1)))
+        if decoder.jump is not None:
+            buffer.seek(decoder.jump)
+            vad.seek(decoder.jump)
+            # the missing audio counts as silence: no utterance is left open across it
+            assert not vad.speech_pending and vad.trailing_silence >= 3.8
+        buffer.append(samples)
+        vad.process(samples)
+    assert buffer.start_sample == 64000 and buffer.end_sample == 67200
+    assert vad._frames_seen * vad.frame_len + len(vad._remainder) == 67200
+
+
+def test_frames_in_order_follow_the_clients_clock():
+    decoder = FrameDecoder(sample_rate=16000)
+    out = [decoder.decode(frame(seq, seq * 320, np.full(320, 0.5))) for seq in range(3)]
+    assert [len(samples) for samples in out] == [320, 320, 320]
+    assert np.allclose(np.concatenate(out), 0.5, atol=1e-4)
+    assert decoder.position == 960 and decoder.jump is None
+
+
+def test_lost_frames_become_silence():
+    decoder = FrameDecoder(sample_rate=16000, max_gap_seconds=1.0)
+    decoder.decode(frame(0, 0, np.full(320, 0.5)))
+    samples = decoder.decode(frame(3, 960, np.full(320, 0.5)))  # frames 1 and 2 never arrived
+    assert len(samples) == 960 and not samples[:640].any() and np.allclose(samples[640:], 0.5, atol=1e-4)
+    assert decoder.position == 1280 and decoder.stats["lost_samples"] == 640 and decoder.jump is None
+
+
+def test_duplicates_are_dropped_and_overlaps_trimmed():
+    decoder = FrameDecoder(sample_rate=16000)
+    decoder.decode(frame(0, 0, np.full(320, 0.5)))
+    decoder.decode(frame(1, 320, np.full(320, 0.5)))
+    assert len(decoder.decode(frame(1, 320, np.full(320, 0.5)))) == 0
+    assert len(decoder.decode(frame(0, 0, np.full(320, 0.5)))) == 0
+    assert decoder.stats["duplicates"] == 2 and decoder.position == 640
+    # a resent frame that starts 160 samples back only adds what is new
+    samples = decoder.decode(frame(2, 480, np.full(320, 0.25)))
+    assert len(samples) == 160 and decoder.position == 800
+
+
+def test_malformed_frames_are_rejected():
+    decoder = FrameDecoder(sample_rate=16000)
+    with pytest.raises(ValueError):
+        decoder.decode(b"\x00" * 4)
+    with pytest.raises(ValueError):
+        decoder.decode(FRAME_HEADER.pack(0, 0) + b"\x00\x00\x00")
+    with pytest.raises(ValueError):
+        FrameDecoder(codec="mp3")
+
+
+def wav(payload, channels=1, rate=16000, bits=16, tag=1, data_size=None):
+    """A minimal RIFF/WAVE file around `payload` (interleaved samples)."""
+    fmt = struct.pack("<HHIIHH", tag, channels, rate, rate * channels * bits // 8, channels * bits // 8, bits)
+    size = len(payload) if data_size is None else data_size
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"LIST" + struct.pack("<I", 3) + b"abc\0"
+    body += b"data" + struct.pack("<I", size) + payload
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def tone(freq, seconds, rate, amplitude=0.5):
+    return (amplitude * np.sin(2 * np.pi * freq * np.arange(int(seconds * rate)) / rate)).astype(np.float32)
+
+
+def peak_hz(samples, rate):
+    spectrum = np.abs(np.fft.rfft(samples * np.hanning(len(samples))))
+    return np.argmax(spectrum) * rate / len(samples)
+
+
+def test_pcm16_mono():
+    ints = np.array([0, 16384, -16384, 32767, -32768], dtype="<i2")
+    samples = load_wav(wav(ints.tobytes()), dc_removal=False)
+    assert samples.dtype == np.float32
+    assert np.array_equal(samples, ints / 32768.0)
+
+
+def test_24_bit_stereo_is_downmixed():
+    left = np.array([0, 2 ** 22, -2 ** 22, 2 ** 23 - 1], dtype=np.int32)
+    right = np.array([0, 0, -2 ** 22, -(2 ** 23)], dtype=np.int32)
+    interleaved = np.column_stack([left, right]).reshape(-1)
+    payload = b"".join(int(v).to_bytes(3, "little", signed=True) for v in interleaved)
+    samples = load_wav(wav(payload, channels=2, bits=24), dc_removal=False)
+    assert np.allclose(samples, (left + right) / 2 / 2 ** 23)
+
+
+def test_float32_and_placeholder_data_size():
+    audio = tone(440, 0.1, 16000)
+    # streamed WAVs often say 0xFFFFFFFF for the data size
+    samples = load_wav(wav(audio.tobytes(), bits=32, tag=3, data_size=0xFFFFFFFF), dc_removal=False)
+    assert np.array_equal(samples, audio)
+
+
+def test_resampled_to_16k():
+    audio = tone(1000, 1.0, 44100)
+    samples = load_wav(wav((audio * 32767).astype("<i2").tobytes(), rate=44100), dc_removal=False)
+    assert len(samples) == 16000
+    assert peak_hz(samples, 16000) == pytest.approx(1000, abs=2)
+    # away from the edges the tone keeps its level
+    assert np.abs(samples[800:-800]).max() == pytest.approx(0.5, abs=0.01)
+
+
+def test_resampling_removes_what_16k_cannot_hold():
+    # 10 kHz is above the 8 kHz Nyquist frequency of the output: it must not fold back to 6 kHz
+    samples = resample(tone(10000, 1.0, 48000), 48000, 16000)
+    assert np.sqrt(np.mean(samples[800:-800] ** 2)) < 0.005
+
+
+def test_resampling_matches_interpolation_of_a_slow_signal():
+    audio = tone(50, 1.0, 22050)
+    samples = resample(audio, 22050, 16000)
+    expected = np.interp(np.arange(len(samples)) / 16000, np.arange(len(audio)) / 22050, audio)
+    assert np.abs(samples - expected)[400:-400].max() < 1e-3
+
+
+def test_unsupported_encodings_go_through_ffmpeg(tmp_path, monkeypatch):
+    adpcm = wav(b"\0" * 64, bits=4, tag=2)
+    with pytest.raises(ValueError):
+        load_wav(adpcm)
+    calls = []
+
+    def fake_ffmpeg(path, sample_rate=16000):
+        calls.append(path)
+        return np.ones(10, dtype=np.float32)
+
+    monkeypatch.setattr(audio_processor, "decode_with_ffmpeg", fake_ffmpeg)
+    path = tmp_path / "adpcm.wav"
+    path.write_bytes(adpcm)
+    assert len(decode_file(str(path))) == 10 and calls == [str(path)]
+    # plain PCM never does
+    path.write_bytes(wav(np.zeros(160, dtype="<i2").tobytes()))
+    assert len(decode_file(str(path))) == 160 and len(calls) == 1
+
+
+@pytest.mark.parametrize("n_mels", [80, 128])
+def test_cached_log_mel_equals_the_feature_extractor(n_mels):
+    feature_extractor = pytest.importorskip("faster_whisper.feature_extractor")
+    extractor = feature_extractor.FeatureExtractor(feature_size=n_mels)
+    audio = quiet(6.0, level=0.1) * np.sin(np.arange(6 * SAMPLE_RATE) / 3000).astype(np.float32)
+    cache = LogMelCache(5.0, n_mels=n_mels)
+    position = 0
+    for n in (1000, 3333, 160, 7, 16000, 20000, 55500):  # chunks of any size, not hop-aligned
+        cache.append(audio[position:position + n])
+        position += n
+    # windows of any length, as long as they start on a hop and are still held
+    for start, end in ((16000, position), (32000, 48000), (40000, 41600), (40000, position - 100)):
+        features = cache.window(start, audio[start:end])
+        assert np.allclose(features, extractor(audio[start:end]), atol=1e-5)
+    assert cache.window(16160 + 1, audio[16161:40000]) is None  # off the hop grid
+    assert cache.window(0, audio[:40000]) is None  # older than capacity_seconds
+
+
+def test_log_mel_cache_continues_after_a_seek():
+    feature_extractor = pytest.importorskip("faster_whisper.feature_extractor")
+    extractor = feature_extractor.FeatureExtractor()
+    audio = quiet(2.0, level=0.1)
+    cache = LogMelCache(5.0)
+    cache.append(audio[:8000])
+    # the stream resumes at 80000 (a restored session, or after a gap)
+    cache.seek(80000)
+    cache.append(audio)
+    assert cache.window(80000 - 160, audio) is None
+    assert np.allclose(cache.window(80000, audio), extractor(audio), atol=1e-5)
+    assert np.allclose(cache.window(80000 + 3200, audio[3200:]), extractor(audio[3200:]), atol=1e-5)
@@ -0,0 +1,55 @@
+import numpy as np
+
+from utils.chunk_utils import PCMRingBuffer
+
+
+def ramp(start, n):
+    """Samples whose value is their absolute index, so every read can be checked exactly."""
+    return np.arange(start, start + n, dtype=np.float32)
+
+
+def test_wraps_and_keeps_the_newest_audio():
+    buffer = PCMRingBuffer(1.0, sample_rate=10)  # 10 samples
+    position = 0
+    for n in (4, 7, 3, 9):
+        buffer.append(ramp(position, n))
+        position += n
+    assert (buffer.start_sample, buffer.end_sample) == (13, 23)
+    assert len(buffer) == 10 and buffer.duration == 1.0
+    assert np.array_equal(buffer.view(), ramp(13, 10))
+    assert np.array_equal(buffer.window(15, 19), ramp(15, 4))
+    # clipped to what is held
+    assert np.array_equal(buffer.window(0, 15), ramp(13, 2))
+    assert len(buffer.window(30)) == 0
+
+
+def test_windows_across_the_wrap_are_contiguous_views():
+    buffer = PCMRingBuffer(1.0, sample_rate=10)
+    buffer.append(ramp(0, 8))
+    buffer.append(ramp(8, 6))  # wraps at sample 10
+    window = buffer.window(6, 14)
+    assert np.array_equal(window, ramp(6, 8))
+    assert window.flags.c_contiguous and np.shares_memory(window, buffer._buf)
+
+
+def test_append_longer_than_capacity_keeps_its_tail():
+    buffer = PCMRingBuffer(1.0, sample_rate=10)
+    buffer.append(ramp(0, 3))
+    buffer.append(ramp(3, 25))
+    assert (buffer.start_sample, buffer.end_sample) == (18, 28)
+    assert np.array_equal(buffer.view(), ramp(18, 10))
+
+
+def test_discard_seek_and_clear_move_the_absolute_position():
+    buffer = PCMRingBuffer(1.0, sample_rate=10)
+    buffer.append(ramp(0, 8))
+    buffer.discard_until(5)
+    assert np.array_equal(buffer.view(), ramp(5, 3))
+    buffer.discard_until(2)  # never goes back
+    assert buffer.start_sample == 5
+    buffer.clear()
+    assert len(buffer) == 0 and buffer.end_sample == 8
+    buffer.seek(100)
+    buffer.append(ramp(100, 4))
+    assert (buffer.start_sample, buffer.end_time) == (100, 10.4)
+    assert np.array_equal(buffer.view(0.2), ramp(102, 2))
@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+import pytest
+
+from core import decoding_policy
+from core.decoding_policy import DecodingPolicy
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A monotonic clock the test moves by hand."""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(decoding_policy, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_partials_are_greedy_and_finals_use_beam_search(clock):
+    policy = DecodingPolicy("tiny.en")
+    assert policy.options("partial")["beam_size"] == 1
+    final = policy.options("final")
+    assert final["beam_size"] == 5 and final["temperature"][0] == 0.0
+    assert policy.window_seconds(10.0) == 10.0
+
+
+def test_slow_partials_step_down_one_level_per_dwell(clock):
+    policy = DecodingPolicy("tiny.en", target_latency=1.0, dwell_seconds=3.0)
+    policy.observe_partial(2.5)
+    assert policy.options("final")["beam_size"] == 5  # within the dwell since start
+    levels = []
+    for _ in range(5):
+        clock.value += 3.1
+        policy.observe_partial(2.5)
+        policy.options("partial")
+        levels.append(policy.level)
+        policy.options("partial")  # at most one step per dwell
+        assert policy.level == levels[-1]
+    assert levels == [1, 2, 3, 3, 3]
+    assert policy.current.name == "minimal" and policy.window_seconds(10.0) == 5.0
+    assert policy.stats()["changes"] == {"down": 3, "up": 0}
+
+
+def test_deep_queue_steps_down(clock):
+    policy = DecodingPolicy("tiny.en", max_queue_depth=4, dwell_seconds=3.0)
+    clock.value += 3.1
+    policy.options("final", queue_depth=4)
+    assert policy.level == 0
+    assert policy.options("final", queue_depth=5)["beam_size"] == 2
+    assert policy.current.name == "reduced"
+
+
+def test_recovers_once_latency_and_queue_are_well_below_the_limits(clock):
+    policy = DecodingPolicy("tiny.en", target_latency=1.0, max_queue_depth=4, dwell_seconds=3.0, smoothing=1.0)
+    for _ in range(2):
+        clock.value += 3.1
+        policy.observe_partial(2.0)
+        policy.update()
+    assert policy.level == 2
+    # below the target but not by recover_ratio: stays
+    clock.value += 3.1
+    policy.observe_partial(0.8)
+    policy.update(queue_depth=0)
+    assert policy.level == 2
+    clock.value += 3.1
+    policy.observe_partial(0.3)
+    policy.update(queue_depth=3)  # queue above max_queue_depth * recover_ratio
+    assert policy.level == 2
+    policy.update(queue_depth=2)
+    assert policy.level == 1
+    policy.update(queue_depth=0)
+    assert policy.level == 1  # dwell
+    clock.value += 3.1
+    policy.observe_partial(0.3)
+    policy.update(queue_depth=0)
+    assert policy.level == 0 and policy.stats()["changes"] == {"down": 2, "up": 2}
+
+
+def test_latency_without_recent_partials_is_forgotten(clock):
+    policy = DecodingPolicy("tiny.en", target_latency=1.0, dwell_seconds=3.0)
+    clock.value += 3.1
+    policy.observe_partial(5.0)
+    policy.update()
+    assert policy.level == 1
+    # the sessions went quiet; the old latency must not keep the tier degraded
+    clock.value += 10.0
+    policy.update()
+    assert policy.latency is None and policy.level == 0
+
+
+def test_fixed_policy_never_changes(clock):
+    policy = DecodingPolicy("tiny.en", adaptive=False)
+    clock.value += 100.0
+    policy.observe_partial(10.0)
+    assert policy.options("final", queue_depth=100)["beam_size"] == 5 and policy.level == 0
@@ -0,0 +1,165 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from conftest import GatedModel, wait_until
+from core.inference_executor import DeficitRoundRobin, InferenceExecutor, InferenceQueueFull, JobSuperseded
+
+
+def window(seconds=1.0):
+    return np.zeros(int(seconds * 16000), dtype=np.float32)
+
+
+async def started_executor(gate, **kwargs):
+    """One worker, busy with session "a" until `gate` is set."""
+    model = GatedModel(gate)
+    executor = InferenceExecutor(lambda: model, workers=1, **kwargs)
+    await executor.start()
+    running = asyncio.create_task(executor.submit("a", window()))
+    await wait_until(lambda: executor.running == 1)
+    return executor, model, running
+
+
+def test_newer_window_supersedes_a_waiting_one():
+    async def scenario():
+        gate = threading.Event()
+        executor, model, running = await started_executor(gate)
+        try:
+            old = asyncio.create_task(executor.submit("b", window(1.0)))
+            await wait_until(lambda: executor.queue_depth == 1)
+            new = asyncio.create_task(executor.submit("b", window(2.0)))
+            with pytest.raises(JobSuperseded):
+                await old
+            assert executor.queue_depth == 1
+            gate.set()
+            await running
+            segments, info = await new
+            assert info["duration"] == 2.0
+            # the superseded window never reached the model
+            assert len(model.calls) == 2
+            assert executor.stats()["superseded"] == 1
+        finally:
+            gate.set()
+            await executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_rejects_new_sessions():
+    async def scenario():
+        gate = threading.Event()
+        executor, model, running = await started_executor(gate, max_pending=1)
+        try:
+            waiting = asyncio.create_task(executor.submit("b", window()))
+            await wait_until(lambda: executor.queue_depth == 1)
+            with pytest.raises(InferenceQueueFull):
+                await executor.submit("c", window())
+            # a session already waiting still gets its newer window in
+            newer = asyncio.create_task(executor.submit("b", window(2.0)))
+            with pytest.raises(JobSuperseded):
+                await waiting
+            gate.set()
+            await running
+            assert (await newer)[1]["duration"] == 2.0
+            assert executor.stats()["rejected"] == 1
+        finally:
+            gate.set()
+            await executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_cancel_drops_the_waiting_window():
+    async def scenario():
+        gate = threading.Event()
+        executor, model, running = await started_executor(gate)
+        try:
+            waiting = asyncio.create_task(executor.submit("b", window()))
+            await wait_until(lambda: executor.queue_depth == 1)
+            # what the WebSocket handler does when its client disconnects
+            executor.cancel("b")
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+            assert executor.queue_depth == 0
+            gate.set()
+            await running
+            assert len(model.calls) == 1
+            assert executor.stats()["cancelled"] == 1
+            assert not executor.busy
+        finally:
+            gate.set()
+            await executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_round_robin_gives_backlogged_sessions_equal_audio_seconds():
+    fair = DeficitRoundRobin(quantum=2.0)
+    windows = {"long": 20.0, "short": 2.0, "mid": 5.0}
+    served = dict.fromkeys(windows, 0.0)
+    turns = []
+    for _ in range(300):
+        session_id = fair.pick(list(windows.items()), windows)
+        served[session_id] += windows[session_id]
+        turns.append(session_id)
+    # every session got about the same inference time, within one long window
+    assert max(served.values()) - min(served.values()) <= 20.0
+    assert turns.count("short") == 10 * turns.count("long")
+
+
+def test_round_robin_takes_equal_sessions_in_turn():
+    fair = DeficitRoundRobin(quantum=2.0)
+    sessions = [("a", 2.0), ("b", 2.0), ("c", 2.0)]
+    assert [fair.pick(sessions, {"a", "b", "c"}) for _ in range(6)] == ["a", "b", "c", "a", "b", "c"]
+    # a session whose window is already running is skipped, not charged
+    assert fair.pick(sessions[1:], {"a", "b", "c"}) == "b"
+    assert fair.pick(sessions, {"a", "b", "c"}) == "c"
+    # shorter windows: a turn (one quantum) covers two of them
+    assert [fair.pick([("a", 1.0), ("b", 1.0)], {"a", "b"}) for _ in range(4)] == ["a", "a", "b", "b"]
+
+
+def test_idle_session_loses_its_deficit():
+    def picks_until_b(fair):
+        picks = [fair.pick([("a", 1.0), ("b", 10.0)], {"a", "b"})]
+        while picks[-1] != "b":
+            picks.append(fair.pick([("a", 1.0), ("b", 10.0)], {"a", "b"}))
+        return len(picks) - 1
+
+    # "a" runs first, "b" has saved up 8 s meanwhile and runs right after
+    backlogged = DeficitRoundRobin(quantum=2.0)
+    assert backlogged.pick([("a", 10.0), ("b", 10.0)], {"a", "b"}) == "a"
+    assert picks_until_b(backlogged) == 0
+
+    # if "b" goes idle instead, it comes back with nothing saved and waits its turns
+    idle = DeficitRoundRobin(quantum=2.0)
+    idle.pick([("a", 10.0), ("b", 10.0)], {"a", "b"})
+    assert idle.pick([("a", 1.0)], {"a"}) == "a"
+    assert len(idle) == 1
+    assert picks_until_b(idle) == 9
+
+
+def test_executor_shares_workers_by_audio_seconds():
+    async def scenario():
+        gate = threading.Event()
+        executor, model, running = await started_executor(gate, fair_quantum=2.0)
+        try:
+            order = []
+
+            async def session(session_id, seconds, count):
+                for _ in range(count):
+                    await executor.submit(session_id, window(seconds))
+                    order.append(session_id)
+
+            sessions = [asyncio.create_task(session("long", 8.0, 2)), asyncio.create_task(session("short", 2.0, 8))]
+            await wait_until(lambda: executor.queue_depth == 2)
+            gate.set()
+            await asyncio.gather(running, *sessions)
+            # while both are backlogged, "short" runs four 2 s windows per 8 s window of "long"
+            assert order[:5].count("short") == 4
+        finally:
+            gate.set()
+            await executor.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import struct
+import time
+
+import numpy as np
+
+import pytest
+from fastapi.testclient import TestClient
+
+import benchmark
+from conftest import FakeModel
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def test_readyz_once_the_model_is_loaded(server):
+    with TestClient(server.app) as client:
+        assert benchmark.wait_until_ready(client, poll_seconds=0.05)
+        assert client.get("/readyz").json()["status"] == "ready"
+
+
+def test_remote_mode_becomes_ready(server, monkeypatch):
+    import redis.asyncio
+
+    # RemoteExecutor has no model to load; the tier must still register and report ready
+    monkeypatch.setattr(server, "INFERENCE_MODE", "remote")
+    monkeypatch.setattr(redis.asyncio, "from_url", lambda *args, **kwargs: fakeredis.aioredis.FakeRedis())
+    with TestClient(server.app) as client:
+        assert benchmark.wait_until_ready(client, poll_seconds=0.05)
+        assert client.get("/readyz").json()["load_seconds"] is not None
+
+
+def test_failed_tier_is_shut_down(server, monkeypatch):
+    started = []
+
+    async def failing_prepare(model_size, executor, default, startup):
+        started.append(executor)
+        raise RuntimeError("warm-up exploded")
+
+    monkeypatch.setattr(server, "_prepare_tier", failing_prepare)
+    with TestClient(server.app) as client:
+        assert not benchmark.wait_until_ready(client, poll_seconds=0.05)
+        assert client.get("/readyz").json()["status"] == "failed"
+        assert started and not started[0].ready
+        assert server.app.state.executors == {}
+
+
+def test_session_dropped_during_setup_gives_back_its_slots(server, monkeypatch):
+    async def cancelled(model_size):
+        # what a handler sees when it is cancelled (client gone, server stopping) while the tier loads
+        raise asyncio.CancelledError()
+
+    with TestClient(server.app) as client:
+        assert benchmark.wait_until_ready(client, poll_seconds=0.05)
+        monkeypatch.setattr(server, "get_executor", cancelled)
+        try:
+            with client.websocket_connect("/ws/transcribe?session_id=drop1&protocol=2") as ws:
+                ws.receive_text()
+        except BaseException:
+            pass
+        deadline = time.monotonic() + 5
+        while server.TIER_SESSIONS[server.MODEL_SIZE] and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert server.TIER_SESSIONS[server.MODEL_SIZE] == 0
+        assert server.get_capacity(server.MODEL_SIZE).active == 0
+
+
+def test_second_pass_decodes_with_word_timestamps(server, monkeypatch):
+    models = {}
+
+    def get_model(model_size, *args, **kwargs):
+        return models.setdefault(model_size, FakeModel())
+
+    monkeypatch.setattr(server, "get_model", get_model)
+    monkeypatch.setattr(server, "TWO_PASS_MODEL", "small.en")
+    monkeypatch.setattr(server, "VAD_ENABLED", False)
+    pcm = (np.sin(np.arange(32000) / 8) * 8000).astype("<i2").tobytes()
+    with TestClient(server.app) as client:
+        assert benchmark.wait_until_ready(client, poll_seconds=0.05)
+        with client.websocket_connect("/ws/transcribe?session_id=twopass1&protocol=2") as ws:
+            ws.send_bytes(struct.pack("<II", 0, 0) + pcm)
+            ws.send_text(json.dumps({"command": "flush"}))
+            message = ws.receive_json()
+            while message.get("pass") != 2:
+                message = ws.receive_json()
+    # the second pass's words take the place of the first-pass ones, so it needs them
+    decodes = [options for options in models["small.en"].calls if "initial_prompt" in options]
+    assert decodes and all(options["word_timestamps"] for options in decodes)
+    assert message["text"] == "w0 w1 w2 w3"
@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from core.redis_queue import TranscriptionQueue, decode_audio, encode_audio
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def make_queue(**kwargs):
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=False)
+    return redis, TranscriptionQueue(redis, stream="test:jobs", group="test-workers",
+                                     dead_letter_stream="test:jobs:dead", **kwargs)
+
+
+def test_audio_round_trip():
+    audio = np.linspace(-1.0, 1.0, 1600, dtype=np.float32)
+    assert np.allclose(decode_audio(encode_audio(audio)), audio, atol=1e-4)
+
+
+def test_enqueue_read_ack():
+    async def scenario():
+        redis, queue = make_queue()
+        await queue.ensure_group()
+        await queue.ensure_group()  # BUSYGROUP is not an error
+        job_id = await queue.enqueue("s1", np.zeros(1600, dtype=np.float32), {"beam_size": 1}, "reply")
+        jobs = await queue.read("w1", block_ms=10)
+        assert [job["job_id"] for _, job in jobs] == [job_id]
+        entry_id, job = jobs[0]
+        assert job["session_id"] == "s1" and job["options"] == {"beam_size": 1} and len(job["audio"]) == 1600
+        assert (await queue.info())["pending"] == 1
+        await queue.ack(entry_id)
+        assert await queue.info() == {"length": 0, "pending": 0, "consumers": 1}
+        assert await queue.read("w1", block_ms=10) == []
+
+    run(scenario())
+
+
+def test_stuck_job_is_claimed_by_another_worker():
+    async def scenario():
+        redis, queue = make_queue(claim_idle_ms=0)
+        await queue.ensure_group()
+        job_id = await queue.enqueue("s1", np.zeros(160, dtype=np.float32), {}, "reply")
+        await queue.read("dead-worker", block_ms=10)  # delivered, never acknowledged
+        jobs = await queue.read("w2", block_ms=10)
+        assert [job["job_id"] for _, job in jobs] == [job_id]
+
+    run(scenario())
+
+
+def test_dead_letter_after_max_deliveries():
+    async def scenario():
+        redis, queue = make_queue(claim_idle_ms=0, max_deliveries=2)
+        await queue.ensure_group()
+        pubsub = redis.pubsub()
+        await pubsub.subscribe("reply")
+        job_id = await queue.enqueue("s1", np.zeros(160, dtype=np.float32), {}, "reply")
+        await queue.read("w1", block_ms=10)
+        await queue.read("w2", block_ms=10)
+        # third delivery: given up on
+        assert await queue.read("w3", block_ms=10) == []
+        dead = await redis.xrange("test:jobs:dead")
+        assert len(dead) == 1 and dead[0][1][b"job_id"].decode() == job_id
+        assert await queue.info() == {"length": 0, "pending": 0, "consumers": 3}
+        message = None
+        for _ in range(3):  # the subscribe confirmation comes first
+            message = message or await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+        result = json.loads(message["data"])
+        assert result["status"] == "error" and result["job_id"] == job_id
+
+    run(scenario())
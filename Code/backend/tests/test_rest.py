@@ -0,0 +1,45 @@
+import io
+import time
+import wave
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import benchmark
+from api.rest import _upload_suffix
+
+
+def wav_bytes(seconds=2.0, sample_rate=16000):
+    pcm = (np.sin(np.arange(int(seconds * sample_rate)) / 8) * 8000).astype("<i2")
+    data = io.BytesIO()
+    with wave.open(data, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+    return data.getvalue()
+
+
+@pytest.mark.parametrize("filename, suffix", [
+    ("talk.WAV", ".wav"), ("a/b/c.m4a", ".m4a"), ("", ""), (None, ""), ("dir/", ""), ("..", ""),
+    ("../../etc/passwd", ""), (".wav", ""), ("x.wav;rm -rf", ""),
+])
+def test_upload_suffix(filename, suffix):
+    assert _upload_suffix(filename) == suffix
+
+
+@pytest.mark.parametrize("filename", ["..", "dir/", "../outside.wav", "talk.wav"])
+def test_upload_is_stored_under_its_own_name(server, filename):
+    with TestClient(server.app) as client:
+        assert benchmark.wait_until_ready(client, poll_seconds=0.05)
+        response = client.post("/jobs", files={"file": (filename, wav_bytes(), "audio/wav")})
+        assert response.status_code == 202, response.text
+        job = response.json()
+        assert job["filename"] == filename
+        deadline = time.monotonic() + 5
+        while job["status"] not in ("done", "failed") and time.monotonic() < deadline:
+            time.sleep(0.02)
+            job = client.get(f"/jobs/{job['job_id']}").json()
+        assert job["status"] == "done", job["error"]
+        assert job["duration"] == 2.0
@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from core.result_cache import ResultCache
+
+
+def result(text):
+    return [{"start": 0.0, "end": 1.0, "text": text, "words": None}], {"duration": 1.0, "language": "en"}
+
+
+def size(text):
+    return len(json.dumps(list(result(text))))
+
+
+def test_key_covers_audio_model_and_options():
+    audio = np.linspace(-1, 1, 1600, dtype=np.float32)
+    key = ResultCache.key("tiny.en", audio, {"beam_size": 5, "language": "en"})
+    # stable: same content, any dtype or memory layout, any option order
+    assert key == ResultCache.key("tiny.en", audio.astype(np.float64), {"language": "en", "beam_size": 5})
+    strided = np.repeat(audio, 2)[::2]
+    assert not strided.flags.c_contiguous
+    assert key == ResultCache.key("tiny.en", strided, {"beam_size": 5, "language": "en"})
+    others = [
+        ResultCache.key("small.en", audio, {"beam_size": 5, "language": "en"}),
+        ResultCache.key("tiny.en", audio, {"beam_size": 1, "language": "en"}),
+        ResultCache.key("tiny.en", audio[:-1], {"beam_size": 5, "language": "en"}),
+        ResultCache.key("tiny.en", np.append(audio, np.float32(0)), {"beam_size": 5, "language": "en"}),
+    ]
+    assert key not in others and len(set(others)) == len(others)
+
+
+def test_least_recently_used_results_are_evicted_by_size():
+    async def scenario():
+        cache = ResultCache(max_bytes=3 * size("aaaa"))
+        for key in ("a", "b", "c"):
+            await cache.put(key, result(key * 4))
+        assert cache.bytes == 3 * size("aaaa")
+        assert cache.get_local("a") is not None  # "b" is now the least recently used
+        await cache.put("d", result("dddd"))
+        assert cache.get_local("b") is None
+        assert [key for key in ("a", "c", "d") if cache.get_local(key) is not None] == ["a", "c", "d"]
+        assert cache.stats()["evicted"] == 1 and cache.bytes <= cache.max_bytes
+
+        # one large result pushes out as many small ones as it needs
+        await cache.put("e", result("e" * (size("aaaa") + 10)))
+        assert cache.bytes <= cache.max_bytes and cache.get_local("e") is not None
+        assert cache.stats()["entries"] == 1
+
+        # a result larger than the whole cache is not kept
+        await cache.put("f", result("f" * 4 * size("aaaa")))
+        assert cache.get_local("f") is None and cache.get_local("e") is not None
+
+    asyncio.run(scenario())
+
+
+def test_redis_hit_fills_the_memory_cache():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        writer, reader = ResultCache(redis=redis), ResultCache(redis=redis)
+        await writer.put("k", result("shared"))
+        assert reader.get_local("k") is None
+        assert await reader.get("k") == result("shared")
+        assert reader.get_local("k") == result("shared")
+        assert await reader.get("missing") is None
+        assert reader.stats()["redis_hit"] == 1 and reader.stats()["miss"] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,92 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from core.session_store import MemorySessionStore, RedisSessionStore, SessionStore, create_session_store
+
+
+def make_store(kind, ttl_seconds=600.0):
+    if kind == "memory":
+        return MemorySessionStore(ttl_seconds)
+    return RedisSessionStore("redis://unused", ttl_seconds, redis=fakeredis.aioredis.FakeRedis(decode_responses=False))
+
+
+STATE = {"end_sample": 32000, "out_seq": 4, "transcriber": {"committed": [{"start": 0.0, "end": 0.4, "word": " hi"}]}}
+
+
+@pytest.mark.parametrize("kind", ["memory", "redis"])
+def test_claim_returns_the_last_snapshot(kind):
+    async def scenario():
+        store = make_store(kind)
+        assert await store.claim("s1", "conn1") is None
+        audio = np.linspace(-0.5, 0.5, 1600, dtype=np.float32)
+        assert await store.save("s1", "conn1", STATE, audio)
+        # the client reconnects
+        state, restored = await store.claim("s1", "conn2")
+        assert state == STATE
+        assert np.allclose(restored, audio, atol=1e-4)
+        await store.close()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("kind", ["memory", "redis"])
+def test_taken_over_session_rejects_the_old_connection(kind):
+    async def scenario():
+        store = make_store(kind)
+        await store.claim("s1", "conn1")
+        await store.save("s1", "conn1", STATE, np.zeros(160, dtype=np.float32))
+        await store.claim("s1", "conn2")
+        # the old handler can neither overwrite nor delete the newer connection's session
+        assert not await store.save("s1", "conn1", dict(STATE, out_seq=1), np.zeros(160, dtype=np.float32))
+        await store.delete("s1", "conn1")
+        state, _ = await store.claim("s1", "conn3")
+        assert state["out_seq"] == 4
+        # the owner can
+        await store.delete("s1", "conn3")
+        assert await store.claim("s1", "conn4") is None
+        await store.close()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("kind", ["memory", "redis"])
+def test_saved_state_does_not_alias_the_handlers(kind):
+    async def scenario():
+        store = make_store(kind)
+        await store.claim("s1", "conn1")
+        state = {"out_seq": 1, "words": ["a"]}
+        await store.save("s1", "conn1", state, np.zeros(160, dtype=np.float32))
+        state["words"].append("b")
+        assert (await store.claim("s1", "conn1"))[0]["words"] == ["a"]
+        await store.close()
+
+    asyncio.run(scenario())
+
+
+def test_memory_snapshots_expire():
+    async def scenario():
+        store = make_store("memory", ttl_seconds=0.05)
+        await store.claim("s1", "conn1")
+        await store.save("s1", "conn1", STATE, np.zeros(160, dtype=np.float32))
+        await asyncio.sleep(0.1)
+        assert await store.claim("s1", "conn2") is None
+
+    asyncio.run(scenario())
+
+
+def test_unknown_store_kind():
+    with pytest.raises(ValueError):
+        create_session_store("sqlite", "redis://unused", 60.0)
+
+
+def test_a_store_must_implement_claim_save_and_delete():
+    class Incomplete(SessionStore):
+        async def claim(self, session_id, owner):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from conftest import GatedModel, wait_until
+from core.inference_executor import InferenceExecutor, JobSuperseded
+from core.inference_server import InferenceServer
+from core.shm_channel import SharedMemoryExecutor
+
+
+def test_cancelled_window_gives_back_its_slots(tmp_path):
+    async def scenario():
+        gate = threading.Event()
+        server = InferenceServer(lambda model: InferenceExecutor(lambda: GatedModel(gate), workers=1), ["tiny.en"])
+        path = str(tmp_path / "inference.sock")
+        await server.serve(path)
+        client = SharedMemoryExecutor(path, "tiny.en", max_in_flight=2, slot_seconds=2, connect_timeout=5)
+        await client.start()
+        try:
+            audio = np.zeros(16000, dtype=np.float32)
+            running = asyncio.create_task(client.submit("a", audio))
+            waiting = asyncio.create_task(client.submit("b", audio))
+            # "a" holds the server's only worker, "b" waits in its queue
+            remote = server.executors["tiny.en"]
+            await wait_until(lambda: remote.running == 1 and remote.queue_depth == 1)
+            assert client._slots_used == 2 and not client.arena._free
+
+            client.cancel("b")
+            with pytest.raises(JobSuperseded):
+                await asyncio.wait_for(waiting, 5)
+            assert client._slots_used == 1 and len(client.arena._free) == 1
+
+            gate.set()
+            segments, info = await asyncio.wait_for(running, 5)
+            assert info["duration"] == 1.0
+            assert client._slots_used == 0 and len(client.arena._free) == 2
+        finally:
+            gate.set()
+            await client.shutdown()
+            await server.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_unanswered_window_times_out(tmp_path):
+    async def scenario():
+        gate = threading.Event()
+        server = InferenceServer(lambda model: InferenceExecutor(lambda: GatedModel(gate), workers=1), ["tiny.en"])
+        path = str(tmp_path / "inference.sock")
+        await server.serve(path)
+        client = SharedMemoryExecutor(path, "tiny.en", max_in_flight=1, slot_seconds=2, connect_timeout=5,
+                                      result_timeout=0.2)
+        await client.start()
+        try:
+            with pytest.raises(RuntimeError, match="did not answer"):
+                await client.submit("a", np.zeros(16000, dtype=np.float32))
+            assert client._slots_used == 0 and len(client.arena._free) == 1
+        finally:
+            gate.set()
+            await client.shutdown()
+            await server.shutdown()
+
+    asyncio.run(scenario())
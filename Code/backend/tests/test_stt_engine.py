@@ -0,0 +1,83 @@
+from core.stt_engine import StreamingTranscriber, segment_words
+
+
+def segment(*words, start=0.0, step=0.5):
+    """One segment with a word every `step` seconds from `start` (relative to the window)."""
+    timed = [{"start": start + i * step, "end": start + i * step + 0.4, "word": " " + w, "probability": 0.9}
+             for i, w in enumerate(words)]
+    return {"start": start, "end": start + len(words) * step, "text": "".join(w["word"] for w in timed),
+            "words": timed}
+
+
+def test_words_are_committed_once_two_passes_agree():
+    transcriber = StreamingTranscriber()
+    assert transcriber.insert([segment("the", "cat")], 0.0) == []
+    assert transcriber.tail == "the cat" and transcriber.text == ""
+
+    committed = transcriber.insert([segment("the", "cat", "sat")], 0.0)
+    assert [w["word"] for w in committed] == [" the", " cat"]
+    assert transcriber.text == "the cat" and transcriber.tail == "sat"
+    assert transcriber.committed_until == 0.9
+
+    # the next pass starts after the committed audio and disagrees on the tail
+    assert transcriber.insert([segment("set", "on", start=0.0)], 1.0) == []
+    assert transcriber.full_text == "the cat set on"
+    committed = transcriber.insert([segment("set", "on", "the", start=0.0)], 1.0)
+    assert [w["word"] for w in committed] == [" set", " on"]
+    assert transcriber.text == "the cat set on"
+
+
+def test_committed_words_repeated_from_the_prompt_are_dropped():
+    transcriber = StreamingTranscriber()
+    transcriber.insert([segment("hello", "there")], 0.0)
+    transcriber.insert([segment("hello", "there")], 0.0)
+    assert transcriber.text == "hello there"
+    # Whisper echoes "there" from the prompt at the start of the next window
+    transcriber.insert([segment("there", "friend", start=0.0)], 0.95)
+    transcriber.insert([segment("there", "friend", start=0.0)], 0.95)
+    assert transcriber.text == "hello there friend"
+
+
+def test_finish_commits_the_rest_and_returns_the_utterance():
+    transcriber = StreamingTranscriber()
+    transcriber.insert([segment("one", "two")], 0.0)
+    transcriber.insert([segment("one", "two", "three")], 0.0)
+    commit, utterance = transcriber.finish(until=2.0)
+    assert [w["word"] for w in commit] == [" three"]
+    assert [w["word"] for w in utterance] == [" one", " two", " three"]
+    assert transcriber.committed_until == 2.0 and transcriber.tail == ""
+    # the next utterance starts empty
+    transcriber.insert([segment("four")], 2.0)
+    assert transcriber.finish()[1][0]["word"] == " four"
+
+
+def test_replace_swaps_a_finished_utterance():
+    transcriber = StreamingTranscriber()
+    transcriber.insert([segment("a", "b", "c")], 0.0)
+    transcriber.finish()
+    transcriber.insert([segment("d", "e")], 2.0)
+    transcriber.finish()
+    # the next utterance is still open, its first word already committed
+    transcriber.insert([segment("f", "g")], 4.0)
+    transcriber.insert([segment("f", "h")], 4.0)
+
+    # the second utterance's second-pass words; the last one runs into the next utterance and is left out
+    words = segment_words([segment("D", "E", "X", "Y", start=0.0, step=0.8)], 2.0)
+    first, removed, inserted = transcriber.replace(2.0, 2.9, words)
+    assert (first, removed) == (3, 2)
+    assert [w["word"] for w in inserted] == [" D", " E", " X"]
+    assert transcriber.text == "a b c D E X f"
+
+    # the open utterance is never replaced, and it still finishes on its own
+    assert transcriber.replace(4.0, 5.0, words) == (-1, 0, [])
+    assert [w["word"] for w in transcriber.finish()[1]] == [" f", " h"]
+
+
+def test_state_round_trip():
+    transcriber = StreamingTranscriber()
+    transcriber.insert([segment("a", "b")], 0.0)
+    transcriber.insert([segment("a", "b", "c")], 0.0)
+    restored = StreamingTranscriber.from_state(transcriber.state())
+    assert (restored.text, restored.tail, restored.committed_until) == ("a b", "c", transcriber.committed_until)
+    restored.insert([segment("c", start=0.0)], 1.0)
+    assert restored.text == "a b c"
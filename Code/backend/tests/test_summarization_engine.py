@@ -0,0 +1,46 @@
+import pytest
+
+from core.summarization_engine import StubBackend, SummarizationEngine, SummaryBackend, get_backend, split_chunks
+
+
+def test_stub_backend_keeps_leading_sentences():
+    backend = StubBackend(max_words=6)
+    summaries = backend.summarize(["One two three. Four five six. Seven eight.", "Short."], "instruction")
+    assert summaries == ["One two three. Four five six.", "Short."]
+    assert backend.calls == 1
+
+
+def test_get_backend():
+    assert isinstance(get_backend("stub"), StubBackend)
+    with pytest.raises(ValueError):
+        get_backend("nope")
+
+
+def test_a_backend_must_implement_summarize():
+    with pytest.raises(TypeError):
+        SummaryBackend()
+
+
+def test_split_chunks_on_sentences():
+    text = "First sentence here. Second sentence here. Third one."
+    assert split_chunks(text, chunk_chars=45) == ["First sentence here. Second sentence here.", "Third one."]
+    assert all(len(chunk) <= 10 for chunk in split_chunks("word " * 20, chunk_chars=10))
+
+
+def test_map_results_are_cached():
+    backend = StubBackend()
+    engine = SummarizationEngine(backend)
+    assert engine.summarize_chunks(["A first chunk.", "A second chunk."]) == ["A first chunk.", "A second chunk."]
+    assert engine.summarize_chunks(["A first chunk.", "A third chunk."]) == ["A first chunk.", "A third chunk."]
+    # one backend call per map step, and only the new chunk went to the second one
+    assert backend.calls == 2
+    assert engine.stats["cache_hits"] == 1 and engine.stats["cache_misses"] == 3
+
+
+def test_reduce_merges_into_one_summary():
+    engine = SummarizationEngine(StubBackend(max_words=100), chunk_chars=40)
+    summaries = [f"Point number {i}." for i in range(6)]
+    merged = engine.reduce(summaries)
+    assert merged.startswith("Point number 0.") and "Point number 5." in merged
+    assert engine.reduce([]) == ""
+    assert engine.reduce(["", "Only one."]) == "Only one."
@@ -0,0 +1,50 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("websockets")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                "frontend"))
+
+from websocket_client import TranscriptionSession
+
+
+class FakeSocket:
+    """Replays server messages (with a delay before each) and records the frames sent."""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.sent = []
+
+    async def recv(self):
+        if not self.messages:
+            await asyncio.sleep(3600)
+        delay, message = self.messages.pop(0)
+        await asyncio.sleep(delay)
+        return json.dumps(message)
+
+    async def send(self, data):
+        self.sent.append(data)
+
+
+def test_resume_after_waiting_for_admission():
+    async def scenario():
+        session = TranscriptionSession(session_id="s1", frame_ms=100, resume_wait=0.2)
+        session._started = True
+        for i in range(10):
+            session._replay.append((i * 1600, b"\0" * 3200))
+        # queued for longer than resume_wait, then admitted and resumed at 0.5 s
+        ws = FakeSocket([(0.0, {"type": "queued", "position": 1, "max_wait": 1.0}),
+                         (0.4, {"type": "admitted", "waited": 0.4}),
+                         (0.0, {"type": "resumed", "position": 8000, "end": 0.5, "seq": 3, "text": "", "tail": ""})])
+        await session._resume(ws)
+        return session, ws
+
+    session, ws = asyncio.run(scenario())
+    assert session.stats["resumed"] == 1 and session.stats["queued"] == 1
+    # frames from position 8000 on are sent again
+    assert session.stats["resent_frames"] == 5
+    assert [int.from_bytes(frame[4:8], "little") for frame in ws.sent] == [8000, 9600, 11200, 12800, 14400]
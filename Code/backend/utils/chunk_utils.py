@@ -1 +1,120 @@
 #Cut and union text/audio window
+from typing import Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def frame_signal(samples: np.ndarray, frame_length: int, hop_length: Optional[int] = None,
+                 window: Optional[np.ndarray] = None, pad: bool = False) -> np.ndarray:
+    """
+    Cut a signal into (n_frames, frame_length) frames starting every `hop_length` samples
+    (default: no overlap). Without `window` the frames are a strided view of `samples`, no
+    copy even when they overlap; with one (e.g. np.hanning(frame_length)) they are a new
+    windowed array. `pad` zero-pads the end so the last partial frame is kept.
+    """
+    hop_length = hop_length or frame_length
+    samples = np.asarray(samples)
+    if pad:
+        n_frames = max(1, -(-max(len(samples) - frame_length, 0) // hop_length) + 1)
+        needed = (n_frames - 1) * hop_length + frame_length
+        if needed > len(samples):
+            samples = np.concatenate([samples, np.zeros(needed - len(samples), dtype=samples.dtype)])
+    if len(samples) < frame_length:
+        return np.zeros((0, frame_length), dtype=samples.dtype)
+    frames = sliding_window_view(samples, frame_length)[::hop_length]
+    if window is not None:
+        frames = frames * np.asarray(window, dtype=samples.dtype)
+    return frames
+
+
+class PCMRingBuffer:
+    """
+    Fixed-capacity float32 ring buffer holding the most recent audio of a session.
+
+    Positions are tracked as absolute sample indices since the start of the stream
+    (`start_sample` .. `end_sample`), so durations and timestamps stay sample-accurate
+    no matter how often the buffer wraps. Every sample is stored twice (at i and
+    i + capacity), which makes any window of up to `capacity` samples a contiguous
+    slice: windows are returned as views without copying.
+
+    Views alias the internal storage and are overwritten by later appends; copy them
+    if they must outlive the next `append`.
+    """
+
+    def __init__(self, capacity_seconds: float, sample_rate: int = 16000):
+        self.sample_rate = sample_rate
+        self.capacity = max(1, int(round(capacity_seconds * sample_rate)))
+        self._buf = np.zeros(2 * self.capacity, dtype=np.float32)
+        self.start_sample = 0
+        self.end_sample = 0
+
+    def __len__(self) -> int:
+        return self.end_sample - self.start_sample
+
+    @property
+    def duration(self) -> float:
+        """Seconds of audio currently held."""
+        return len(self) / self.sample_rate
+
+    @property
+    def start_time(self) -> float:
+        """Stream time (seconds) of the oldest held sample."""
+        return self.start_sample / self.sample_rate
+
+    @property
+    def end_time(self) -> float:
+        """Stream time (seconds) just after the newest sample."""
+        return self.end_sample / self.sample_rate
+
+    def append(self, samples: np.ndarray):
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        n = samples.size
+        if n == 0:
+            return
+        if n > self.capacity:
+            # only the newest `capacity` samples can be kept
+            skipped = n - self.capacity
+            self.end_sample += skipped
+            samples = samples[skipped:]
+            n = self.capacity
+        cap = self.capacity
+        i = self.end_sample % cap
+        k = min(n, cap - i)
+        self._buf[i:i + k] = samples[:k]
+        self._buf[i + cap:i + cap + k] = samples[:k]
+        if k < n:
+            self._buf[0:n - k] = samples[k:]
+            self._buf[cap:cap + n - k] = samples[k:]
+        self.end_sample += n
+        self.start_sample = max(self.start_sample, self.end_sample - cap)
+
+    def window(self, start_sample: int, end_sample: Optional[int] = None) -> np.ndarray:
+        """Return samples [start_sample, end_sample) (absolute indices) as a view, clipped to what is held."""
+        if end_sample is None:
+            end_sample = self.end_sample
+        start_sample = max(start_sample, self.start_sample)
+        end_sample = min(end_sample, self.end_sample)
+        if end_sample <= start_sample:
+            return self._buf[:0]
+        i = start_sample % self.capacity
+        return self._buf[i:i + (end_sample - start_sample)]
+
+    def view(self, seconds: Optional[float] = None) -> np.ndarray:
+        """Return the newest `seconds` of audio (everything held if None) as a view."""
+        if seconds is None:
+            return self.window(self.start_sample)
+        n = int(round(seconds * self.sample_rate))
+        return self.window(self.end_sample - n)
+
+    def discard_until(self, sample: int):
+        """Drop held audio before absolute sample index `sample`."""
+        self.start_sample = min(max(self.start_sample, sample), self.end_sample)
+
+    def seek(self, sample: int):
+        """Drop all held audio and continue at absolute position `sample` (a restored session, or after a gap in the stream)."""
+        self.start_sample = self.end_sample = int(sample)
+
+    def clear(self):
+        """Drop all held audio; the absolute position keeps counting from where it was."""
+        self.start_sample = self.end_sample
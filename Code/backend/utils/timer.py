@@ -1 +1,249 @@
-#Calculate latency, processing time
\ No newline at end of file
+#Timing, tracing and Prometheus-style metrics
+# backend/utils/timer.py
+import asyncio
+import functools
+import inspect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.logger import get_logger
+
+log = get_logger("timer")
+
+# seconds; covers ~1 ms VAD calls up to multi-second decodes
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.label_names)
+
+    def remove(self, **match):
+        """Drop every series whose labels include `match` (e.g. session=... when a session ends)."""
+        idx = {self.label_names.index(k): str(v) for k, v in match.items()}
+        with self._lock:
+            for key in [k for k in self._series if all(k[i] == v for i, v in idx.items())]:
+                del self._series[key]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines += self._render_series()
+        return lines
+
+    def _render_series(self) -> List[str]:
+        return [f"{self.name}{_labels_text(self.label_names, k)} {_fmt(v)}" for k, v in self._series.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._series.get(self._key(labels), 0.0)
+
+    def total(self) -> float:
+        return sum(self._series.values())
+
+
+class Gauge(_Metric):
+    """Set directly, or computed at scrape time from a callback returning {label values tuple: value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), callback: Optional[Callable] = None):
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def _render_series(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception as e:
+                log.warning("gauge %s callback failed: %s", self.name, e)
+                values = {}
+            if not isinstance(values, dict):
+                values = {(): values}
+            return [f"{self.name}{_labels_text(self.label_names, tuple(map(str, k)))} {_fmt(v)}"
+                    for k, v in values.items()]
+        return super()._render_series()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_series(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels_text(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels_text(self.label_names, key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels_text(self.label_names, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # module reloads / repeated setup get the same series back
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Iterable[str] = (), callback: Optional[Callable] = None) -> Gauge:
+        return self._register(Gauge(name, help, labels, callback))
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def remove_labels(self, **match):
+        """Drop the series of e.g. one session from every metric that has that label."""
+        for metric in list(self._metrics.values()):
+            if all(k in metric.label_names for k in match):
+                metric.remove(**match)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# per-session series are dropped when the session ends (forget_session); the aggregate
+# histogram keeps counting, so its rates stay correct
+SESSION_LABELS = os.getenv("METRICS_SESSION_LABELS", "1") not in ("0", "false", "False")
+STAGE_SECONDS = REGISTRY.histogram(
+    "stt_stage_seconds", "Time spent per pipeline stage", labels=("stage",))
+SESSION_STAGE_SECONDS = REGISTRY.histogram(
+    "stt_session_stage_seconds", "Time spent per pipeline stage, per live session", labels=("stage", "session"))
+
+
+def observe_stage(stage: str, seconds: float, session: str = ""):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    if session and SESSION_LABELS:
+        SESSION_STAGE_SECONDS.observe(seconds, stage=stage, session=session)
+
+def forget_session(session: str):
+    REGISTRY.remove_labels(session=session)
+
+
+@contextmanager
+def timed(stage: str, session: str = ""):
+    """Time a block as one pipeline stage: recorded in the histograms and traced at DEBUG level."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe_stage(stage, elapsed, session)
+        log.debug("stage=%s session=%s ms=%.2f", stage, session, elapsed * 1000.0)
+
+def timed_fn(stage: str):
+    """Decorator form of timed() for sync and async functions; their `session_id` argument, if any, is the session label."""
+    def decorate(fn):
+        signature = inspect.signature(fn)
+
+        def session(args, kwargs) -> str:
+            if "session_id" not in signature.parameters:
+                return ""
+            return str(signature.bind_partial(*args, **kwargs).arguments.get("session_id") or "")
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timed(stage, session(args, kwargs)):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(stage, session(args, kwargs)):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -7,6 +7,8 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 openai_api_input = st.session_state.get("_openai_key_input", "")
 BACKEND_WS_URL = os.getenv("BACKEND_WS_URL", "ws://localhost:8000/ws/transcribe")
+# "2": 16 kHz PCM16 frames from an AudioWorklet (no server-side ffmpeg), "1": MediaRecorder WebM chunks
+BACKEND_PROTOCOL = os.getenv("BACKEND_PROTOCOL", "2")
 
 if OPENAI_API_KEY:
     client = OpenAI(api_key=OPENAI_API_KEY)
@@ -60,8 +62,37 @@ with st.container():
           <script>
             // Backend WS URL provided by Streamlit
             const BACKEND_WS_URL = "__BACKEND_WS_URL__";
+            const TARGET_RATE = 16000;
+            const FRAME_SAMPLES = 1600;  // 100 ms per protocol 2 frame
+            // the worklet downsamples the microphone to 16 kHz PCM16 (linear interpolation, fine for speech)
+            const WORKLET_SOURCE = `
+              class PCMCapture extends AudioWorkletProcessor {
+                constructor() { super(); this.step = sampleRate / ${TARGET_RATE}; this.pos = 0; this.prev = 0; }
+                process(inputs) {
+                  const input = inputs[0] && inputs[0][0];
+                  if (!input || !input.length) return true;
+                  const at = (k) => k === 0 ? this.prev : input[k - 1];  // index 0 is the previous block's last sample
+                  const out = [];
+                  while (this.pos < input.length) {
+                    const i = Math.floor(this.pos), f = this.pos - i;
+                    const v = at(i) + (at(i + 1) - at(i)) * f;
+                    out.push(Math.max(-1, Math.min(1, v)) * 0x7fff);
+                    this.pos += this.step;
+                  }
+                  this.pos -= input.length;
+                  this.prev = input[input.length - 1];
+                  if (out.length) { const pcm = Int16Array.from(out); this.port.postMessage(pcm, [pcm.buffer]); }
+                  return true;
+                }
+              }
+              registerProcessor('pcm-capture', PCMCapture);`;
+            const USE_PCM = "__BACKEND_PROTOCOL__" === '2' && typeof AudioWorkletNode !== 'undefined';
             let mediaRecorder;
             let recordedChunks = [];
+            let audioCtx = null, micStream = null, captureNode = null;
+            let pcmChunks = [], pending = new Int16Array(FRAME_SAMPLES), pendingLen = 0, frameSeq = 0, samplePos = 0;
+            // transcript per utterance (segment_id); a two-pass final replaces its segment's text
+            let segments = {}, tailText = '', firstPassText = '';
             let ws = null;
             const micSelect = document.getElementById('micSelect');
             const startBtn = document.getElementById('startBtn');
@@ -74,17 +105,38 @@ with st.container():
 
             function setStatus(s) { statusDiv.textContent = 'Status: ' + s; }
 
+            function segmentsText() {
+              return Object.keys(segments).sort((a, b) => a - b).map(k => segments[k]).join('').trim();
+            }
+
             function ensureWS() {
               if (ws && (ws.readyState === WebSocket.OPEN || ws.readyState === WebSocket.CONNECTING)) return ws;
-              const url = BACKEND_WS_URL + '?session_id=' + encodeURIComponent(sessionId);
+              let url = BACKEND_WS_URL + '?session_id=' + encodeURIComponent(sessionId);
+              if (USE_PCM) url += '&protocol=2&codec=pcm16';
               ws = new WebSocket(url);
               ws.binaryType = 'arraybuffer';
               ws.onopen = () => { console.log('WS open', url); setStatus('connected to backend'); };
               ws.onmessage = (evt) => {
                 try {
                   const d = JSON.parse(evt.data);
-                  if (d.type === 'partial' || d.type === 'final') {
-                    transcriptDiv.innerText = d.text;
+                  const id = d.segment_id || 0;
+                  if (d.type === 'final' && d.pass === 2) {
+                    segments[id] = ' ' + d.text;
+                    transcriptDiv.innerText = (segmentsText() + ' ' + tailText).trim();
+                  } else if ((d.type === 'partial' || d.type === 'final') && 'commit' in d) {
+                    // protocol 2: only what changed, committed text is appended and the tail replaced
+                    segments[id] = (segments[id] || '') + d.commit;
+                    tailText = d.type === 'partial' ? d.tail : '';
+                    transcriptDiv.innerText = (segmentsText() + ' ' + tailText).trim();
+                  } else if (d.type === 'final') {
+                    // protocol 1 sends the whole first-pass transcript; finished segments may have been revised
+                    segments[id] = ' ' + d.text;
+                    firstPassText = (firstPassText + ' ' + d.text).trim();
+                    tailText = '';
+                    transcriptDiv.innerText = segmentsText();
+                  } else if (d.type === 'partial') {
+                    tailText = (d.full_text || d.text).slice(firstPassText.length).trim();
+                    transcriptDiv.innerText = (segmentsText() + ' ' + tailText).trim();
                   } else if (d.type === 'info' || d.type === 'ack') {
                     // ignore/optional
                   } else if (d.type === 'error') {
@@ -97,6 +149,43 @@ with st.container():
               return ws;
             }
 
+            function sendFrame(samples) {
+              // 8 byte header: uint32 sequence number, uint32 stream position of the first sample
+              const frame = new Uint8Array(8 + samples.byteLength);
+              const header = new DataView(frame.buffer);
+              header.setUint32(0, frameSeq, true);
+              header.setUint32(4, samplePos, true);
+              frame.set(new Uint8Array(samples.buffer, samples.byteOffset, samples.byteLength), 8);
+              frameSeq += 1;
+              samplePos += samples.length;
+              pcmChunks.push(samples.slice());
+              ensureWS();
+              if (ws.readyState === WebSocket.OPEN) ws.send(frame.buffer);
+            }
+
+            function onPCM(samples) {
+              let offset = 0;
+              while (offset < samples.length) {
+                const n = Math.min(FRAME_SAMPLES - pendingLen, samples.length - offset);
+                pending.set(samples.subarray(offset, offset + n), pendingLen);
+                pendingLen += n; offset += n;
+                if (pendingLen === FRAME_SAMPLES) { sendFrame(pending); pendingLen = 0; }
+              }
+            }
+
+            function wavBlob(chunks) {
+              const total = chunks.reduce((n, c) => n + c.length, 0);
+              const view = new DataView(new ArrayBuffer(44 + total * 2));
+              const text = (o, s) => { for (let i = 0; i < s.length; i++) view.setUint8(o + i, s.charCodeAt(i)); };
+              text(0, 'RIFF'); view.setUint32(4, 36 + total * 2, true); text(8, 'WAVE'); text(12, 'fmt ');
+              view.setUint32(16, 16, true); view.setUint16(20, 1, true); view.setUint16(22, 1, true);
+              view.setUint32(24, TARGET_RATE, true); view.setUint32(28, TARGET_RATE * 2, true);
+              view.setUint16(32, 2, true); view.setUint16(34, 16, true); text(36, 'data'); view.setUint32(40, total * 2, true);
+              let o = 44;
+              chunks.forEach(c => { for (let i = 0; i < c.length; i++, o += 2) view.setInt16(o, c[i], true); });
+              return new Blob([view.buffer], { type: 'audio/wav' });
+            }
+
             async function enumerateMicDevices() {
               try {
                 const devices = await navigator.mediaDevices.enumerateDevices();
@@ -113,29 +202,44 @@ with st.container():
               }
             }
 
+            async function startPCM(stream) {
+              audioCtx = new AudioContext();
+              const moduleUrl = URL.createObjectURL(new Blob([WORKLET_SOURCE], { type: 'application/javascript' }));
+              await audioCtx.audioWorklet.addModule(moduleUrl);
+              URL.revokeObjectURL(moduleUrl);
+              captureNode = new AudioWorkletNode(audioCtx, 'pcm-capture');
+              captureNode.port.onmessage = (e) => onPCM(e.data);
+              audioCtx.createMediaStreamSource(stream).connect(captureNode);
+            }
+
             startBtn.addEventListener('click', async () => {
               startBtn.disabled = true; stopBtn.disabled = false; setStatus('requesting microphone...');
-              const constraints = { audio: { deviceId: micSelect.value ? { exact: micSelect.value } : undefined } };
+              const constraints = { audio: { deviceId: micSelect.value ? { exact: micSelect.value } : undefined, channelCount: 1 } };
               try {
-                const stream = await navigator.mediaDevices.getUserMedia(constraints);
+                micStream = await navigator.mediaDevices.getUserMedia(constraints);
                 recordedChunks = [];
-                // send chunks periodically while recording (timeslice)
-                mediaRecorder = new MediaRecorder(stream);
-                mediaRecorder.ondataavailable = async (e) => {
-                  if (e.data && e.data.size > 0) {
-                    // send chunk immediately to backend WS
-                    try {
-                      ensureWS();
-                      if (ws.readyState === WebSocket.OPEN) {
-                        const ab = await e.data.arrayBuffer();
-                        ws.send(ab);
-                      }
-                    } catch (err) { console.error('send chunk err', err); }
-                    recordedChunks.push(e.data);
-                  }
-                };
-                mediaRecorder.start(1000); // emit dataavailable every 1s
+                pcmChunks = []; pendingLen = 0; frameSeq = 0; samplePos = 0; segments = {}; tailText = ''; firstPassText = '';
                 ensureWS();
+                if (USE_PCM) {
+                  await startPCM(micStream);
+                } else {
+                  // send chunks periodically while recording (timeslice)
+                  mediaRecorder = new MediaRecorder(micStream);
+                  mediaRecorder.ondataavailable = async (e) => {
+                    if (e.data && e.data.size > 0) {
+                      // send chunk immediately to backend WS
+                      try {
+                        ensureWS();
+                        if (ws.readyState === WebSocket.OPEN) {
+                          const ab = await e.data.arrayBuffer();
+                          ws.send(ab);
+                        }
+                      } catch (err) { console.error('send chunk err', err); }
+                      recordedChunks.push(e.data);
+                    }
+                  };
+                  mediaRecorder.start(1000); // emit dataavailable every 1s
+                }
                 setStatus('recording');
               } catch (err) {
                 setStatus('microphone unavailable'); startBtn.disabled = false; stopBtn.disabled = true;
@@ -144,27 +248,34 @@ with st.container():
 
             stopBtn.addEventListener('click', async () => {
               stopBtn.disabled = true; startBtn.disabled = false; setStatus('stopping');
-              if (mediaRecorder && mediaRecorder.state !== 'inactive') {
-                mediaRecorder.stop();
+              let blob;
+              if (USE_PCM) {
+                if (captureNode) { captureNode.port.onmessage = null; captureNode.disconnect(); captureNode = null; }
+                if (audioCtx) { await audioCtx.close(); audioCtx = null; }
+                if (pendingLen) { sendFrame(pending.subarray(0, pendingLen)); pendingLen = 0; }
+                blob = wavBlob(pcmChunks);
+              } else {
+                if (mediaRecorder && mediaRecorder.state !== 'inactive') {
+                  // the last timeslice is delivered before onstop
+                  await new Promise(resolve => { mediaRecorder.onstop = resolve; mediaRecorder.stop(); });
+                }
+                blob = new Blob(recordedChunks, { type: 'audio/webm' });
               }
-              // after stop, send full blob and ask server to flush to finalize
-              setTimeout(async () => {
-                try {
-                  ensureWS();
-                  const blob = new Blob(recordedChunks, { type: 'audio/webm' });
-                  const ab = await blob.arrayBuffer();
-                  if (ws.readyState === WebSocket.OPEN) ws.send(ab);
-                  if (ws.readyState === WebSocket.OPEN) ws.send(JSON.stringify({ command: 'flush' }));
-                  // create download url
-                  const url = URL.createObjectURL(blob);
-                  downloadBtn.setAttribute('data-url', url);
-                  setStatus('recording stopped');
-                } catch (e) { console.error('final send err', e); setStatus('error sending audio'); }
-              }, 300);
+              if (micStream) { micStream.getTracks().forEach(t => t.stop()); micStream = null; }
+              // every chunk went out while recording: just ask the server to finalize
+              try {
+                ensureWS();
+                if (ws.readyState === WebSocket.OPEN) ws.send(JSON.stringify({ command: 'flush' }));
+                // create download url
+                const url = URL.createObjectURL(blob);
+                downloadBtn.setAttribute('data-url', url);
+                downloadBtn.setAttribute('data-name', USE_PCM ? 'recording.wav' : 'recording.webm');
+                setStatus('recording stopped');
+              } catch (e) { console.error('final send err', e); setStatus('error sending audio'); }
             });
 
             downloadBtn.addEventListener('click', () => {
-              const url = downloadBtn.getAttribute('data-url'); if (!url) return; const a = document.createElement('a'); a.href = url; a.download = 'recording.webm'; a.click();
+              const url = downloadBtn.getAttribute('data-url'); if (!url) return; const a = document.createElement('a'); a.href = url; a.download = downloadBtn.getAttribute('data-name') || 'recording.webm'; a.click();
             });
 
             copyBtn.addEventListener('click', async () => {
@@ -177,7 +288,7 @@ with st.container():
           </script>
         </body>
         </html>
-        """.replace("__BACKEND_WS_URL__", BACKEND_WS_URL)
+        """.replace("__BACKEND_WS_URL__", BACKEND_WS_URL).replace("__BACKEND_PROTOCOL__", BACKEND_PROTOCOL)
         transcript_placeholder = st.empty()
         transcript_input = transcript_placeholder.text_area(label="Transcription (auto-filled)", value="", height=180, key="transcript_input")
         st.components.v1.html(widget_html, height=420)
@@ -1 +1,554 @@
-#Connecting WebSocket client to FastAPI server
\ No newline at end of file
+#Asyncio streaming client for the backend's /ws/transcribe endpoint, and a load generator CLI
+# frontend/websocket_client.py
+#
+# Streams 16 kHz mono PCM16 audio (WAV/raw files, anything ffmpeg reads, or a pipe) as
+# protocol 2 frames, at real-time pace or faster, and yields the server's messages through
+# an async iterator. Dropped connections are resumed with the same session_id: the server
+# says how much audio it has and the frames after that are sent again.
+#
+#   session = TranscriptionSession("ws://localhost:8000/ws/transcribe", session_id="call-1")
+#   task = asyncio.create_task(session.run(iter_pcm(await load_audio("call.wav"))))
+#   async for event in session:
+#       print(event["type"], session.transcript.text)
+#   text = await task
+#
+# As a CLI it doubles as the load generator for capacity tests:
+#   python websocket_client.py --sessions 200 --ramp 0.05 --speed 1 call.wav other.mp3
+#   arecord -f S16_LE -r 16000 -c 1 -t raw | python websocket_client.py --speed 0 -
+import argparse
+import asyncio
+import bisect
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+import wave
+from collections import deque
+from typing import Any, AsyncIterable, AsyncIterator, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import websockets
+from websockets.exceptions import ConnectionClosed, InvalidStatus
+
+log = logging.getLogger("stt.client")
+
+SAMPLE_RATE = 16000
+FRAME_HEADER_BYTES = 8  # little-endian uint32 sequence number, uint32 stream position in samples
+DEFAULT_URL = os.getenv("BACKEND_WS_URL", "ws://localhost:8000/ws/transcribe")
+
+# server close codes after which reconnecting cannot help
+CLOSE_TAKEN_OVER = 4004
+# the server is at capacity; the close reason carries "retry-after=<seconds>"
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class SessionRejected(Exception):
+    """The server refused the session (unknown model, bad parameters) or another connection took it over."""
+
+
+class _ConnectionLost(Exception):
+    pass
+
+
+# --- audio sources: async iterables of 16 kHz mono PCM16 bytes ---
+
+async def load_audio(path: str) -> bytes:
+    """
+    Whole file as 16 kHz mono PCM16. WAV files in that format and .raw/.pcm files are read
+    as is, anything else is converted with ffmpeg (which must be on PATH).
+    """
+    if path.endswith((".raw", ".pcm")):
+        with open(path, "rb") as f:
+            return f.read()
+    try:
+        with wave.open(path, "rb") as w:
+            if (w.getframerate(), w.getnchannels(), w.getsampwidth()) == (SAMPLE_RATE, 1, 2):
+                return w.readframes(w.getnframes())
+    except (wave.Error, EOFError):
+        pass
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-i", path, "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-",
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+    out, err = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode {path}: {err.decode(errors='replace').strip()}")
+    return out
+
+
+async def iter_pcm(data: bytes, chunk_bytes: int = 32000) -> AsyncIterator[bytes]:
+    """Audio already in memory; many sessions can share one buffer."""
+    view = memoryview(data)
+    for i in range(0, len(view), chunk_bytes):
+        yield bytes(view[i:i + chunk_bytes])
+
+
+async def read_pipe(path: str = "-", chunk_bytes: int = 3200) -> AsyncIterator[bytes]:
+    """Raw PCM16 from stdin ("-"), a FIFO or a growing file, until EOF."""
+    f = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read1 if hasattr(f, "read1") else f.read, chunk_bytes)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+
+class Transcript:
+    """
+    Client-side copy of a protocol 2 transcript: committed text per utterance (segment_id)
+    plus the current uncommitted tail. A two-pass final replaces its utterance's text.
+    """
+
+    def __init__(self):
+        self.segments: Dict[int, str] = {}
+        self.tail = ""
+        self.seq = 0
+
+    def apply(self, msg: Dict[str, Any]):
+        kind = msg.get("type")
+        if kind == "resumed":
+            # the whole committed text comes back in one piece
+            self.segments = {0: msg.get("text", "")}
+            self.tail = msg.get("tail", "")
+            self.seq = msg.get("seq", 0)
+            return
+        if kind not in ("partial", "final"):
+            return
+        self.seq = msg.get("seq", self.seq)
+        segment_id = msg.get("segment_id", 0)
+        if kind == "final" and msg.get("pass") == 2:
+            self.segments[segment_id] = " " + msg.get("text", "")
+            return
+        self.segments[segment_id] = self.segments.get(segment_id, "") + msg.get("commit", "")
+        self.tail = msg.get("tail", "") if kind == "partial" else ""
+
+    @property
+    def committed(self) -> str:
+        return "".join(self.segments[k] for k in sorted(self.segments)).strip()
+
+    @property
+    def text(self) -> str:
+        return (self.committed + " " + self.tail).strip()
+
+
+class TranscriptionSession:
+    """
+    One streaming session against /ws/transcribe (protocol 2, pcm16 frames).
+
+    run(source) sends `source` in `frame_ms` frames, paced at `speed` times real time
+    (0 sends as fast as the connection takes them), then flushes, ends the session and
+    returns the final transcript. Server messages are yielded by iterating the session
+    (each one with "session_id" added, and "latency" for partials and the flush final:
+    seconds from sending the audio or the flush until the answer arrived). Only the last
+    `max_events` are kept if nobody iterates.
+
+    A dropped connection is retried up to `max_retries` times in a row with exponential
+    backoff; the server resumes the session and the last `replay_seconds` of sent audio
+    are available to fill in what it missed. SessionRejected is raised when retrying
+    cannot help.
+
+    While the server keeps the session queued for admission no audio is sent (the source
+    is read on once it is admitted). A session turned away at capacity (close code 1013)
+    retries after the server's retry-after hint instead of the backoff, and starts over on
+    the next connection, since the server kept nothing of it.
+    """
+
+    def __init__(self, url: str = DEFAULT_URL, session_id: Optional[str] = None, model: Optional[str] = None,
+                 frame_ms: float = 100.0, speed: float = 1.0, max_retries: int = 5, backoff: float = 0.5,
+                 resume_wait: float = 2.0, replay_seconds: float = 30.0, flush_timeout: float = 60.0,
+                 connect_timeout: float = 10.0, max_events: int = 10000):
+        self.url = url
+        self.session_id = session_id or f"client-{uuid.uuid4().hex[:12]}"
+        self.model = model
+        self.frame_bytes = max(2, int(SAMPLE_RATE * frame_ms / 1000) * 2)
+        self.speed = float(speed)
+        self.max_retries = int(max_retries)
+        self.backoff = float(backoff)
+        self.resume_wait = float(resume_wait)
+        self.flush_timeout = float(flush_timeout)
+        self.connect_timeout = float(connect_timeout)
+        self.transcript = Transcript()
+        self.partial_latencies: List[float] = []
+        self.final_latency: Optional[float] = None
+        self.stats = {"connects": 0, "reconnects": 0, "resumed": 0, "frames": 0, "bytes": 0, "resent_frames": 0,
+                      "messages": 0, "errors": 0, "events_dropped": 0, "queued": 0, "rejected": 0, "lagging": 0}
+        self._events: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_events))
+        self._replay: Deque[Tuple[int, bytes]] = deque(maxlen=max(1, int(replay_seconds * SAMPLE_RATE * 2 / self.frame_bytes)))
+        # stream position at the end of every sent frame, and when it was sent (for latencies)
+        self._sent_ends: List[int] = []
+        self._sent_times: List[float] = []
+        self._seq = 0
+        self._position = 0
+        self._flushed = asyncio.Event()
+        self._flush_sent_at: Optional[float] = None
+        self._flush_done = False
+        self._admitted = asyncio.Event()
+        # whether the server has (or had) state for this session that a reconnect can resume
+        self._started = False
+
+    def _url(self) -> str:
+        params = {"session_id": self.session_id, "protocol": 2, "codec": "pcm16"}
+        if self.model:
+            params["model"] = self.model
+        return f"{self.url}?{urlencode(params)}"
+
+    @property
+    def audio_seconds(self) -> float:
+        return self._position / SAMPLE_RATE
+
+    async def __aiter__(self) -> AsyncIterator[Dict[str, Any]]:
+        while True:
+            event = await self._events.get()
+            if event is None:
+                return
+            yield event
+
+    async def run(self, source: AsyncIterable[bytes]) -> str:
+        try:
+            await self._stream(self._frames(source))
+        finally:
+            self._emit(None)
+        return self.transcript.text
+
+    async def _frames(self, source: AsyncIterable[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+        """(stream position, payload) per frame, paced against the wall clock."""
+        loop = asyncio.get_running_loop()
+        pending = bytearray()
+        started = None
+        position = 0
+        async for chunk in source:
+            pending += chunk
+            while len(pending) >= self.frame_bytes:
+                payload = bytes(pending[:self.frame_bytes])
+                del pending[:self.frame_bytes]
+                if started is None:
+                    started = loop.time()
+                if self.speed > 0:
+                    delay = started + position / SAMPLE_RATE / self.speed - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                yield position, payload
+                position += len(payload) // 2
+        if len(pending) >= 2:
+            yield position, bytes(pending[:len(pending) // 2 * 2])
+
+    async def _stream(self, frames: AsyncIterator[Tuple[int, bytes]]):
+        failures = 0
+        while True:
+            retry_after = None
+            self._admitted.set()
+            try:
+                async with websockets.connect(self._url(), open_timeout=self.connect_timeout, close_timeout=2,
+                                              max_size=None) as ws:
+                    self.stats["connects"] += 1
+                    if self.stats["connects"] > 1:
+                        self.stats["reconnects"] += 1
+                    failures = 0
+                    self._seq = 0
+                    await self._resume(ws)
+                    receiver = asyncio.create_task(self._receive(ws))
+                    try:
+                        async for position, payload in frames:
+                            if receiver.done():
+                                self._check(receiver)
+                            if not self._admitted.is_set():
+                                # queued for admission: hold the audio until there is a slot
+                                await self._wait(self._admitted.wait(), receiver, None)
+                            self._replay.append((position, payload))
+                            await self._send_frame(ws, position, payload)
+                            self._sent_ends.append(self._position)
+                            self._sent_times.append(time.perf_counter())
+                        await self._finish(ws, receiver)
+                        return
+                    finally:
+                        receiver.cancel()
+                        if receiver.done() and not receiver.cancelled():
+                            receiver.exception()  # how the connection ended is handled above
+            except InvalidStatus as e:
+                # the server closes sessions it refuses before accepting them
+                if 400 <= e.response.status_code < 500:
+                    raise SessionRejected(f"session {self.session_id} rejected: HTTP {e.response.status_code}") from e
+                error = e
+            except ConnectionClosed as e:
+                if e.rcvd is not None and e.rcvd.code == CLOSE_TAKEN_OVER:
+                    raise SessionRejected(f"session {self.session_id} was taken over by another connection") from e
+                if e.rcvd is not None and e.rcvd.code == CLOSE_TRY_AGAIN_LATER:
+                    self.stats["rejected"] += 1
+                    retry_after = _retry_after(e.rcvd.reason)
+                else:
+                    self._started = True
+                error = e
+            except (_ConnectionLost, OSError, asyncio.TimeoutError) as e:
+                error = e
+            failures += 1
+            if failures > self.max_retries:
+                raise ConnectionError(f"session {self.session_id}: giving up after {failures} failed attempts: {error}")
+            delay = min(self.backoff * 2 ** (failures - 1), 10.0) * random.uniform(0.8, 1.2)
+            if retry_after is not None:
+                # spread the retries of sessions turned away together
+                delay = max(delay, retry_after * random.uniform(1.0, 1.25))
+            log.info("Session %s disconnected (%s), reconnecting in %.2fs", self.session_id, error, delay)
+            await asyncio.sleep(delay)
+
+    async def _send_frame(self, ws, position: int, payload: bytes):
+        await ws.send(self._seq.to_bytes(4, "little") + position.to_bytes(4, "little") + payload)
+        self._seq += 1
+        self._position = max(self._position, position + len(payload) // 2)
+        self.stats["frames"] += 1
+        self.stats["bytes"] += FRAME_HEADER_BYTES + len(payload)
+
+    async def _resume(self, ws):
+        """After a reconnect: learn how much audio the server kept and send it what is missing."""
+        if not self._started:
+            # as far as we know the server never had this session (first connection, or turned
+            # away at capacity): start it with whatever audio was already sent; if it did have
+            # it after all, it resumes and drops the audio it already got
+            for position, payload in list(self._replay):
+                await self._send_frame(ws, position, payload)
+                self.stats["resent_frames"] += 1
+            return
+        # the server admits a session before it resumes it: a queued session hears "queued",
+        # then "admitted" once there is a slot, and only then "resumed"
+        first = None
+        wait = self.resume_wait
+        while True:
+            try:
+                msg = json.loads(await asyncio.wait_for(ws.recv(), wait))
+            except asyncio.TimeoutError:
+                break
+            if msg.get("type") not in ("queued", "admitted"):
+                first = msg
+                break
+            self._handle(msg)
+            wait = self.resume_wait + (float(msg.get("max_wait") or 0) if msg["type"] == "queued" else 0)
+        if first is None or first.get("type") != "resumed":
+            log.warning("Session %s was not resumed by the server, its transcript starts over", self.session_id)
+            if first is not None:
+                self._handle(first)
+            return
+        self.stats["resumed"] += 1
+        self._handle(first)
+        resume_at = first.get("position", 0)
+        if self._replay and resume_at < self._replay[0][0]:
+            log.warning("Session %s: %.2fs of audio are no longer available to resend",
+                        self.session_id, (self._replay[0][0] - resume_at) / SAMPLE_RATE)
+        for position, payload in list(self._replay):
+            if position + len(payload) // 2 > resume_at:
+                await self._send_frame(ws, position, payload)
+                self.stats["resent_frames"] += 1
+
+    async def _finish(self, ws, receiver: asyncio.Task):
+        if not self._flush_done:
+            self._flushed.clear()
+            self._flush_sent_at = time.perf_counter()
+            await ws.send(json.dumps({"command": "flush"}))
+            if not await self._wait(self._flushed.wait(), receiver, self.flush_timeout):
+                log.warning("Session %s: no final after %.0fs, ending anyway", self.session_id, self.flush_timeout)
+            self._flush_done = True
+        await ws.send(json.dumps({"command": "end"}))
+        # the server answers with an info message and closes the connection
+        await asyncio.wait({receiver}, timeout=self.connect_timeout)
+
+    async def _wait(self, awaitable, receiver: asyncio.Task, timeout: float) -> bool:
+        """Wait for `awaitable`; raise _ConnectionLost if the connection goes away first. False on timeout."""
+        waiter = asyncio.ensure_future(awaitable)
+        done, _ = await asyncio.wait({waiter, receiver}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if waiter in done:
+            return True
+        waiter.cancel()
+        if receiver in done:
+            self._check(receiver)
+        return False
+
+    def _check(self, receiver: asyncio.Task):
+        """The receiver ended while we still need the connection: surface why."""
+        receiver.result()
+        raise _ConnectionLost("server closed the connection")
+
+    async def _receive(self, ws):
+        async for raw in ws:
+            if isinstance(raw, bytes):
+                continue
+            self._handle(json.loads(raw))
+
+    def _handle(self, msg: Dict[str, Any]):
+        self.stats["messages"] += 1
+        kind = msg.get("type")
+        now = time.perf_counter()
+        if kind == "partial" and "end" in msg:
+            i = bisect.bisect_left(self._sent_ends, int(msg["end"] * SAMPLE_RATE))
+            if i < len(self._sent_times):
+                msg["latency"] = round(now - self._sent_times[i], 4)
+                self.partial_latencies.append(msg["latency"])
+                # positions before this one will not be asked about again
+                del self._sent_ends[:i], self._sent_times[:i]
+        elif kind == "final" and msg.get("reason") == "flush" and self._flush_sent_at is not None:
+            self.final_latency = msg["latency"] = round(now - self._flush_sent_at, 4)
+            self._flushed.set()
+        elif kind == "queued":
+            self.stats["queued"] += 1
+            self._admitted.clear()
+            log.info("Session %s queued for admission at position %s", self.session_id, msg.get("position"))
+        elif kind == "admitted":
+            self._admitted.set()
+        elif kind == "status" and msg.get("status") == "lagging":
+            self.stats["lagging"] += 1
+        elif kind == "error":
+            self.stats["errors"] += 1
+            log.info("Session %s: server error: %s", self.session_id, msg.get("error"))
+            if str(msg.get("error", "")).startswith("flush error"):
+                # no final is coming for this flush
+                self._flushed.set()
+        if kind not in ("queued", "admitted", "error"):
+            self._started = True
+        self.transcript.apply(msg)
+        self._emit(dict(msg, session_id=self.session_id))
+
+    def _emit(self, event: Optional[Dict[str, Any]]):
+        if self._events.full():
+            self._events.get_nowait()
+            self.stats["events_dropped"] += 1
+        self._events.put_nowait(event)
+
+
+async def transcribe(source: AsyncIterable[bytes], url: str = DEFAULT_URL, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+    """Stream `source` in one session and yield the server's messages until the session ends."""
+    session = TranscriptionSession(url, **kwargs)
+    task = asyncio.create_task(session.run(source))
+    try:
+        async for event in session:
+            yield event
+        await task
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _retry_after(reason: str) -> Optional[float]:
+    """Seconds from a close reason like "retry-after=5"."""
+    for part in (reason or "").replace(";", " ").split():
+        key, _, value = part.partition("=")
+        if key.lower() == "retry-after":
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+
+# --- load generator ---
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 4)
+
+
+async def run_load(url: str, audios: List[bytes], sessions: int = 1, ramp: float = 0.0, prefix: Optional[str] = None,
+                   print_events: bool = False, print_transcripts: bool = True, **session_kwargs) -> Dict[str, Any]:
+    """
+    Run `sessions` concurrent sessions in this process, session i streaming audios[i % len(audios)]
+    and starting `ramp` seconds after the previous one. Returns a summary of the run.
+    """
+    prefix = prefix or f"load-{uuid.uuid4().hex[:6]}"
+    results: List[TranscriptionSession] = []
+    failures: Dict[str, int] = {}
+    started = time.perf_counter()
+
+    async def drive(i: int):
+        await asyncio.sleep(i * ramp)
+        session = TranscriptionSession(url, session_id=f"{prefix}-{i}", **session_kwargs)
+        results.append(session)
+        task = asyncio.create_task(session.run(iter_pcm(audios[i % len(audios)])))
+        async for event in session:
+            if print_events:
+                print(json.dumps(event), flush=True)
+        try:
+            text = await task
+        except Exception as e:
+            failures[type(e).__name__] = failures.get(type(e).__name__, 0) + 1
+            log.warning("Session %s failed: %s", session.session_id, e)
+            return
+        if print_transcripts:
+            print(f"{session.session_id}: {text}", flush=True)
+
+    await asyncio.gather(*(drive(i) for i in range(sessions)))
+    wall = time.perf_counter() - started
+    partial = [x for s in results for x in s.partial_latencies]
+    final = [s.final_latency for s in results if s.final_latency is not None]
+    audio = sum(s.audio_seconds for s in results)
+    totals = {key: sum(s.stats[key] for s in results) for key in ("reconnects", "resumed", "resent_frames", "errors",
+                                                                  "queued", "rejected", "lagging", "frames", "bytes")}
+    return {
+        "sessions": sessions, "failed": sum(failures.values()), "failures": failures,
+        "wall_seconds": round(wall, 3), "audio_seconds": round(audio, 3),
+        "realtime_streams": round(audio / wall, 2) if wall else 0.0,
+        "partials": len(partial),
+        "partial_latency": {"p50": _percentile(partial, 0.5), "p95": _percentile(partial, 0.95),
+                            "p99": _percentile(partial, 0.99), "max": _percentile(partial, 1.0)},
+        "final_latency": {"p50": _percentile(final, 0.5), "p95": _percentile(final, 0.95), "max": _percentile(final, 1.0)},
+        **totals,
+    }
+
+
+async def _main(args) -> int:
+    if args.inputs == ["-"] or args.pipe:
+        session = TranscriptionSession(args.url, session_id=args.session_id, model=args.model,
+                                       frame_ms=args.frame_ms, speed=args.speed, max_retries=args.max_retries)
+        task = asyncio.create_task(session.run(read_pipe(args.inputs[0])))
+        async for event in session:
+            if args.events:
+                print(json.dumps(event), flush=True)
+            elif event["type"] in ("partial", "final", "resumed"):
+                print(f"\r{session.transcript.text[-160:]}", end="", file=sys.stderr, flush=True)
+        print(file=sys.stderr)
+        print(await task)
+        return 0
+    audios = [await load_audio(path) for path in args.inputs]
+    summary = await run_load(
+        args.url, audios, sessions=args.sessions, ramp=args.ramp, prefix=args.session_id, print_events=args.events,
+        print_transcripts=not args.quiet, model=args.model, frame_ms=args.frame_ms, speed=args.speed,
+        max_retries=args.max_retries, max_events=1000,
+    )
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        for key, value in summary.items():
+            print(f"{key:>18}: {value}", file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream audio to /ws/transcribe; many sessions at once for load tests.")
+    parser.add_argument("inputs", nargs="+", help="audio files (WAV, .raw/.pcm PCM16, or anything ffmpeg reads); "
+                                                  "'-' streams raw 16 kHz mono PCM16 from stdin")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--model", default=None, help="model tier (server default if omitted)")
+    parser.add_argument("--sessions", type=int, default=1, help="concurrent sessions, spread over the inputs")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds between session starts")
+    parser.add_argument("--speed", type=float, default=1.0, help="times real time; 0 sends as fast as possible")
+    parser.add_argument("--frame-ms", type=float, default=100.0)
+    parser.add_argument("--max-retries", type=int, default=5, help="reconnect attempts in a row before a session fails")
+    parser.add_argument("--session-id", default=None, help="session id (prefix of the ids with --sessions)")
+    parser.add_argument("--pipe", action="store_true", help="treat the single input as a raw PCM16 pipe/FIFO")
+    parser.add_argument("--events", action="store_true", help="print every server message as a JSON line")
+    parser.add_argument("--quiet", action="store_true", help="do not print the transcripts")
+    parser.add_argument("--json", action="store_true", help="print the run summary as JSON")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        sys.exit(asyncio.run(_main(args)))
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()